@@ -1,11 +1,18 @@
 from __future__ import annotations
 from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Depends
+from starlette.concurrency import run_in_threadpool
 from typing import List, Dict
 from app.services.doc_ingestion import save_upload, ingest_file
 from app.services.metadata_store import add_document, list_documents as meta_list, delete_document as meta_delete, set_document_approved
 from app.api.deps import require_admin
 from app.services.vector_store import QdrantStore
-from app.services.embedding import get_embedder
+from app.services.lexical_index import get_lexical_index
+from app.services.embedding import embedding_dimension, embedding_cache_stats, embedding_batcher_stats, embed_server_client
+from app.services.embed_workers import ingest_pool_stats
+from app.services.llm_client import llm_pool_stats
+from app.services.llm_cache import llm_cache
+from app.services.single_flight import single_flight_stats
+from app.services.answer_cache import answer_cache
 
 router = APIRouter(prefix="/admin", tags=["admin"]) 
 
@@ -21,7 +28,8 @@ async def upload_document(
     content = await file.read()
     saved = save_upload(content, file.filename)
     try:
-        info = ingest_file(saved, title=title)
+        # Parsing and embedding are blocking; keep them off the event loop
+        info = await run_in_threadpool(ingest_file, saved, title=title)
         info["approved"] = False
         add_document(info)
         return {"ok": True, "document": info}
@@ -30,15 +38,11 @@ async def upload_document(
         msg = str(e)
         try:
             if any(x in msg.lower() for x in ["dimension", "vector", "mismatch", "expected"]):
-                dim = get_embedder().get_sentence_embedding_dimension()
+                dim = embedding_dimension()
                 store = QdrantStore()  # default corpus collection
-                # Import models lazily to avoid import resolution issues during linting
-                from qdrant_client.http import models as qmodels
-                store.client.recreate_collection(
-                    collection_name=store.collection,
-                    vectors_config=qmodels.VectorParams(size=dim, distance=qmodels.Distance.COSINE),
-                )
-                info = ingest_file(saved, title=title)  # retry
+                store.recreate_collection(dim)
+                get_lexical_index(store.collection).clear()
+                info = await run_in_threadpool(ingest_file, saved, title=title)  # retry
                 info["approved"] = False
                 add_document(info)
                 return {"ok": True, "document": info, "recovered": True}
@@ -53,24 +57,34 @@ async def list_documents(_: Dict = Depends(require_admin)):
     return {"items": meta_list()}
 
 
-@router.patch("/documents/{doc_id}/approve")
-async def approve_document(doc_id: str, _: Dict = Depends(require_admin)):
-    ok = set_document_approved(doc_id, True)
-    if not ok:
+# The approval and delete endpoints are plain defs: their Qdrant updates (set_payload /
+# delete with wait=True over every point of a document) block, so FastAPI runs them in
+# its threadpool instead of on the event loop
+def _set_approval(doc_id: str, approved: bool) -> Dict:
+    if not any(d.get("doc_id") == doc_id for d in meta_list()):
         raise HTTPException(status_code=404, detail="Document not found")
-    return {"ok": True, "doc_id": doc_id, "approved": True}
+    # Flip the payload flag on the points first so retrieval filters see the change
+    # before caches keyed on the metadata file are invalidated
+    try:
+        QdrantStore().set_doc_approved(doc_id, approved)
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"Failed to update vector store: {e}")
+    set_document_approved(doc_id, approved)
+    return {"ok": True, "doc_id": doc_id, "approved": approved}
+
+
+@router.patch("/documents/{doc_id}/approve")
+def approve_document(doc_id: str, _: Dict = Depends(require_admin)):
+    return _set_approval(doc_id, True)
 
 
 @router.patch("/documents/{doc_id}/unapprove")
-async def unapprove_document(doc_id: str, _: Dict = Depends(require_admin)):
-    ok = set_document_approved(doc_id, False)
-    if not ok:
-        raise HTTPException(status_code=404, detail="Document not found")
-    return {"ok": True, "doc_id": doc_id, "approved": False}
+def unapprove_document(doc_id: str, _: Dict = Depends(require_admin)):
+    return _set_approval(doc_id, False)
 
 
 @router.delete("/documents/{doc_id}")
-async def delete_document(doc_id: str, _: Dict = Depends(require_admin)):
+def delete_document(doc_id: str, _: Dict = Depends(require_admin)):
     # Delete embeddings from Qdrant and remove metadata
     store = QdrantStore()
     try:
@@ -80,5 +94,33 @@ async def delete_document(doc_id: str, _: Dict = Depends(require_admin)):
         vec_err = str(e)
     else:
         vec_err = None
+    lexical = get_lexical_index(store.collection)
+    if lexical.remove_doc(doc_id):
+        lexical.save()
     deleted = meta_delete(doc_id)
     return {"ok": deleted, "deleted": doc_id, "vectors_error": vec_err}
+
+
+@router.get("/metrics")
+async def metrics(_: Dict = Depends(require_admin)):
+    """In-process cache and queue counters for this worker."""
+    return {
+        "embedding_cache": embedding_cache_stats(),
+        "embedding_batcher": embedding_batcher_stats(),
+        "embedding_workers": ingest_pool_stats(),
+        "embedding_server": embed_server_client.stats(),
+        "answer_cache": answer_cache.stats(),
+        "llm": llm_pool_stats(),
+        "llm_cache": llm_cache.stats(),
+        "single_flight": single_flight_stats(),
+    }
+
+
+@router.delete("/cache/answers")
+async def purge_answer_cache(_: Dict = Depends(require_admin)):
+    return {"ok": True, "purged": answer_cache.clear()}
+
+
+@router.delete("/cache/llm")
+async def purge_llm_cache(_: Dict = Depends(require_admin)):
+    return {"ok": True, "purged": llm_cache.clear()}
@@ -1,35 +1,53 @@
-from fastapi import APIRouter, Body, Query
+from fastapi import APIRouter, Body, HTTPException, Query
 from sse_starlette.sse import EventSourceResponse
 import json
-from app.services.rag_engine import answer, retrieve_context
+from app.services.rag_engine import _UNAVAILABLE_MESSAGE, answer, retrieve_context
+from app.services.rag_async import answer_async
 from app.core.config import settings
-from app.services.llm_client import LLMClient
+from app.services.llm_client import LLMOverloadedError, get_llm_client, llm_saturated
 
 router = APIRouter(prefix="/chat", tags=["chat"])
 
 
+def _overloaded() -> HTTPException:
+    return HTTPException(
+        status_code=503,
+        detail="The assistant is handling too many requests. Please retry shortly.",
+        headers={"Retry-After": "5"},
+    )
+
+
 @router.get("/stream")
 def stream_chat(query: str = Query(..., min_length=1)):
-    """Temporarily disable streaming and previews. Frontend will fall back to one-shot /chat/ask."""
+    """Stream the answer as SSE 'token' events (formatted text deltas), then 'end'."""
+    # Reject before the event stream starts; afterwards only an in-band message is possible
+    if llm_saturated("interactive"):
+        raise _overloaded()
 
     def event_gen():
-        # Immediately end the stream; no tokens or previews are emitted
+        sent = False
+        try:
+            for piece in answer(query, stream=True):
+                if piece:
+                    sent = True
+                    yield {"event": "token", "data": piece}
+        except Exception:
+            if not sent:
+                yield {"event": "token", "data": _UNAVAILABLE_MESSAGE}
         yield {"event": "end", "data": "[DONE]"}
 
     return EventSourceResponse(event_gen())
 
 
 @router.post("/ask")
-def ask_chat(query: str = Body(..., embed=True)):
+async def ask_chat(query: str = Body(..., embed=True)):
     try:
-        text = answer(query, stream=False)
-    except Exception as e:
+        text = await answer_async(query)
+    except LLMOverloadedError:
+        raise _overloaded()
+    except Exception:
         # Ensure the endpoint never crashes the client; return a safe message
-        text = (
-            "Sorry, I can't complete this right now. Please refer to official Government of India legal resources:\n"
-            "- India Code: https://www.indiacode.nic.in/ (official repository of Central Acts)\n"
-            "- Legislative Department: https://legislative.gov.in (includes the Constitution of India)"
-        )
+        text = _UNAVAILABLE_MESSAGE
     return {"answer": text}
 
 
@@ -41,15 +59,13 @@ def debug_retrieve(query: str = Query(..., min_length=1), top_k: int = Query(6,
 
 
 @router.get("/ask")
-def ask_chat_get(query: str = Query(..., min_length=1)):
+async def ask_chat_get(query: str = Query(..., min_length=1)):
     try:
-        text = answer(query, stream=False)
+        text = await answer_async(query)
+    except LLMOverloadedError:
+        raise _overloaded()
     except Exception:
-        text = (
-            "Sorry, I can't complete this right now. Please refer to official Government of India legal resources:\n"
-            "- India Code: https://www.indiacode.nic.in/ (official repository of Central Acts)\n"
-            "- Legislative Department: https://legislative.gov.in (includes the Constitution of India)"
-        )
+        text = _UNAVAILABLE_MESSAGE
     return {"answer": text}
 
 
@@ -63,7 +79,7 @@ def debug_llm():
         "has_google_key": bool(settings.google_api_key),
     }
     try:
-        client = LLMClient()
+        client = get_llm_client()
         info["resolved_provider"] = getattr(client, "provider", None)
         info["resolved_model"] = getattr(client, "model", None)
     except Exception as e:
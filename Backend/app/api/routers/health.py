@@ -1,27 +1,13 @@
 from __future__ import annotations
 from fastapi import APIRouter
-from app.services.llm_client import LLMClient
-from app.services.vector_store import QdrantStore
-from app.services.embedding import get_embedder
+from fastapi.responses import JSONResponse
+from app.services.readiness import readiness_snapshot
 
 router = APIRouter(prefix="/health", tags=["health"])
 
 
 @router.get("/ready")
 def ready():
-    # Check LLM init
-    ok_llm = True
-    try:
-        _ = LLMClient()
-    except Exception:
-        ok_llm = False
-
-    # Check Qdrant
-    ok_qdrant = True
-    try:
-        dim = get_embedder().get_sentence_embedding_dimension()
-        QdrantStore().ensure_collection(dim)
-    except Exception:
-        ok_qdrant = False
-
-    return {"llm": ok_llm, "qdrant": ok_qdrant, "ready": ok_llm and ok_qdrant}
+    # Served from the background prober's snapshot (app.services.readiness); no I/O per probe
+    snap = readiness_snapshot()
+    return JSONResponse(snap, status_code=200 if snap["ready"] else 503)
@@ -4,9 +4,10 @@ from fastapi import Body
 import uuid
 from typing import Dict
 from app.services.doc_ingestion import save_upload, ingest_file
-from app.services.embedding import embed_query, get_embedder
+from app.services.embedding import embed_query, embedding_dimension
 from app.services.vector_store import QdrantStore
-from app.services.llm_client import LLMClient
+from app.services.lexical_index import drop_lexical_index
+from app.services.llm_client import get_llm_client
 from sse_starlette.sse import EventSourceResponse
 from app.services.lens_status import set_status, get_status, start_progress, set_progress, complete
 
@@ -45,10 +46,10 @@ async def lens_upload(file: UploadFile = File(...), title: str | None = Form(Non
 
 @router.post("/{lens_id}/ask")
 async def lens_ask(lens_id: str, query: str = Body(..., embed=True), top_k: int = 6):
-    dim = get_embedder().get_sentence_embedding_dimension()
+    dim = embedding_dimension()
     store = QdrantStore(collection=f"lens_{lens_id}")
     store.ensure_collection(dim)
-    qvec = embed_query(query)
+    qvec = embed_query(query, as_numpy=True)
     results = store.search(qvec, top_k=top_k)
     # Simple return for now; streaming answer can reuse chat path later
     return {"matches": results}
@@ -56,10 +57,10 @@ async def lens_ask(lens_id: str, query: str = Body(..., embed=True), top_k: int
 
 @router.get("/{lens_id}/stream")
 def lens_stream(lens_id: str, query: str):
-    dim = get_embedder().get_sentence_embedding_dimension()
+    dim = embedding_dimension()
     store = QdrantStore(collection=f"lens_{lens_id}")
     store.ensure_collection(dim)
-    qvec = embed_query(query)
+    qvec = embed_query(query, as_numpy=True)
     contexts = store.search(qvec, top_k=6)
 
     header = (
@@ -73,7 +74,7 @@ def lens_stream(lens_id: str, query: str):
     ]
 
     def generator():
-        llm = LLMClient()
+        llm = get_llm_client()
         for token in llm.stream_generate(messages):
             yield {"event": "token", "data": token}
         yield {"event": "end", "data": "[DONE]"}
@@ -96,7 +97,8 @@ async def lens_critique(lens_id: str, instructions: str | None = Body(None, embe
 async def lens_delete(lens_id: str):
     # Optional: drop collection
     try:
-        QdrantStore(collection=f"lens_{lens_id}").client.delete_collection(collection_name=f"lens_{lens_id}")
+        QdrantStore(collection=f"lens_{lens_id}").delete_collection()
     except Exception:
         pass
+    drop_lexical_index(f"lens_{lens_id}")
     return {"ok": True, "deleted": lens_id}
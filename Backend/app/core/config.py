@@ -1,6 +1,6 @@
 from pydantic_settings import BaseSettings
 from pydantic import Field
-from typing import List
+from typing import Dict, List
 
 class Settings(BaseSettings):
     # API
@@ -12,15 +12,92 @@ class Settings(BaseSettings):
     # Prefer v1 model id form for Gemini 2.0 Flash
     llm_model: str = Field("models/gemini-2.0-flash")
     llm_max_output_tokens: int = Field(6144, description="Maximum tokens to generate in responses")
+    llm_output_token_caps: Dict[str, int] = Field(
+        default_factory=lambda: {"default": 1024, "detailed": 2048, "fundamental_rights_all": 1536, "free": 768, "compress": 600},
+        description="Output token cap per answer intent (bounded by llm_max_output_tokens)",
+    )
+    llm_input_token_budget: int = Field(6000, description="Prompt tokens allowed for the answer call (instructions + context)")
+    llm_context_chunk_max_tokens: int = Field(600, description="Max tokens of a single retrieved chunk inside a prompt")
     enable_markdown_rendering: bool = Field(False, description="Toggle Markdown rendering vs plain text sanitization")
     openai_api_key: str | None = None
     google_api_key: str | None = None
+    llm_providers: List[str] = Field(default_factory=list, description="Failover order, e.g. [\"google\",\"openai\"] (empty = llm_provider, then the other configured one)")
+    openai_model: str = Field("gpt-4o-mini", description="OpenAI model used when llm_model names a Gemini model (failover)")
+    llm_breaker_failures: int = Field(5, description="Consecutive failures that open a provider's circuit")
+    llm_breaker_p95_ms: int = Field(0, description="Open a provider's circuit when its p95 latency exceeds this (0 disables)")
+    llm_breaker_cooldown_seconds: float = Field(30.0, description="Seconds an open circuit waits before a trial call")
+    llm_hedge_after_ms: int = Field(0, description="Also send a call to the next provider if the first has no answer/token by then (0 disables)")
+    llm_mock_latency_ms: int = Field(0, description="Artificial latency of the mock provider")
+    llm_mock_failure_rate: float = Field(0.0, description="Fraction of mock provider calls that fail")
+    llm_max_concurrency: int = Field(8, description="Concurrent calls per LLM provider")
+    llm_tokens_per_minute: Dict[str, int] = Field(default_factory=dict, description="Provider -> tokens/minute budget (absent = unlimited)")
+    llm_queue_max: int = Field(64, description="Calls allowed to wait for a provider slot before 503s")
+    llm_queue_timeout_ms: int = Field(15000, description="Max wait for a provider slot")
+    llm_interactive_reserved_slots: int = Field(2, description="Slots per provider that background calls never take")
+    llm_cache_backend: str = Field("sqlite", description="sqlite|redis|off: content-addressed cache of LLM completions")
+    llm_cache_path: str = Field(".data/llm_cache.sqlite3", description="SQLite file of the LLM cache")
+    llm_cache_size: int = Field(10000, description="Max cached completions (sqlite backend)")
+    llm_cache_ttl_seconds: int = Field(7 * 24 * 3600, description="LLM cache TTL (0 = no expiry)")
 
     # Stores
     qdrant_url: str = "http://localhost:6333"
     redis_url: str = "redis://localhost:6379/0"
     storage_dir: str = ".data/uploads"
     qdrant_corpus_collection: str = "corpus"
+    qdrant_prefer_grpc: bool = Field(False, description="Use Qdrant's gRPC transport (binary vectors, no JSON)")
+    qdrant_grpc_port: int = Field(6334, description="Qdrant gRPC port")
+
+    # Embeddings
+    embed_model: str = Field("BAAI/bge-m3", description="SentenceTransformer model id")
+    embed_device: str = Field("cpu", description="Device used to load the embedder")
+    embed_backend: str = Field("torch", description="torch|onnx (ONNX Runtime on CPU; falls back to torch on failure)")
+    embed_onnx_quantize: str = Field("", description="Dynamic int8 quantization for ONNX: ''|avx2|avx512|avx512_vnni|arm64")
+    embed_onnx_cache_dir: str = Field(".data/onnx", description="Where exported ONNX models are kept")
+    embed_onnx_min_parity: float = Field(0.99, description="Min cosine between ONNX and PyTorch embeddings to accept an export")
+    embed_cache_size: int = Field(4096, description="Max query embeddings kept in process (0 disables)")
+    embed_cache_ttl_seconds: int = Field(24 * 3600, description="Query embedding cache TTL")
+    embed_cache_backend: str = Field("memory", description="memory|redis (redis adds a shared second tier)")
+    embed_executor_workers: int = Field(2, description="Threads running embeddings for the async pipeline")
+    embed_batch_max_wait_ms: int = Field(5, description="Max time a query embedding waits for others to share its encode (0 disables batching)")
+    embed_batch_max_size: int = Field(32, description="Max texts per micro-batched query encode")
+    embed_ingest_processes: int = Field(0, description="Worker processes embedding ingestion batches; each loads its own model copy (0 = embed in the API process)")
+    embed_ingest_queue_max: int = Field(4, description="Ingestion batches in flight across the worker processes")
+    embed_ingest_nice: int = Field(10, description="Niceness added to ingestion workers so query embedding keeps priority")
+    embed_server_socket: str = Field("", description="Unix socket of a shared embedding server (empty = load the model in process)")
+    embed_server_timeout_ms: int = Field(30000, description="Max wait for an embedding server response")
+    embed_server_retry_seconds: float = Field(10.0, description="With embed_server_fallback_local, use the in-process model this long after a failed call before retrying the server")
+    embed_server_fallback_local: bool = Field(False, description="Load the model in process while the embedding server is unreachable (default: embedding calls fail)")
+    embed_ingest_threads_per_process: int = Field(0, description="Torch threads per ingestion worker (0 = cores / (processes + 1))")
+    embed_sentence_cache_size: int = Field(8192, description="Max sentence embeddings cached for extractive compression")
+
+    # Retrieval / reranking
+    rerank_pool_size: int = Field(0, description="Min candidates per retrieval leg (0 = adaptive default of 5-10)")
+    rerank_weights: Dict[str, float] = Field(default_factory=dict, description="Overrides for reranker.DEFAULT_WEIGHTS")
+    rerank_cross_encoder_enabled: bool = Field(False, description="Rerank the head of the pool with a local cross-encoder")
+    rerank_cross_encoder_model: str = Field("cross-encoder/ms-marco-MiniLM-L-6-v2", description="sentence-transformers CrossEncoder id")
+    rerank_cross_encoder_max_candidates: int = Field(20, description="Max (query, chunk) pairs scored per request")
+    rerank_cross_encoder_budget_ms: int = Field(400, description="Wait this long for scores, then keep the heuristic order")
+    rerank_context_chunks: int = Field(4, description="Chunks passed on to compression/LLM when cross-encoder scores exist")
+
+    # Context compression before the answer call
+    answer_latency_budget_ms: int = Field(0, description="Target answer latency; when set, latency-saving defaults apply (0 = none)")
+    context_compressor: str = Field("auto", description="llm|extractive|auto (extractive when answer_latency_budget_ms is set)")
+    context_compress_budget_chars: int = Field(2400, description="Max characters of extracted context (~4 chars per token)")
+    context_compress_input_tokens: int = Field(3000, description="Tokens of excerpts sent to the LLM compressor")
+    context_compress_dedupe_similarity: float = Field(0.9, description="Drop sentences this similar to one already selected")
+
+    # Identical concurrent chat queries share one retrieval + LLM run (and token stream)
+    chat_single_flight: bool = Field(True, description="Coalesce identical in-flight chat queries")
+
+    # Answer cache (semantic lookup in front of rag_engine.answer)
+    answer_cache_enabled: bool = Field(True, description="Serve near-identical questions from cache")
+    answer_cache_size: int = Field(512, description="Max cached answers per worker")
+    answer_cache_ttl_seconds: int = Field(6 * 3600, description="Answer cache TTL")
+    answer_cache_similarity: float = Field(0.95, description="Min cosine similarity between query embeddings for a hit")
+
+    # Startup warmup / readiness
+    readiness_probe_interval_seconds: float = Field(5.0, description="How often the background prober refreshes /health/ready")
+    warmup_llm_call: bool = Field(False, description="Send one tiny background-priority LLM call at startup to resolve the model")
 
     # Auth
     jwt_secret: str = "change-me-dev-secret"
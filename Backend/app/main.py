@@ -11,6 +11,8 @@ from app.api.routers.client_config import router as client_cfg_router
 from datetime import date
 import threading
 from app.services.nyayshala_generator import read_for_day, generate_for_day
+from app.services.rag_engine import refresh_intent_coverage, sync_corpus_approval, ensure_lexical_index
+from app.services.readiness import start_readiness_prober
 
 app = FastAPI(title="Nyay RAG API")
 
@@ -37,6 +39,12 @@ def live():
     return {"ok": True}
 
 
+@app.on_event("startup")
+def warmup_dependencies():
+    """Load the embedder, LLM client and Qdrant collection before traffic, then keep /health/ready current."""
+    start_readiness_prober()
+
+
 @app.on_event("startup")
 def warmup_daily_nyayshala():
     """Warm the daily NyayShala cache in the background to keep first loads instant."""
@@ -50,3 +58,23 @@ def warmup_daily_nyayshala():
             # Silence warmup errors; normal requests can still generate on-demand
             pass
     threading.Thread(target=_worker, name="nyayshala-warmup", daemon=True).start()
+
+
+@app.on_event("startup")
+def warmup_intent_coverage():
+    """Sync approval flags and the BM25 index with Qdrant, then precompute intent coverage."""
+    def _worker():
+        try:
+            sync_corpus_approval()
+        except Exception:
+            pass
+        try:
+            ensure_lexical_index()
+        except Exception:
+            pass
+        try:
+            refresh_intent_coverage()
+        except Exception:
+            # Coverage is recomputed lazily on the first matching query
+            pass
+    threading.Thread(target=_worker, name="intent-coverage-warmup", daemon=True).start()
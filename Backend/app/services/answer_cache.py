@@ -0,0 +1,162 @@
+from __future__ import annotations
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, FrozenSet, List, Optional, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.metadata_store import subscribe, corpus_version
+
+SourceKey = Tuple[str, int]  # (doc_id, chunk_id)
+
+
+@dataclass
+class _Entry:
+    vector: np.ndarray
+    scope: str
+    answer: str
+    sources: FrozenSet[SourceKey]
+    created: float = field(default_factory=time.time)
+
+
+class AnswerCache:
+    """Semantic answer cache keyed by normalized query embeddings.
+
+    A lookup hits when an entry in the same scope has cosine similarity >= threshold
+    with the query vector (vectors are L2-normalized, so a dot product suffices).
+    The scope carries anything that must match exactly (e.g. Article/Section numbers),
+    so "Article 21" never serves an answer cached for "Article 22".
+
+    Entries remember the (doc_id, chunk_id) set that grounded them:
+    deleting/unapproving a document drops only the answers it contributed to, while
+    adding/approving one clears the cache because any answer may now be improved.
+    Changes made by other workers are detected through metadata_store.corpus_version().
+    """
+
+    def __init__(self, max_items: int, ttl_seconds: int, threshold: float):
+        self.max_items = max(0, int(max_items))
+        self.ttl = max(0, int(ttl_seconds))
+        self.threshold = float(threshold)
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._next_id = 0
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+        self._lock = threading.Lock()
+        self._version = corpus_version()
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+
+    # -- internal helpers (caller holds the lock) --
+    def _drop(self, ids: List[int]):
+        for i in ids:
+            self._entries.pop(i, None)
+        if ids:
+            self._matrix = None
+
+    def _check_version(self):
+        v = corpus_version()
+        if v != self._version:
+            # Corpus changed outside this process (or before we were notified)
+            self._entries.clear()
+            self._matrix = None
+            self._version = v
+            self.invalidations += 1
+
+    def _expire(self, now: float):
+        if not self.ttl:
+            return
+        self._drop([i for i, e in self._entries.items() if now - e.created > self.ttl])
+
+    def _ensure_matrix(self):
+        if self._matrix is None:
+            self._matrix_ids = list(self._entries.keys())
+            if self._matrix_ids:
+                self._matrix = np.vstack([self._entries[i].vector for i in self._matrix_ids])
+            else:
+                self._matrix = np.zeros((0, 0), dtype=np.float32)
+
+    # -- public API --
+    def lookup(self, vector, scope: str) -> Optional[str]:
+        vec = np.asarray(vector, dtype=np.float32)
+        with self._lock:
+            self._check_version()
+            self._expire(time.time())
+            self._ensure_matrix()
+            if not self._matrix_ids:
+                self.misses += 1
+                return None
+            sims = self._matrix @ vec
+            for idx in np.argsort(-sims):
+                if sims[idx] < self.threshold:
+                    break
+                entry = self._entries[self._matrix_ids[idx]]
+                if entry.scope == scope:
+                    self._entries.move_to_end(self._matrix_ids[idx])
+                    self.hits += 1
+                    return entry.answer
+            self.misses += 1
+            return None
+
+    def store(self, vector, scope: str, answer: str, sources):
+        if not self.max_items or not answer:
+            return
+        entry = _Entry(
+            vector=np.asarray(vector, dtype=np.float32),
+            scope=scope,
+            answer=answer,
+            sources=frozenset((str(d), int(c)) for d, c in (sources or [])),
+        )
+        with self._lock:
+            self._check_version()
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate_doc(self, doc_id: str) -> int:
+        with self._lock:
+            ids = [i for i, e in self._entries.items() if any(d == doc_id for d, _ in e.sources)]
+            self._drop(ids)
+            self.invalidations += 1
+            return len(ids)
+
+    def clear(self) -> int:
+        with self._lock:
+            n = len(self._entries)
+            self._entries.clear()
+            self._matrix = None
+            self.invalidations += 1
+            return n
+
+    def on_corpus_change(self, event: str, doc_id: str):
+        if event in ("delete", "unapprove"):
+            self.invalidate_doc(doc_id)
+        else:
+            self.clear()
+        with self._lock:
+            self._version = corpus_version()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_items": self.max_items,
+                "ttl_seconds": self.ttl,
+                "threshold": self.threshold,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "invalidations": self.invalidations,
+            }
+
+
+answer_cache = AnswerCache(
+    settings.answer_cache_size,
+    settings.answer_cache_ttl_seconds,
+    settings.answer_cache_similarity,
+)
+subscribe(answer_cache.on_corpus_change)
@@ -0,0 +1,139 @@
+"""Local extractive context compression.
+
+Alternative to the LLM compressor in rag_engine: picks the sentences of the top
+retrieved chunks that are closest to the query under the already-loaded embedder,
+drops near-duplicates and fits them into a character budget. Sentences keep the
+Article/Section they come from so the answer prompt can still cite provisions.
+"""
+from __future__ import annotations
+
+import re
+from typing import Dict, List, NamedTuple, Optional, Set
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.embedding import embed_query, embed_sentences
+
+# Sentence boundary: terminal punctuation followed by whitespace and an opening character
+_BOUNDARY_RE = re.compile(r"(?<=[.?!])\s+(?=[\"'“(\[A-Z0-9])")
+# Tokens that end with a period without ending the sentence (Art. 21, S. 302, v., i.e.)
+_ABBREVIATIONS = {
+    "art", "arts", "sec", "secs", "s", "ss", "cl", "cls", "sub", "para", "no", "nos",
+    "v", "vs", "viz", "i.e", "e.g", "etc", "ors", "anr", "ltd", "co", "r", "rr", "hon'ble",
+}
+_ANCHOR_RE = re.compile(r"\b(article|art\.|section|sec\.)\s*(\d+[a-z]?(?:\(\w+\))*)", re.IGNORECASE)
+_QUERY_REF_RE = re.compile(r"\b(?:article|art\.?|section|sec\.?)\s*(\d+[a-z]?)", re.IGNORECASE)
+
+MIN_SENTENCE_CHARS = 25
+MAX_SENTENCE_CHARS = 600
+ANCHOR_BONUS = 0.15  # sentence cites a provision the query asks about
+RANK_DECAY = 0.01  # slight preference for sentences of higher-ranked chunks
+
+
+class _Sentence(NamedTuple):
+    text: str
+    rank: int  # rank of the source chunk
+    position: int  # order within the chunk
+    anchor: Optional[str]  # provision the sentence belongs to, e.g. "Article 21"
+
+
+def split_sentences(text: str) -> List[str]:
+    """Split chunk text into sentences, keeping legal abbreviations (Art., S., v.) intact."""
+    flat = re.sub(r"\s+", " ", text or "").strip()
+    if not flat:
+        return []
+    out: List[str] = []
+    for piece in _BOUNDARY_RE.split(flat):
+        if out:
+            last = out[-1].rsplit(" ", 1)[-1].rstrip(".").lower()
+            # Merge back after abbreviations and single-letter initials (K. S. Puttaswamy)
+            if last in _ABBREVIATIONS or (len(last) == 1 and last.isalpha()):
+                out[-1] = f"{out[-1]} {piece}"
+                continue
+        out.append(piece)
+    return out
+
+
+def _anchor(text: str) -> Optional[str]:
+    m = _ANCHOR_RE.search(text or "")
+    if not m:
+        return None
+    kind = "Article" if m.group(1).lower().startswith("art") else "Section"
+    return f"{kind} {m.group(2)}"
+
+
+def _anchor_number(anchor: Optional[str]) -> Optional[str]:
+    if not anchor:
+        return None
+    m = re.match(r"\w+ (\d+[a-z]?)", anchor, re.IGNORECASE)
+    return m.group(1).lower() if m else None
+
+
+def _collect(contexts: List[Dict], max_chunks: int) -> List[_Sentence]:
+    sentences: List[_Sentence] = []
+    for rank, c in enumerate((contexts or [])[:max_chunks]):
+        text = c.get("text") or ""
+        # Provision headings usually lead the chunk ("Article 21. Protection of life ...")
+        current = _anchor(text[:200])
+        for pos, s in enumerate(split_sentences(text)):
+            current = _anchor(s) or current
+            if len(s) < MIN_SENTENCE_CHARS:
+                continue
+            sentences.append(_Sentence(s[:MAX_SENTENCE_CHARS], rank, pos, current))
+    return sentences
+
+
+def _render(s: _Sentence) -> str:
+    if s.anchor and not _ANCHOR_RE.search(s.text):
+        return f"[{s.anchor}] {s.text}"
+    return s.text
+
+
+def extractive_compress(
+    query: str,
+    contexts: List[Dict],
+    max_chunks: int = 8,
+    budget_chars: Optional[int] = None,
+    dedupe_similarity: Optional[float] = None,
+) -> str:
+    """Return the most query-relevant, non-redundant sentences as bullet lines.
+
+    Sentences are chosen greedily by cosine similarity to the query (plus a bonus for
+    citing a provision named in the query) until budget_chars is used up, then
+    printed in source order so the excerpt reads coherently.
+    """
+    sentences = _collect(contexts, max_chunks)
+    if not sentences:
+        return ""
+    budget = budget_chars if budget_chars is not None else settings.context_compress_budget_chars
+    dedupe = dedupe_similarity if dedupe_similarity is not None else settings.context_compress_dedupe_similarity
+
+    vecs = embed_sentences([s.text for s in sentences], as_numpy=True)
+    qvec = embed_query(query, as_numpy=True)
+    refs: Set[str] = {r.lower() for r in _QUERY_REF_RE.findall(query or "")}
+    scores = vecs @ qvec
+    scores = scores - RANK_DECAY * np.array([s.rank for s in sentences], dtype=np.float32)
+    if refs:
+        scores = scores + ANCHOR_BONUS * np.array(
+            [_anchor_number(s.anchor) in refs for s in sentences], dtype=np.float32
+        )
+
+    chosen: Dict[int, str] = {}
+    used = 0
+    for i in np.argsort(-scores, kind="stable"):
+        i = int(i)
+        if chosen and float(np.max(vecs[list(chosen)] @ vecs[i])) >= dedupe:
+            continue  # near-duplicate of a selected sentence
+        line = _render(sentences[i])
+        if used + len(line) + 3 > budget:
+            if chosen:
+                continue  # a shorter sentence may still fit
+            line = line[: max(0, budget - 3)]  # always keep the best sentence
+        chosen[i] = line
+        used += len(line) + 3
+        if used >= budget:
+            break
+
+    order = sorted(chosen, key=lambda i: (sentences[i].rank, sentences[i].position))
+    return "\n".join("- " + chosen[i] for i in order)
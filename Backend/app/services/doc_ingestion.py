@@ -13,8 +13,10 @@ from app.utils.text_splitter import (
     chunk_units,
     derive_procedural_tags,
 )
-from app.services.embedding import get_embedder
+from app.services.embedding import embedding_dimension
+from app.services.embed_workers import ingest_pool
 from app.services.vector_store import QdrantStore
+from app.services.lexical_index import get_lexical_index
 
 
 UPLOAD_DIR = settings.storage_dir
@@ -73,9 +75,13 @@ def ingest_file(
     collection: str | None = None,
     progress_cb: callable | None = None,
     batch_size: int = 64,
+    approved: bool = False,
 ) -> Dict:
     """Parse -> split -> embed -> upsert into Qdrant in batches with optional progress callback.
 
+    Every point carries an ``approved`` payload flag (kept in sync by the admin approve
+    endpoints) so retrieval can filter unapproved documents inside Qdrant.
+
     progress_cb, if provided, will be called with a dict including fields like:
     { 'stage': 'extract' | 'split' | 'index' | 'done', 'total_chunks': int, 'ingested': int, 'percent': int }
     """
@@ -110,31 +116,23 @@ def ingest_file(
     if progress_cb:
         progress_cb({"stage": "split", "total_chunks": total_chunks, "ingested": 0, "percent": 0})
 
-    # Prepare embedding and collection
-    embedder = get_embedder()
-    vector_size = embedder.get_sentence_embedding_dimension()
+    # Prepare collection
     store = QdrantStore(collection=collection)
-    store.ensure_collection(vector_size)
+    store.ensure_collection(embedding_dimension())
+    lexical = get_lexical_index(store.collection)
 
     if not doc_id:
         doc_id = str(uuid.uuid4())
     checksum = _checksum(saved_path)
 
-    # Embed + upsert in batches, reporting progress
+    # Embed (in the ingestion worker processes, several batches ahead) + upsert, reporting progress
     ingested = 0
     title_value = title or os.path.basename(saved_path)
-    for start in range(0, total_chunks, batch_size):
+    starts = range(0, total_chunks, batch_size)
+    embedded = ingest_pool.map_batches([c for c, _ in chunks_with_meta[start:start + batch_size]] for start in starts)
+    for start, vectors in zip(starts, embedded):
         end = min(start + batch_size, total_chunks)
         batch_chunks_meta = chunks_with_meta[start:end]
-        batch_chunks = [c for c, _ in batch_chunks_meta]
-        # Embed this batch
-        vectors = embedder.encode(
-            batch_chunks,
-            batch_size=batch_size,
-            convert_to_numpy=True,
-            show_progress_bar=False,
-            normalize_embeddings=True,
-        ).tolist()
 
         # Build ids/payloads for this batch
         ids: List[str] = []
@@ -168,12 +166,14 @@ def ingest_file(
                 "source_path": saved_path,
                 "checksum": checksum,
                 "tags": tags,
+                "approved": approved,
             }
             payload.update(extra)
             payloads.append(payload)
 
-        # Upsert this batch
+        # Upsert this batch (dense vectors in Qdrant, terms in the BM25 index)
         store.upsert_points(ids, vectors, payloads)
+        lexical.add(ids, payloads)
 
         ingested = end
         if progress_cb:
@@ -185,6 +185,8 @@ def ingest_file(
                 "percent": percent,
             })
 
+    lexical.save()
+
     if progress_cb:
         progress_cb({"stage": "done", "total_chunks": total_chunks, "ingested": total_chunks, "percent": 100})
 
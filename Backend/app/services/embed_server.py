@@ -0,0 +1,278 @@
+"""Optional shared embedding server.
+
+With several uvicorn workers every process would otherwise load its own copy of the
+embedding model. Run one server per host instead:
+
+    python -m app.services.embed_server
+
+and set EMBED_SERVER_SOCKET to the same path in the API's environment.
+app.services.embedding then sends its encodes over the Unix socket. Query encodes
+from all workers are micro-batched together on the server; ingestion (document)
+batches take a separate lane that encodes one batch at a time, in slices, and lets
+queued queries go first between slices. When the socket is not
+configured or not supported by the platform, the workers load the model in process
+as before. While a configured server is unreachable, embedding calls fail (a
+connection dropped by a server restart is retried once) unless
+embed_server_fallback_local is set; then the workers load their own copy of the model
+and retry the server after embed_server_retry_seconds.
+
+Wire format: every message is a 4-byte big-endian length followed by the payload.
+Requests are JSON ({"op": "encode", "texts": [...], "kind": "query" | "documents"} or
+{"op": "info"}); responses are
+a JSON header, followed for encodes by one frame of float32 row-major vector bytes.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import os
+import socket
+import socketserver
+import struct
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_LEN = struct.Struct(">I")
+# Texts per document forward pass on the server; queries may cut in between slices
+_DOCUMENT_SLICE = 16
+# Longest a document slice waits for queued queries before it runs anyway
+_DOCUMENT_YIELD_SECONDS = 1.0
+
+
+class EmbedServerUnavailable(RuntimeError):
+    """The server could not be reached (callers fall back in process only if configured to)."""
+
+
+def _send(sock: socket.socket, payload: bytes):
+    sock.sendall(_LEN.pack(len(payload)) + payload)
+
+
+def _recv_exact(sock: socket.socket, n: int) -> bytes:
+    buf = bytearray()
+    while len(buf) < n:
+        part = sock.recv(min(n - len(buf), 1 << 20))
+        if not part:
+            raise ConnectionError("embedding server closed the connection")
+        buf += part
+    return bytes(buf)
+
+
+def _recv(sock: socket.socket) -> bytes:
+    (n,) = _LEN.unpack(_recv_exact(sock, _LEN.size))
+    return _recv_exact(sock, n)
+
+
+class EmbedServerClient:
+    """Per-thread persistent connections to the embedding server."""
+
+    def __init__(self, path: str, timeout_ms: int, retry_seconds: float, fallback_local: bool = False):
+        self.path = path or ""
+        self.fallback_local = bool(fallback_local)
+        self.timeout = max(0.1, timeout_ms / 1000.0)
+        self.retry_seconds = max(0.0, float(retry_seconds))
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._down_until = 0.0
+        self._info: Optional[Dict] = None
+        self._disabled = not self.path or not hasattr(socket, "AF_UNIX")
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def enabled(self) -> bool:
+        if self._disabled:
+            return False
+        # Without the local fallback every call goes to the server, so it is used again as soon as it is back
+        return not self.fallback_local or time.monotonic() >= self._down_until
+
+    def disable(self):
+        """Never use the server from this process (the server itself shares the settings)."""
+        self._disabled = True
+
+    def _connection(self) -> socket.socket:
+        sock = getattr(self._local, "sock", None)
+        if sock is None:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+            except Exception:
+                sock.close()
+                raise
+            self._local.sock = sock
+        return sock
+
+    def _drop_connection(self):
+        sock = getattr(self._local, "sock", None)
+        self._local.sock = None
+        if sock is not None:
+            try:
+                sock.close()
+            except Exception:
+                pass
+
+    def _call(self, request: Dict) -> Tuple[Dict, Optional[bytes]]:
+        payload = json.dumps(request, ensure_ascii=False).encode("utf-8")
+        for attempt in (0, 1):
+            reused = getattr(self._local, "sock", None) is not None
+            try:
+                sock = self._connection()
+                _send(sock, payload)
+                header = json.loads(_recv(sock).decode("utf-8"))
+                body = _recv(sock) if header.get("shape") else None
+                break
+            except (OSError, ConnectionError, ValueError) as e:
+                self._drop_connection()
+                # A kept-alive connection closed by a server restart: retry once on a fresh one
+                if attempt == 0 and reused and isinstance(e, ConnectionError):
+                    continue
+                with self._lock:
+                    self.failures += 1
+                    was_up = time.monotonic() >= self._down_until
+                    self._down_until = time.monotonic() + self.retry_seconds
+                    self._info = None
+                if was_up:
+                    fallback = "using the in-process model" if self.fallback_local else "embedding calls fail until it is back"
+                    logger.warning("Embedding server at %s unavailable (%s); %s", self.path, e, fallback)
+                raise EmbedServerUnavailable(str(e)) from e
+        with self._lock:
+            self.requests += 1
+            self._down_until = 0.0
+        if not header.get("ok"):
+            raise RuntimeError(f"Embedding server error: {header.get('error')}")
+        return header, body
+
+    def info(self) -> Dict:
+        """Model signature and dimension served (cached until the connection fails)."""
+        info = self._info
+        if info is None:
+            info, _ = self._call({"op": "info"})
+            self._info = info
+        return info
+
+    def ping(self):
+        """Round trip to the server, bypassing the cached info; raises EmbedServerUnavailable."""
+        self._call({"op": "info"})
+
+    def encode(self, texts: List[str], kind: str = "query") -> np.ndarray:
+        header, body = self._call({"op": "encode", "texts": list(texts), "kind": kind})
+        shape = tuple(header.get("shape") or (0, 0))
+        if body is None:
+            return np.zeros(shape, dtype=np.float32)
+        return np.frombuffer(body, dtype=np.float32).reshape(shape)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "socket": self.path or None,
+                "enabled": not self._disabled,
+                "fallback_local": self.fallback_local,
+                "up": not self._disabled and time.monotonic() >= self._down_until,
+                "requests": self.requests,
+                "failures": self.failures,
+            }
+
+
+class _DocumentLane:
+    """Encodes ingestion batches one at a time, yielding to the query batcher between slices."""
+
+    def __init__(self, encode, batcher, slice_size: int = _DOCUMENT_SLICE):
+        self._encode = encode
+        self._batcher = batcher
+        self.slice_size = max(1, int(slice_size))
+        self._lock = threading.Lock()
+
+    def _yield_to_queries(self):
+        deadline = time.monotonic() + _DOCUMENT_YIELD_SECONDS
+        while self._batcher.busy and time.monotonic() < deadline:
+            time.sleep(0.002)
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts:
+            return self._encode(texts)
+        with self._lock:
+            parts = []
+            for i in range(0, len(texts), self.slice_size):
+                self._yield_to_queries()
+                parts.append(self._encode(texts[i : i + self.slice_size]))
+            return np.vstack(parts)
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        from app.services.embedding import embedder_signature, embedding_dimension
+
+        sock: socket.socket = self.request
+        while True:
+            try:
+                request = json.loads(_recv(sock).decode("utf-8"))
+            except (ConnectionError, OSError, ValueError):
+                return
+            body = None
+            try:
+                if request.get("op") == "info":
+                    header = {"ok": True, "signature": embedder_signature(), "dimension": embedding_dimension()}
+                elif request.get("op") == "encode":
+                    texts = request.get("texts") or []
+                    lane = self.server.documents if request.get("kind") == "documents" else self.server.batcher
+                    mat = np.ascontiguousarray(lane.encode(texts), dtype=np.float32)
+                    header = {"ok": True, "shape": list(mat.shape)}
+                    body = mat.tobytes()
+                else:
+                    header = {"ok": False, "error": f"unknown op {request.get('op')!r}"}
+            except Exception as e:
+                logger.exception("Embedding request failed: %s", e)
+                header = {"ok": False, "error": str(e)}
+            try:
+                _send(sock, json.dumps(header).encode("utf-8"))
+                if body is not None and header.get("shape"):
+                    _send(sock, body)
+            except OSError:
+                return
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def serve(path: Optional[str] = None):
+    from app.services import embedding
+
+    path = path or settings.embed_server_socket
+    if not path:
+        raise SystemExit("Set EMBED_SERVER_SOCKET (or pass a socket path)")
+    # Encode locally here even though the API settings point at this very socket
+    embedding.embed_server_client.disable()
+    embedding.embedding_dimension()  # load the model before accepting connections
+    if os.path.exists(path):
+        os.unlink(path)
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    server = _Server(path, _Handler)
+    os.chmod(path, 0o660)
+    # Concurrent query encodes from all API workers share forward passes; ingestion
+    # batches never join them, so a query never waits behind a whole document batch
+    server.batcher = embedding.QueryBatcher(embedding._encode, settings.embed_batch_max_size, settings.embed_batch_max_wait_ms)
+    server.documents = _DocumentLane(embedding._encode, server.batcher)
+    logger.info("Embedding server listening on %s", path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        try:
+            os.unlink(path)
+        except OSError:
+            pass
+
+
+if __name__ == "__main__":
+    import sys
+
+    logging.basicConfig(level=logging.INFO)
+    serve(sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,203 @@
+"""Process pool that embeds ingestion batches off the API process.
+
+Each worker process loads the embedder once (same settings, backend and fallbacks as
+the API) and encodes whole chunk batches. Submissions are bounded by
+settings.embed_ingest_queue_max batches in flight, so a large upload applies
+backpressure to its own ingestion thread instead of piling work up in memory.
+
+Interactive query embedding stays in the API process and keeps priority: workers run
+at a lower scheduling priority (settings.embed_ingest_nice) with a capped number of
+torch threads, leaving cores for the request path.
+
+The pool is opt-in (embed_ingest_processes defaults to 0): each worker holds another
+copy of the model for every API worker process, unless a shared embedding server is
+configured. With 0 processes, or when the pool cannot run, batches are embedded in
+process as before.
+"""
+from __future__ import annotations
+
+import atexit
+import logging
+import multiprocessing
+import os
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Dict, Iterable, Iterator, List, Optional
+
+import numpy as np
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def _torch_threads(processes: int) -> int:
+    if settings.embed_ingest_threads_per_process > 0:
+        return settings.embed_ingest_threads_per_process
+    # Split the cores between the workers and the API process
+    return max(1, (os.cpu_count() or 2) // (processes + 1))
+
+
+def _init_worker(nice: int, threads: int):
+    try:
+        if nice:
+            os.nice(nice)
+    except Exception:
+        pass
+    try:
+        import torch
+
+        torch.set_num_threads(threads)
+    except Exception:
+        pass
+    from app.services.embedding import embedding_dimension
+
+    # Loads the model, or just connects when a shared embedding server is configured
+    embedding_dimension()
+
+
+def _encode_batch(texts: List[str]) -> np.ndarray:
+    from app.services.embedding import embed_texts
+
+    return embed_texts(texts, as_numpy=True)
+
+
+class IngestEmbedPool:
+    def __init__(self, processes: int, queue_max: int, nice: int):
+        self.processes = max(0, int(processes))
+        self.queue_max = max(1, int(queue_max))
+        self.nice = int(nice)
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(self.queue_max)
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._disabled = self.processes == 0
+        self.submitted = 0
+        self.completed = 0
+        self.inline = 0
+        self.failures = 0
+
+    def _executor(self) -> Optional[ProcessPoolExecutor]:
+        if self._disabled:
+            return None
+        with self._lock:
+            if self._pool is None:
+                try:
+                    # spawn: forking a process that already runs torch/tokenizer threads can deadlock
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.processes,
+                        mp_context=multiprocessing.get_context("spawn"),
+                        initializer=_init_worker,
+                        initargs=(self.nice, _torch_threads(self.processes)),
+                    )
+                except Exception as e:
+                    logger.warning("Ingestion embedding pool unavailable (%s); embedding in process", e)
+                    self._disabled = True
+                    return None
+            return self._pool
+
+    def _reset(self, pool: ProcessPoolExecutor):
+        with self._lock:
+            if self._pool is pool:
+                self._pool = None
+        try:
+            pool.shutdown(wait=False, cancel_futures=True)
+        except Exception:
+            pass
+
+    def _inline(self, texts: List[str]) -> np.ndarray:
+        with self._lock:
+            self.inline += 1
+        return _encode_batch(texts)
+
+    def submit(self, texts: List[str]) -> Future:
+        """Queue one batch; blocks while embed_ingest_queue_max batches are in flight."""
+        pool = self._executor()
+        if pool is None:
+            fut: Future = Future()
+            try:
+                fut.set_result(self._inline(texts))
+            except Exception as e:
+                fut.set_exception(e)
+            return fut
+        self._slots.acquire()
+        try:
+            fut = pool.submit(_encode_batch, texts)
+        except Exception as e:
+            # Broken pool (a worker died): start a fresh one on the next batch
+            self._slots.release()
+            with self._lock:
+                self.failures += 1
+            logger.warning("Ingestion embedding pool failed (%s); embedding batch in process", e)
+            self._reset(pool)
+            fut = Future()
+            try:
+                fut.set_result(self._inline(texts))
+            except Exception as inner:
+                fut.set_exception(inner)
+            return fut
+        with self._lock:
+            self.submitted += 1
+        fut.add_done_callback(self._done)
+        return fut
+
+    def _done(self, fut: Future):
+        self._slots.release()
+        with self._lock:
+            self.completed += 1
+
+    def result(self, fut: Future, texts: List[str]) -> np.ndarray:
+        """Batch vectors; a crashed or unusable pool is dropped and the batch embedded in process."""
+        try:
+            return fut.result()
+        except Exception as e:
+            pool = self._pool
+            with self._lock:
+                self.failures += 1
+            logger.warning("Ingestion embedding worker failed (%s); embedding batch in process", e)
+            if pool is not None and getattr(pool, "_broken", False):
+                self._reset(pool)
+            return self._inline(texts)
+
+    def map_batches(self, batches: Iterable[List[str]]) -> Iterator[np.ndarray]:
+        """Embed batches in order, keeping up to queue_max of them in flight across the workers."""
+        window: deque = deque()
+        for texts in batches:
+            window.append((self.submit(texts), texts))
+            if len(window) >= self.queue_max:
+                fut, t = window.popleft()
+                yield self.result(fut, t)
+        while window:
+            fut, t = window.popleft()
+            yield self.result(fut, t)
+
+    def shutdown(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "processes": 0 if self._disabled else self.processes,
+                "started": self._pool is not None,
+                "queue_max": self.queue_max,
+                "in_flight": self.submitted - self.completed,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "inline_batches": self.inline,
+                "failures": self.failures,
+            }
+
+
+ingest_pool = IngestEmbedPool(
+    settings.embed_ingest_processes,
+    settings.embed_ingest_queue_max,
+    settings.embed_ingest_nice,
+)
+atexit.register(ingest_pool.shutdown)
+
+
+def ingest_pool_stats() -> Dict:
+    return ingest_pool.stats()
@@ -1,28 +1,177 @@
 from __future__ import annotations
 from sentence_transformers import SentenceTransformer
 import torch
-from functools import lru_cache
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import partial
+from typing import Dict, List, Optional, Tuple
+import numpy as np
 from app.core.config import settings
+from app.services.embed_server import EmbedServerClient, EmbedServerUnavailable
+
+# Name of the model that actually loaded (primary or a fallback) and the backend running it
+_loaded_model_name: Optional[str] = None
+_loaded_backend: str = "torch"
+
+# Texts used to compare ONNX output against PyTorch after an export
+_PARITY_PROBES = [
+    "What does Article 21 of the Constitution of India protect?",
+    "Section 69A of the Information Technology Act, 2000 empowers the Central Government to block access to information.",
+    "Right to Equality (Articles 14-18)",
+    "anticipatory bail",
+    "The State shall not deny to any person equality before the law or the equal protection of the laws within the territory of India.",
+]
+
+
+def _onnx_dir(name: str) -> str:
+    return os.path.join(settings.embed_onnx_cache_dir, re.sub(r"[^\w.-]+", "__", name))
+
+
+def _onnx_file_name() -> str:
+    q = (settings.embed_onnx_quantize or "").strip().lower()
+    return f"onnx/model_qint8_{q}.onnx" if q else "onnx/model.onnx"
+
+
+def _export_onnx(name: str, target: str, file_name: str):
+    """One-time export of `name` to ONNX under `target`, plus the int8 `file_name` if quantizing.
+
+    The fp32 export is written to a temporary directory and renamed into place, and a
+    quantized variant is added to an existing export by renaming the single file, so
+    concurrent workers never load a half-written model.
+    """
+    base_file = os.path.join(target, "onnx", "model.onnx")
+    tmp = f"{target}.tmp-{os.getpid()}-{threading.get_ident()}"
+    shutil.rmtree(tmp, ignore_errors=True)
+    try:
+        if not os.path.exists(base_file):
+            # backend="onnx" on a hub id without ONNX weights converts the PyTorch checkpoint
+            model = SentenceTransformer(name, device="cpu", backend="onnx", trust_remote_code=True)
+            model.save(tmp)
+            try:
+                os.replace(tmp, target)
+            except OSError:
+                # Fine when another worker exported first; anything else is a real failure
+                if not os.path.exists(base_file):
+                    raise
+        if os.path.exists(os.path.join(target, file_name)):
+            return
+        q = (settings.embed_onnx_quantize or "").strip().lower()
+        from sentence_transformers import export_dynamic_quantized_onnx_model
+
+        model = SentenceTransformer(
+            target, device="cpu", backend="onnx", model_kwargs={"file_name": "onnx/model.onnx"}, trust_remote_code=True
+        )
+        export_dynamic_quantized_onnx_model(model, q, tmp)
+        os.replace(os.path.join(tmp, file_name), os.path.join(target, file_name))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def _onnx_parity(name: str, model: SentenceTransformer) -> float:
+    """Min cosine similarity between ONNX and PyTorch embeddings of the probe texts."""
+    reference = SentenceTransformer(name, device="cpu", trust_remote_code=True)
+    try:
+        a = model.encode(_PARITY_PROBES, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
+        b = reference.encode(_PARITY_PROBES, convert_to_numpy=True, normalize_embeddings=True, show_progress_bar=False)
+        return float(np.min(np.sum(a * b, axis=1)))
+    finally:
+        del reference
+
+
+def _load_onnx(name: str) -> SentenceTransformer:
+    """ONNX Runtime model for `name`, exported and parity-checked once, then loaded from disk.
+
+    Raises when the export fails or drifts from PyTorch beyond settings.embed_onnx_min_parity.
+    """
+    target = _onnx_dir(name)
+    file_name = _onnx_file_name()
+    if not os.path.exists(os.path.join(target, file_name)):
+        _export_onnx(name, target, file_name)
+    model = SentenceTransformer(
+        target,
+        device="cpu",
+        backend="onnx",
+        model_kwargs={"file_name": file_name, "provider": "CPUExecutionProvider"},
+        trust_remote_code=True,
+    )
+    # Parity results are recorded next to the export so the PyTorch reference loads only once
+    report_path = os.path.join(target, "parity.json")
+    try:
+        with open(report_path, "r", encoding="utf-8") as f:
+            report = json.load(f)
+    except Exception:
+        report = {}
+    parity = report.get(file_name)
+    if parity is None:
+        parity = _onnx_parity(name, model)
+        report[file_name] = parity
+        try:
+            with open(report_path, "w", encoding="utf-8") as f:
+                json.dump(report, f, indent=2)
+        except Exception:
+            pass
+    if parity < settings.embed_onnx_min_parity:
+        raise RuntimeError(
+            f"ONNX embeddings for {name} ({file_name}) deviate from PyTorch: min cosine {parity:.4f} < {settings.embed_onnx_min_parity}"
+        )
+    return model
+
+
+_embedder: Optional[SentenceTransformer] = None
+_embedder_lock = threading.Lock()
 
 
-@lru_cache(maxsize=1)
 def get_embedder() -> SentenceTransformer:
+    """Shared embedder for the process.
+
+    Built under a lock: startup warmup threads ask for it concurrently, and building it
+    twice would double peak memory (and race on the ONNX export directory).
+    """
+    global _embedder
+    if _embedder is None:
+        with _embedder_lock:
+            if _embedder is None:
+                _embedder = _load_embedder()
+    return _embedder
+
+
+def _load_embedder() -> SentenceTransformer:
     """Return a SentenceTransformer embedder with robust fallbacks.
 
     Workaround PyTorch meta-tensor move errors by preferring CPU init and
     falling back to a smaller, stable model if needed.
     """
     # Prefer CPU on Windows/dev to avoid CUDA/mps/device-map quirks
-    preferred_device = getattr(settings, "embed_device", "cpu") or "cpu"
+    preferred_device = settings.embed_device or "cpu"
 
-    primary_model = getattr(settings, "embed_model", "BAAI/bge-m3")
+    primary_model = settings.embed_model or "BAAI/bge-m3"
     fallbacks = [
         "sentence-transformers/all-MiniLM-L6-v2",  # very stable and light
     ]
 
     def _try_load(name: str) -> SentenceTransformer:
+        global _loaded_model_name, _loaded_backend
+        if (settings.embed_backend or "torch").lower() == "onnx":
+            try:
+                model = _load_onnx(name)
+                _loaded_model_name, _loaded_backend = name, "onnx:" + _onnx_file_name()
+                return model
+            except Exception as e:
+                logging.getLogger(__name__).warning("ONNX embedding backend unavailable for %s (%s); using PyTorch", name, e)
         # Force CPU to avoid meta-tensor to() issues in recent torch/transformers
-        return SentenceTransformer(name, device="cpu", trust_remote_code=True)
+        model = SentenceTransformer(name, device="cpu", trust_remote_code=True)
+        _loaded_model_name, _loaded_backend = name, "torch"
+        return model
 
     # Try primary
     try:
@@ -47,11 +196,384 @@ def get_embedder() -> SentenceTransformer:
     )
 
 
-def embed_texts(texts: list[str]) -> list[list[float]]:
+# Shared embedding server (app.services.embed_server); unused unless EMBED_SERVER_SOCKET is set
+embed_server_client = EmbedServerClient(
+    settings.embed_server_socket,
+    settings.embed_server_timeout_ms,
+    settings.embed_server_retry_seconds,
+    settings.embed_server_fallback_local,
+)
+
+
+def _server_info() -> Optional[Dict]:
+    if not embed_server_client.enabled:
+        return None
+    try:
+        return embed_server_client.info()
+    except EmbedServerUnavailable:
+        if not embed_server_client.fallback_local:
+            raise
+        return None
+
+
+def embedder_signature() -> str:
+    """Identify the loaded model (name + backend + dimension) so cached vectors never outlive a model swap."""
+    info = _server_info()
+    if info is not None:
+        return info["signature"]
+    model = get_embedder()
+    return f"{_loaded_model_name or settings.embed_model}:{_loaded_backend}:{model.get_sentence_embedding_dimension()}"
+
+
+def _normalize_query(text: str) -> str:
+    t = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", t).strip()
+
+
+class QueryEmbeddingCache:
+    """Bounded LRU/TTL cache of normalized query text -> float32 vector.
+
+    An optional Redis tier (settings.embed_cache_backend == "redis") is shared across
+    workers; the in-process LRU always sits in front of it.
+    """
+
+    def __init__(self, max_items: int, ttl_seconds: int, redis_url: str | None = None):
+        self.max_items = max(0, int(max_items))
+        self.ttl = max(0, int(ttl_seconds))
+        self._items: "OrderedDict[str, Tuple[float, np.ndarray]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.redis_hits = 0
+        self.redis_errors = 0
+        self._redis = None
+        if redis_url:
+            try:
+                import redis  # optional shared tier
+
+                self._redis = redis.Redis.from_url(redis_url, socket_timeout=0.05, socket_connect_timeout=0.2)
+            except Exception as e:
+                logging.getLogger(__name__).warning("Embedding cache: Redis unavailable (%s); using memory only", e)
+                self._redis = None
+
+    @staticmethod
+    def make_key(signature: str, text: str) -> str:
+        digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+        return f"emb:{signature}:{digest}"
+
+    def get(self, key: str) -> np.ndarray | None:
+        now = time.time()
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                ts, vec = item
+                if not self.ttl or now - ts <= self.ttl:
+                    self._items.move_to_end(key)
+                    self.hits += 1
+                    return vec
+                del self._items[key]
+        if self._redis is not None:
+            try:
+                raw = self._redis.get(key)
+            except Exception:
+                raw = None
+                self.redis_errors += 1
+            if raw:
+                vec = np.frombuffer(raw, dtype=np.float32)
+                self._put_local(key, vec)
+                with self._lock:
+                    self.hits += 1
+                    self.redis_hits += 1
+                return vec
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _put_local(self, key: str, vec: np.ndarray):
+        if not self.max_items:
+            return
+        with self._lock:
+            self._items[key] = (time.time(), vec)
+            self._items.move_to_end(key)
+            while len(self._items) > self.max_items:
+                self._items.popitem(last=False)
+
+    def put(self, key: str, vec: np.ndarray):
+        vec = np.asarray(vec, dtype=np.float32)
+        self._put_local(key, vec)
+        if self._redis is not None:
+            try:
+                if self.ttl:
+                    self._redis.setex(key, self.ttl, vec.tobytes())
+                else:
+                    self._redis.set(key, vec.tobytes())
+            except Exception:
+                self.redis_errors += 1
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def stats(self) -> Dict:
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": "redis" if self._redis is not None else "memory",
+                "size": len(self._items),
+                "max_items": self.max_items,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "redis_hits": self.redis_hits,
+                "redis_errors": self.redis_errors,
+            }
+
+
+_query_cache = QueryEmbeddingCache(
+    settings.embed_cache_size,
+    settings.embed_cache_ttl_seconds,
+    redis_url=settings.redis_url if (settings.embed_cache_backend or "").lower() == "redis" else None,
+)
+
+
+def embedding_cache_stats() -> Dict:
+    stats = _query_cache.stats()
+    stats["sentences"] = _sentence_cache.stats()
+    return stats
+
+
+def _encode(texts: List[str], kind: str = "query") -> np.ndarray:
+    """kind ("query" or "documents") picks the embedding server's lane; ignored in process."""
+    if embed_server_client.enabled:
+        try:
+            return embed_server_client.encode(texts, kind=kind)
+        except EmbedServerUnavailable:
+            # Loading a private copy of the model is opt-in (it multiplies memory per worker)
+            if not embed_server_client.fallback_local:
+                raise
     model = get_embedder()
     embs = model.encode(texts, batch_size=64, convert_to_numpy=True, show_progress_bar=False, normalize_embeddings=True)
-    return embs.tolist()
+    return np.asarray(embs, dtype=np.float32)
+
+
+class QueryBatcher:
+    """Coalesces concurrent small encodes (one query per request) into one model.encode.
+
+    Requests wait at most max_wait_ms after the oldest one arrived, or until max_batch
+    texts are pending; a single worker thread then encodes the distinct texts of the
+    batch together and resolves each request's future with its rows. A request larger
+    than max_batch is encoded on its own.
+    """
+
+    def __init__(self, encode, max_batch: int, max_wait_ms: int):
+        self._encode_fn = encode
+        self.max_batch = max(1, int(max_batch))
+        self.max_wait = max(0, int(max_wait_ms)) / 1000.0
+        self._cond = threading.Condition()
+        self._pending: deque = deque()  # (texts, future, enqueued_at)
+        self._pending_texts = 0
+        self._worker: Optional[threading.Thread] = None
+        self._active = False
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.errors = 0
+        self._histogram: Dict[str, int] = {}
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_wait > 0 and self.max_batch > 1
+
+    @property
+    def busy(self) -> bool:
+        """Requests are queued or a batch is being encoded."""
+        return bool(self._pending) or self._active
+
+    def submit(self, texts: List[str]) -> Future:
+        fut: Future = Future()
+        with self._cond:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+                self._worker.start()
+            self._pending.append((list(texts), fut, time.monotonic()))
+            self._pending_texts += len(texts)
+            self.requests += 1
+            self._cond.notify()
+        return fut
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if not texts or not self.enabled:
+            return self._encode_fn(texts)
+        return self.submit(texts).result()
+
+    def _take(self) -> List[Tuple[List[str], Future]]:
+        with self._cond:
+            while not self._pending:
+                self._cond.wait()
+            deadline = self._pending[0][2] + self.max_wait
+            while self._pending_texts < self.max_batch:
+                left = deadline - time.monotonic()
+                if left <= 0:
+                    break
+                self._cond.wait(left)
+            batch: List[Tuple[List[str], Future]] = []
+            n = 0
+            while self._pending and (not batch or n + len(self._pending[0][0]) <= self.max_batch):
+                texts, fut, _ = self._pending.popleft()
+                batch.append((texts, fut))
+                n += len(texts)
+            self._pending_texts -= n
+            return batch
+
+    def _run(self):
+        while True:
+            try:
+                self._run_batch(self._take())
+            except Exception as e:
+                # Never let one bad batch end the only worker thread
+                logging.getLogger(__name__).exception("Query embedding batch failed: %s", e)
+
+    def _run_batch(self, batch: List[Tuple[List[str], Future]]):
+        # Requests cancelled while queued (e.g. an abandoned async await) are dropped
+        batch = [(texts, fut) for texts, fut in batch if fut.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        # Identical concurrent queries are encoded once
+        unique = list(dict.fromkeys(t for texts, _ in batch for t in texts))
+        self._active = True
+        try:
+            rows = dict(zip(unique, self._encode_fn(unique)))
+        except Exception as e:
+            with self._cond:
+                self.errors += 1
+            for _, fut in batch:
+                fut.set_exception(e)
+            return
+        finally:
+            self._active = False
+        with self._cond:
+            self.batches += 1
+            self.texts += len(unique)
+            bucket = _size_bucket(len(unique))
+            self._histogram[bucket] = self._histogram.get(bucket, 0) + 1
+        for texts, fut in batch:
+            fut.set_result(np.vstack([rows[t] for t in texts]))
+
+    def stats(self) -> Dict:
+        with self._cond:
+            return {
+                "enabled": self.enabled,
+                "max_batch": self.max_batch,
+                "max_wait_ms": round(self.max_wait * 1000.0, 1),
+                "pending": self._pending_texts,
+                "requests": self.requests,
+                "batches": self.batches,
+                "texts": self.texts,
+                "errors": self.errors,
+                "avg_batch_size": round(self.texts / self.batches, 2) if self.batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._histogram.items(), key=lambda kv: int(kv[0].split("-")[-1]))),
+            }
+
+
+def _size_bucket(n: int) -> str:
+    """Power-of-two histogram bucket label: 1, 2, 3-4, 5-8, 9-16, ..."""
+    hi = 1
+    while hi < n:
+        hi *= 2
+    return str(hi) if hi <= 2 else f"{hi // 2 + 1}-{hi}"
+
+
+_query_batcher = QueryBatcher(_encode, settings.embed_batch_max_size, settings.embed_batch_max_wait_ms)
+
+
+def embedding_batcher_stats() -> Dict:
+    return _query_batcher.stats()
+
+
+def embed_texts(texts: list[str], as_numpy: bool = False) -> list[list[float]] | np.ndarray:
+    """Embed documents; as_numpy returns the float32 matrix without building Python float lists."""
+    embs = _encode(texts, kind="documents")
+    return embs if as_numpy else embs.tolist()
+
+
+def _cache_lookup(texts: list[str], cache: QueryEmbeddingCache) -> Tuple[List[str], List[str], List[np.ndarray | None], List[str]]:
+    """Normalized texts, cache keys, cached vectors (None for misses) and the distinct misses."""
+    sig = embedder_signature()
+    norm = [_normalize_query(t) for t in texts]
+    keys = [QueryEmbeddingCache.make_key(sig, t) for t in norm]
+    vecs: List[np.ndarray | None] = [cache.get(k) for k in keys]
+    missing = sorted({norm[i] for i, v in enumerate(vecs) if v is None})
+    return norm, keys, vecs, missing
+
+
+def _cache_fill(cache: QueryEmbeddingCache, norm: List[str], keys: List[str], vecs: List[np.ndarray | None],
+                missing: List[str], encoded: np.ndarray | None) -> np.ndarray:
+    if missing:
+        fresh = dict(zip(missing, encoded))
+        for i, v in enumerate(vecs):
+            if v is None:
+                vecs[i] = fresh[norm[i]]
+                cache.put(keys[i], vecs[i])
+    return np.vstack(vecs) if vecs else np.zeros((0, 0), dtype=np.float32)
+
+
+def _embed_cached(texts: list[str], cache: QueryEmbeddingCache, encode=_encode) -> np.ndarray:
+    """Serve repeats from cache and encode misses in one batch."""
+    norm, keys, vecs, missing = _cache_lookup(texts, cache)
+    encoded = encode(missing) if missing else None
+    return _cache_fill(cache, norm, keys, vecs, missing, encoded)
+
+
+def embed_queries(texts: list[str], as_numpy: bool = False) -> list[list[float]] | np.ndarray:
+    """Embed search queries, serving repeats from the query cache and micro-batching misses across requests."""
+    mat = _embed_cached(texts, _query_cache, encode=_query_batcher.encode)
+    return mat if as_numpy else mat.tolist()
+
+
+# Corpus sentences recur across questions (same top chunks), so the extractive
+# compressor's sentence vectors are cached in process as well
+_sentence_cache = QueryEmbeddingCache(settings.embed_sentence_cache_size, settings.embed_cache_ttl_seconds)
+
+
+def embed_sentences(texts: list[str], as_numpy: bool = False) -> list[list[float]] | np.ndarray:
+    """Embed short passages (e.g. sentences of retrieved chunks) through the sentence cache."""
+    mat = _embed_cached(texts, _sentence_cache)
+    return mat if as_numpy else mat.tolist()
+
+
+def embed_query(text: str, as_numpy: bool = False) -> list[float] | np.ndarray:
+    return embed_queries([text], as_numpy=as_numpy)[0]
+
+
+def embedding_dimension() -> int:
+    """Vector size of the active embedder (served remotely or loaded in process)."""
+    info = _server_info()
+    if info is not None:
+        return int(info["dimension"])
+    return get_embedder().get_sentence_embedding_dimension()
+
+
+# Dedicated threads for the async pipeline so model forward passes never run on the
+# event loop nor compete with Starlette's shared threadpool
+_embed_executor = ThreadPoolExecutor(max_workers=max(1, settings.embed_executor_workers), thread_name_prefix="embed")
+
+
+async def run_in_embed_executor(fn, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_embed_executor, partial(fn, *args, **kwargs))
+
+
+async def embed_queries_async(texts: list[str], as_numpy: bool = False) -> list[list[float]] | np.ndarray:
+    if not _query_batcher.enabled:
+        return await run_in_embed_executor(embed_queries, texts, as_numpy=as_numpy)
+    # Await the batch on the loop instead of parking an executor thread on it, so the
+    # number of requests that can share a batch is not capped by embed_executor_workers
+    norm, keys, vecs, missing = await run_in_embed_executor(_cache_lookup, texts, _query_cache)
+    encoded = await asyncio.wrap_future(_query_batcher.submit(missing)) if missing else None
+    mat = await run_in_embed_executor(_cache_fill, _query_cache, norm, keys, vecs, missing, encoded)
+    return mat if as_numpy else mat.tolist()
 
 
-def embed_query(text: str) -> list[float]:
-    return embed_texts([text])[0]
+async def embed_query_async(text: str, as_numpy: bool = False) -> list[float] | np.ndarray:
+    return (await embed_queries_async([text], as_numpy=as_numpy))[0]
@@ -0,0 +1,155 @@
+from __future__ import annotations
+import itertools
+import json
+import os
+import re
+import threading
+from typing import Dict, List, Set, Tuple
+
+_generations = itertools.count(1)
+
+LEGAL_LINKS_PATH = os.path.join(os.path.dirname(__file__), "legal_links.json")
+
+# Default minimal mapping used when legal_links.json is absent or invalid
+DEFAULT_LEGAL_LINKS: Dict[str, Dict] = {
+    "19(1)(a)": {
+        "Linked_Sections": ["69A IT Act", "69 IT Act"],
+        "Keywords": ["speech", "publish", "ban", "expression", "censorship"],
+    },
+    "19(2)": {
+        "Linked_Sections": ["69A IT Act"],
+        "Keywords": ["reasonable restriction", "public order", "decency", "morality", "security of the state", "sovereignty"],
+    },
+    "32": {
+        "Linked_Sections": [],
+        "Keywords": ["writ", "remedy"],
+    },
+    "226": {
+        "Linked_Sections": [],
+        "Keywords": ["writ", "high court"],
+    },
+}
+
+
+def _article_number(art_key: str) -> int | None:
+    """Leading article number of a key such as '19(1)(a)' -> 19."""
+    m = re.match(r"\s*(?:article\s+)?(\d+)", str(art_key), re.IGNORECASE)
+    return int(m.group(1)) if m else None
+
+
+class LinkMatcher:
+    """Statute <-> constitution link map compiled for fast per-chunk matching.
+
+    All linked sections and keywords are folded into one case-insensitive alternation
+    regex, so a chunk is scanned once regardless of how many articles are mapped.
+    A zero-width lookahead finds matches at every position (overlaps included), and
+    each pattern also carries the articles of any shorter pattern that is its prefix,
+    so the result equals testing every pattern individually.
+    """
+
+    def __init__(self, mapping: Dict[str, Dict]):
+        self.mapping = mapping or {}
+        # Distinguishes matcher versions for caches of derived per-chunk data
+        self.generation = next(_generations)
+        by_pattern: Dict[str, Set[int]] = {}
+        self._sections: List[Tuple[str, int]] = []
+        for art_key, cfg in self.mapping.items():
+            art_num = _article_number(art_key)
+            if not art_num:
+                continue
+            cfg = cfg or {}
+            for sec in cfg.get("Linked_Sections") or []:
+                sec = str(sec).strip().upper()
+                if sec:
+                    self._sections.append((sec, art_num))
+                    by_pattern.setdefault(sec.lower(), set()).add(art_num)
+            for kw in cfg.get("Keywords") or []:
+                kw = str(kw).strip().lower()
+                if kw:
+                    by_pattern.setdefault(kw, set()).add(art_num)
+        # Prefix closure: a longest-first alternation reports one pattern per position
+        self._articles: Dict[str, Tuple[int, ...]] = {}
+        for pat in by_pattern:
+            arts: Set[int] = set()
+            for other, other_arts in by_pattern.items():
+                if pat.startswith(other):
+                    arts |= other_arts
+            self._articles[pat] = tuple(sorted(arts))
+        pats = sorted(by_pattern, key=len, reverse=True)
+        self._regex = re.compile("(?=(" + "|".join(re.escape(p) for p in pats) + "))", re.IGNORECASE) if pats else None
+        self._section_memo: Dict[str, Tuple[int, ...]] = {}
+
+    def _section_articles(self, section: str) -> Tuple[int, ...]:
+        """Articles linked to a chunk's own section id (e.g. '69A' matches '69A IT ACT')."""
+        cached = self._section_memo.get(section)
+        if cached is None:
+            arts = {a for sec, a in self._sections if sec in section or sec.find(section) >= 0}
+            cached = tuple(sorted(arts))
+            self._section_memo[section] = cached
+        return cached
+
+    def articles_for(self, section: str | None, text: str) -> List[int]:
+        """Constitutional articles linked to a chunk via its section id or its text."""
+        found: Set[int] = set()
+        section = str(section or "").upper()
+        if section:
+            found.update(self._section_articles(section))
+        if self._regex is not None and text:
+            for m in self._regex.finditer(text):
+                found.update(self._articles.get(m.group(1).lower(), ()))
+        return sorted(found)
+
+
+_lock = threading.Lock()
+# (mtime of legal_links.json or None, mapping, matcher)
+_state: Tuple[int | None, Dict[str, Dict], LinkMatcher] | None = None
+
+
+def _links_mtime() -> int | None:
+    try:
+        return os.stat(LEGAL_LINKS_PATH).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _read_links() -> Dict[str, Dict]:
+    """Load cross-link mapping between constitutional articles and statutory sections/keywords.
+
+    JSON format example:
+    {
+      "19(1)(a)": {"Linked_Sections": ["69A IT Act", "69 IT Act"], "Keywords": ["speech","ban","public order"]},
+      "19(2)": {"Linked_Sections": ["69A IT Act"], "Keywords": ["reasonable restriction","public order","decency","morality","security of state"]}
+    }
+    """
+    try:
+        if os.path.exists(LEGAL_LINKS_PATH):
+            with open(LEGAL_LINKS_PATH, "r", encoding="utf-8") as f:
+                data = json.load(f)
+                if isinstance(data, dict):
+                    return data
+    except Exception:
+        pass
+    return DEFAULT_LEGAL_LINKS
+
+
+def _current() -> Tuple[int | None, Dict[str, Dict], LinkMatcher]:
+    global _state
+    mtime = _links_mtime()
+    state = _state
+    if state is not None and state[0] == mtime:
+        return state
+    with _lock:
+        if _state is None or _state[0] != mtime:
+            mapping = _read_links()
+            _state = (mtime, mapping, LinkMatcher(mapping))
+        return _state
+
+
+def load_legal_links() -> Dict[str, Dict]:
+    """Current link mapping; reloaded when legal_links.json changes on disk."""
+    return _current()[1]
+
+
+def get_link_matcher() -> LinkMatcher:
+    """Compiled matcher for the current link mapping."""
+    return _current()[2]
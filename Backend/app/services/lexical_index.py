@@ -0,0 +1,224 @@
+from __future__ import annotations
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+try:
+    import fcntl  # POSIX; on Windows (single dev worker) saves are not cross-process locked
+except ImportError:
+    fcntl = None
+
+INDEX_DIR = os.path.join('.data', 'lexical')
+
+os.makedirs(INDEX_DIR, exist_ok=True)
+
+# Alphanumeric tokens keep statutory ids like "69a" or "21a" intact
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    "the", "of", "and", "to", "in", "a", "an", "or", "by", "for", "on", "is", "be", "as", "at", "any",
+    "such", "with", "that", "this", "which", "it", "its", "shall", "may", "from", "are", "was", "were",
+    "what", "who", "how", "does", "do", "can", "i", "my", "me",
+}
+
+
+def tokenize(text: str) -> List[str]:
+    return [t for t in _TOKEN_RE.findall((text or "").lower()) if t not in _STOPWORDS and (len(t) > 1 or t.isdigit())]
+
+
+class LexicalIndex:
+    """In-process BM25 inverted index over chunk text for one Qdrant collection.
+
+    Keyed by Qdrant point id. Built incrementally by ingestion, pruned on document delete,
+    persisted as JSON under .data/lexical and reloaded when another worker rewrites it.
+
+    Several workers may update the same index. Each keeps a log of its unsaved changes;
+    save() takes an exclusive lock file, reloads the index from disk, replays the log
+    on top and only then replaces the file, so concurrent writers never drop each
+    other's postings. Unsaved changes are also replayed when a reload happens before the
+    save.
+    """
+
+    k1 = 1.2
+    b = 0.75
+
+    def __init__(self, collection: str):
+        self.collection = collection
+        self.path = os.path.join(INDEX_DIR, f"{collection}.json")
+        self._lock = threading.RLock()
+        self._postings: Dict[str, Dict[str, int]] = {}  # term -> {point_id: tf}
+        self._docs: Dict[str, Dict] = {}  # point_id -> {doc_id, chunk_id, len, terms}
+        self._total_len = 0
+        self._mtime: Optional[int] = None
+        # Changes not yet saved: ("add", pid, entry, tf) | ("remove_doc", doc_id) | ("clear",)
+        self._pending: List[Tuple] = []
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    # -- persistence --
+    def _file_mtime(self) -> Optional[int]:
+        try:
+            return os.stat(self.path).st_mtime_ns
+        except OSError:
+            return None
+
+    def _load(self):
+        mtime = self._file_mtime()
+        self._postings, self._docs, self._total_len = {}, {}, 0
+        if mtime is not None:
+            try:
+                with open(self.path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                self._postings = data.get("postings", {})
+                self._docs = data.get("docs", {})
+                self._total_len = sum(int(d.get("len", 0)) for d in self._docs.values())
+            except Exception:
+                # Corrupt/partial file: start empty; a rebuild can repopulate it
+                self._postings, self._docs, self._total_len = {}, {}, 0
+        self._mtime = mtime
+
+    def _refresh(self):
+        if self._file_mtime() != self._mtime:
+            self._load()
+            self._replay()
+
+    def _replay(self):
+        for op in self._pending:
+            if op[0] == "add":
+                self._apply_add(*op[1:])
+            elif op[0] == "remove_doc":
+                self._apply_remove_doc(op[1])
+            elif op[0] == "clear":
+                self._postings, self._docs, self._total_len = {}, {}, 0
+
+    def save(self):
+        with self._lock:
+            if not self._pending:
+                return
+            with open(self.path + ".lock", 'a') as lock_file:
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    # Merge with whatever other workers saved since this copy was loaded
+                    self._refresh()
+                    tmp = f"{self.path}.{os.getpid()}.tmp"
+                    with open(tmp, 'w', encoding='utf-8') as f:
+                        json.dump({"postings": self._postings, "docs": self._docs}, f, ensure_ascii=False)
+                    os.replace(tmp, self.path)
+                    self._mtime = self._file_mtime()
+                    self._pending = []
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    # -- updates --
+    def add(self, point_ids: Iterable[str], payloads: Iterable[Dict]):
+        with self._lock:
+            self._refresh()
+            for pid, payload in zip(point_ids, payloads):
+                pid = str(pid)
+                tokens = tokenize((payload or {}).get("text") or "")
+                tf = dict(Counter(tokens))
+                entry = {
+                    "doc_id": payload.get("doc_id"),
+                    "chunk_id": payload.get("chunk_id"),
+                    "len": len(tokens),
+                    "terms": list(tf.keys()),
+                }
+                self._apply_add(pid, entry, tf)
+                self._pending.append(("add", pid, entry, tf))
+
+    def _apply_add(self, pid: str, entry: Dict, tf: Dict[str, int]):
+        if pid in self._docs:
+            self._remove_point(pid)
+        for term, n in tf.items():
+            self._postings.setdefault(term, {})[pid] = n
+        self._docs[pid] = dict(entry)
+        self._total_len += int(entry.get("len", 0))
+
+    def _remove_point(self, pid: str):
+        info = self._docs.pop(pid, None)
+        if not info:
+            return
+        self._total_len -= int(info.get("len", 0))
+        for term in info.get("terms", []):
+            plist = self._postings.get(term)
+            if plist is not None:
+                plist.pop(pid, None)
+                if not plist:
+                    del self._postings[term]
+
+    def _apply_remove_doc(self, doc_id: str) -> int:
+        pids = [pid for pid, d in self._docs.items() if d.get("doc_id") == doc_id]
+        for pid in pids:
+            self._remove_point(pid)
+        return len(pids)
+
+    def remove_doc(self, doc_id: str) -> int:
+        with self._lock:
+            self._refresh()
+            n = self._apply_remove_doc(doc_id)
+            if n:
+                self._pending.append(("remove_doc", doc_id))
+            return n
+
+    def clear(self):
+        with self._lock:
+            self._postings, self._docs, self._total_len = {}, {}, 0
+            # Earlier unsaved changes are superseded
+            self._pending = [("clear",)]
+
+    # -- query --
+    def search(self, query: str, top_k: int = 10, allowed_doc_ids: Optional[Set[str]] = None) -> List[Tuple[str, float, Dict]]:
+        """Return [(point_id, bm25_score, {doc_id, chunk_id})] best first."""
+        with self._lock:
+            self._refresh()
+            n_docs = len(self._docs)
+            if not n_docs:
+                return []
+            avgdl = (self._total_len / n_docs) or 1.0
+            scores: Dict[str, float] = {}
+            for term in set(tokenize(query)):
+                plist = self._postings.get(term)
+                if not plist:
+                    continue
+                df = len(plist)
+                idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+                for pid, tf in plist.items():
+                    dl = self._docs[pid].get("len", 0)
+                    denom = tf + self.k1 * (1.0 - self.b + self.b * dl / avgdl)
+                    scores[pid] = scores.get(pid, 0.0) + idf * tf * (self.k1 + 1.0) / denom
+            if allowed_doc_ids is not None:
+                scores = {pid: s for pid, s in scores.items() if self._docs[pid].get("doc_id") in allowed_doc_ids}
+            best = sorted(scores.items(), key=lambda x: x[1], reverse=True)[:top_k]
+            return [
+                (pid, sc, {"doc_id": self._docs[pid].get("doc_id"), "chunk_id": self._docs[pid].get("chunk_id")})
+                for pid, sc in best
+            ]
+
+
+_indexes: Dict[str, LexicalIndex] = {}
+_registry_lock = threading.Lock()
+
+
+def get_lexical_index(collection: str) -> LexicalIndex:
+    with _registry_lock:
+        idx = _indexes.get(collection)
+        if idx is None:
+            idx = LexicalIndex(collection)
+            _indexes[collection] = idx
+        return idx
+
+
+def drop_lexical_index(collection: str):
+    with _registry_lock:
+        _indexes.pop(collection, None)
+        try:
+            os.remove(os.path.join(INDEX_DIR, f"{collection}.json"))
+        except OSError:
+            pass
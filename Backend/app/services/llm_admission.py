@@ -0,0 +1,315 @@
+"""Admission control for LLM calls.
+
+One ProviderLimiter per provider bounds concurrent calls and, optionally, tokens per
+minute (a token bucket charged with prompt tokens + max_tokens up front and trued up
+with the actual output afterwards). Calls that cannot start wait in a bounded
+priority queue: interactive chat is always admitted before background work
+(NyayShala generation, warmup), and background calls never take the last
+settings.llm_interactive_reserved_slots slots. When the queue is full an interactive
+call pushes out the newest background waiter; otherwise a full queue or an expired
+wait raises LLMOverloadedError, which the API maps to 503.
+
+Works for both threads and asyncio tasks; waiters are woken on release and re-check
+periodically so that token-bucket refills are noticed.
+"""
+from __future__ import annotations
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+PRIORITIES = {"interactive": 0, "background": 1}
+
+# Waiters re-check at this interval (token bucket refills are not signalled)
+_POLL_SECONDS = 0.25
+
+
+class LLMOverloadedError(RuntimeError):
+    """Raised when an LLM call cannot be admitted (queue full or wait timed out)."""
+
+
+class _Waiter:
+    __slots__ = ("priority", "seq", "tokens", "event", "loop", "future", "granted", "cancelled", "evicted", "queued_at")
+
+    def __init__(self, priority: int, seq: int, tokens: int):
+        self.priority = priority
+        self.seq = seq
+        self.tokens = tokens
+        self.event: Optional[threading.Event] = None
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.future: Optional[asyncio.Future] = None
+        self.granted = False
+        self.cancelled = False
+        self.evicted = False  # pushed out of a full queue by an interactive call
+        self.queued_at = time.monotonic()
+
+    def __lt__(self, other: "_Waiter") -> bool:
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def wake(self):
+        if self.event is not None:
+            self.event.set()
+        elif self.future is not None and self.loop is not None:
+            self.loop.call_soon_threadsafe(_resolve, self.future)
+
+
+def _resolve(fut: asyncio.Future):
+    if not fut.done():
+        fut.set_result(True)
+
+
+class Slot:
+    """An admitted call; use as a (async) context manager around the provider request."""
+
+    def __init__(self, limiter: "ProviderLimiter", priority: str, tokens: int):
+        self.limiter = limiter
+        self.priority = priority
+        self.reserved = tokens
+        self.used: Optional[int] = None
+        self._waiter: Optional[_Waiter] = None
+
+    def charge(self, tokens: int):
+        """Actual tokens consumed; the difference to the reservation is refunded on exit."""
+        self.used = tokens
+
+    def __enter__(self) -> "Slot":
+        self._waiter = self.limiter.acquire(self.priority, self.reserved)
+        return self
+
+    def __exit__(self, *exc):
+        self.limiter.release(self._waiter, self.used)
+
+    async def __aenter__(self) -> "Slot":
+        self._waiter = await self.limiter.aacquire(self.priority, self.reserved)
+        return self
+
+    async def __aexit__(self, *exc):
+        self.limiter.release(self._waiter, self.used)
+
+
+class ProviderLimiter:
+    def __init__(self, name: str, max_concurrency: int, tokens_per_minute: int, max_queue: int,
+                 queue_timeout_ms: int, interactive_reserved: int):
+        self.name = name
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.tpm = max(0, int(tokens_per_minute))
+        self.max_queue = max(0, int(max_queue))
+        self.timeout = max(0, int(queue_timeout_ms)) / 1000.0
+        self.reserved = min(max(0, int(interactive_reserved)), self.max_concurrency - 1)
+        self._lock = threading.Lock()
+        self._heap: List[_Waiter] = []
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._bucket = float(self.tpm)
+        self._refilled = time.monotonic()
+        self.admitted = 0
+        self.queued = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.peak_queue = 0
+        self._wait_total = 0.0
+
+    # -- internal helpers (caller holds the lock) --
+    def _refill(self):
+        if not self.tpm:
+            return
+        now = time.monotonic()
+        self._bucket = min(float(self.tpm), self._bucket + (now - self._refilled) * self.tpm / 60.0)
+        self._refilled = now
+
+    def _can_admit(self, priority: int, tokens: int) -> bool:
+        limit = self.max_concurrency - (self.reserved if priority > 0 else 0)
+        if self._in_flight >= limit:
+            return False
+        # A call larger than the whole budget goes through once the bucket is full
+        return not self.tpm or self._bucket >= min(tokens, self.tpm)
+
+    def _grant(self, w: _Waiter):
+        self._in_flight += 1
+        if self.tpm:
+            self._bucket -= w.tokens
+        w.granted = True
+        self.admitted += 1
+        self._wait_total += time.monotonic() - w.queued_at
+
+    def _dispatch(self):
+        self._refill()
+        while self._heap:
+            head = self._heap[0]
+            if head.cancelled:
+                heapq.heappop(self._heap)
+                continue
+            if not self._can_admit(head.priority, head.tokens):
+                break
+            heapq.heappop(self._heap)
+            self._grant(head)
+            head.wake()
+
+    def _enqueue(self, priority: str, tokens: int) -> _Waiter:
+        w = _Waiter(PRIORITIES.get(priority, 0), next(self._seq), max(0, int(tokens)))
+        self._refill()
+        if not self._heap and self._can_admit(w.priority, w.tokens):
+            self._grant(w)
+            return w
+        if len(self._heap) >= self.max_queue and not self._evict_for(w):
+            self.rejected_full += 1
+            raise LLMOverloadedError(f"LLM queue for '{self.name}' is full")
+        heapq.heappush(self._heap, w)
+        self.queued += 1
+        self.peak_queue = max(self.peak_queue, len(self._heap))
+        # Higher priority than the blocked head (e.g. interactive behind background): may start now
+        self._dispatch()
+        return w
+
+    def _evict_for(self, w: _Waiter) -> bool:
+        """Make room for w by rejecting the newest lower-priority waiter."""
+        victims = [x for x in self._heap if not x.cancelled and x.priority > w.priority]
+        if not victims:
+            return False
+        victim = max(victims)
+        victim.evicted = True
+        self._discard(victim)
+        self.rejected_full += 1
+        victim.wake()
+        return True
+
+    def _discard(self, w: _Waiter):
+        """Take a waiter that gave up out of the queue so it no longer counts toward max_queue."""
+        w.cancelled = True
+        try:
+            self._heap.remove(w)
+        except ValueError:
+            return
+        heapq.heapify(self._heap)
+
+    def _poll(self, w: _Waiter, deadline: float) -> bool:
+        """Re-dispatch after a wait; True when granted. Raises once the deadline passed."""
+        with self._lock:
+            if w.evicted:
+                raise LLMOverloadedError(f"LLM queue for '{self.name}' is full")
+            if not w.granted:
+                self._dispatch()
+            if w.granted:
+                return True
+            if time.monotonic() >= deadline:
+                self._discard(w)
+                self.rejected_timeout += 1
+                raise LLMOverloadedError(f"Timed out waiting for an LLM slot on '{self.name}'")
+            return False
+
+    # -- public API --
+    def slot(self, priority: str = "interactive", tokens: int = 0) -> Slot:
+        return Slot(self, priority, tokens)
+
+    def acquire(self, priority: str, tokens: int) -> _Waiter:
+        with self._lock:
+            w = self._enqueue(priority, tokens)
+            if w.granted:
+                return w
+            w.event = threading.Event()
+        deadline = time.monotonic() + self.timeout
+        while True:
+            w.event.wait(timeout=max(0.0, min(_POLL_SECONDS, deadline - time.monotonic())))
+            if self._poll(w, deadline):
+                return w
+
+    async def aacquire(self, priority: str, tokens: int) -> _Waiter:
+        with self._lock:
+            w = self._enqueue(priority, tokens)
+            if w.granted:
+                return w
+            w.loop = asyncio.get_running_loop()
+            w.future = w.loop.create_future()
+        deadline = time.monotonic() + self.timeout
+        try:
+            while True:
+                try:
+                    await asyncio.wait_for(
+                        asyncio.shield(w.future), timeout=max(0.0, min(_POLL_SECONDS, deadline - time.monotonic()))
+                    )
+                except asyncio.TimeoutError:
+                    pass
+                if self._poll(w, deadline):
+                    return w
+        except asyncio.CancelledError:
+            # Cancelled while queued (e.g. the losing side of a hedged call)
+            with self._lock:
+                self._discard(w)
+                granted = w.granted
+            if granted:
+                self.release(w, 0)
+            raise
+
+    def release(self, w: Optional[_Waiter], used: Optional[int] = None):
+        if w is None or not w.granted:
+            return
+        with self._lock:
+            w.granted = False
+            self._in_flight -= 1
+            if self.tpm and used is not None:
+                self._bucket = min(float(self.tpm), self._bucket + w.tokens - used)
+            self._dispatch()
+
+    def saturated(self, priority: str = "interactive") -> bool:
+        """True when a new call of this priority would be rejected right away."""
+        prio = PRIORITIES.get(priority, 0)
+        with self._lock:
+            if not self._heap and self._can_admit(prio, 0):
+                return False
+            if any(not x.cancelled and x.priority > prio for x in self._heap):
+                return False  # would evict a background waiter
+            return len(self._heap) >= self.max_queue
+
+    def stats(self) -> Dict:
+        with self._lock:
+            self._refill()
+            waiting = [w for w in self._heap if not w.cancelled]
+            return {
+                "in_flight": self._in_flight,
+                "max_concurrency": self.max_concurrency,
+                "queue_depth": len(waiting),
+                "queue_depth_interactive": sum(1 for w in waiting if w.priority == 0),
+                "queue_depth_background": sum(1 for w in waiting if w.priority > 0),
+                "peak_queue_depth": self.peak_queue,
+                "max_queue": self.max_queue,
+                "admitted": self.admitted,
+                "queued": self.queued,
+                "rejected_full": self.rejected_full,
+                "rejected_timeout": self.rejected_timeout,
+                "avg_wait_ms": round(1000.0 * self._wait_total / self.admitted, 1) if self.admitted else 0.0,
+                "tokens_per_minute": self.tpm or None,
+                "tokens_available": int(self._bucket) if self.tpm else None,
+            }
+
+
+_limiters: Dict[str, ProviderLimiter] = {}
+_limiters_lock = threading.Lock()
+
+
+def get_limiter(provider: str) -> ProviderLimiter:
+    lim = _limiters.get(provider)
+    if lim is None:
+        with _limiters_lock:
+            lim = _limiters.get(provider)
+            if lim is None:
+                lim = ProviderLimiter(
+                    provider,
+                    settings.llm_max_concurrency,
+                    (settings.llm_tokens_per_minute or {}).get(provider, 0),
+                    settings.llm_queue_max,
+                    settings.llm_queue_timeout_ms,
+                    settings.llm_interactive_reserved_slots,
+                )
+                _limiters[provider] = lim
+    return lim
+
+
+def admission_stats() -> Dict:
+    with _limiters_lock:
+        limiters = dict(_limiters)
+    return {name: lim.stats() for name, lim in limiters.items()}
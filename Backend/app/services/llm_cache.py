@@ -0,0 +1,236 @@
+"""Content-addressed cache of LLM completions.
+
+Entries are keyed by a hash of everything that determines the output of a
+low-temperature call: provider, model, messages, temperature, top_p and max_tokens.
+Retrieved contexts are part of the messages, so a corpus change yields new keys and
+stale entries simply age out; there is nothing to invalidate.
+
+Backends (settings.llm_cache_backend):
+  sqlite - local file shared by the workers of one host (WAL mode)
+  redis  - shared by every worker through REDIS_URL; the size limit is left to the
+           server's maxmemory policy
+  off    - disabled
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+# Evict over-limit and expired rows every this many writes rather than on each one
+_EVICT_EVERY = 64
+
+
+def make_key(
+    provider: str,
+    model: str,
+    messages: List[Dict[str, str]],
+    temperature: float,
+    top_p: float | None,
+    max_tokens: int | None,
+) -> str:
+    blob = json.dumps(
+        {
+            "provider": provider,
+            "model": model,
+            "messages": [{"role": m.get("role"), "content": m.get("content")} for m in messages],
+            "temperature": temperature,
+            "top_p": top_p,
+            "max_tokens": max_tokens,
+        },
+        ensure_ascii=False,
+        sort_keys=True,
+        separators=(",", ":"),
+    )
+    return hashlib.sha256(blob.encode("utf-8")).hexdigest()
+
+
+class _SQLiteBackend:
+    def __init__(self, path: str, max_items: int, ttl_seconds: int):
+        self.path = path
+        self.max_items = max_items
+        self.ttl = ttl_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=1.0, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS llm_cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_accessed ON llm_cache(accessed)")
+        self._writes = 0
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if self.ttl and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM llm_cache WHERE key = ?", (key,))
+                return None
+            self._conn.execute("UPDATE llm_cache SET accessed = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+                (key, value, now, now),
+            )
+            self._writes += 1
+            if self._writes % _EVICT_EVERY == 0:
+                self._evict(now)
+
+    def _evict(self, now: float):
+        if self.ttl:
+            self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (now - self.ttl,))
+        if self.max_items:
+            # Least recently used rows beyond the limit
+            self._conn.execute(
+                "DELETE FROM llm_cache WHERE key IN "
+                "(SELECT key FROM llm_cache ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+                (self.max_items,),
+            )
+
+    def clear(self) -> int:
+        with self._lock:
+            return self._conn.execute("DELETE FROM llm_cache").rowcount
+
+    def size(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM llm_cache").fetchone()[0]
+
+
+class _RedisBackend:
+    PREFIX = "llm:"
+
+    def __init__(self, url: str, ttl_seconds: int):
+        import redis  # optional dependency
+
+        self.ttl = ttl_seconds
+        self._redis = redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.2)
+
+    def get(self, key: str) -> Optional[str]:
+        raw = self._redis.get(self.PREFIX + key)
+        return raw.decode("utf-8") if raw is not None else None
+
+    def put(self, key: str, value: str):
+        if self.ttl:
+            self._redis.setex(self.PREFIX + key, self.ttl, value.encode("utf-8"))
+        else:
+            self._redis.set(self.PREFIX + key, value.encode("utf-8"))
+
+    def clear(self) -> int:
+        n = 0
+        for k in self._redis.scan_iter(match=self.PREFIX + "*", count=500):
+            n += self._redis.delete(k)
+        return n
+
+    def size(self) -> int:
+        return -1  # not tracked; see the server's keyspace stats
+
+
+class LLMResponseCache:
+    """Backend-agnostic front with hit/miss counters. Backend errors count as misses."""
+
+    def __init__(self, backend: str, max_items: int, ttl_seconds: int):
+        self.backend_name = (backend or "off").lower().strip()
+        self.max_items = max(0, int(max_items))
+        self.ttl = max(0, int(ttl_seconds))
+        self._backend = None
+        try:
+            if self.backend_name == "sqlite":
+                self._backend = _SQLiteBackend(settings.llm_cache_path, self.max_items, self.ttl)
+            elif self.backend_name == "redis":
+                self._backend = _RedisBackend(settings.redis_url, self.ttl)
+        except Exception as e:
+            logger.warning("LLM cache: %s backend unavailable (%s); caching disabled", self.backend_name, e)
+            self._backend = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.errors = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self._backend is not None
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def get(self, *keys: str) -> Optional[str]:
+        """First cached value among `keys` (e.g. one key per failover provider)."""
+        if self._backend is None:
+            return None
+        value = None
+        for key in keys:
+            try:
+                value = self._backend.get(key)
+            except Exception:
+                self._count("errors")
+            if value is not None:
+                break
+        self._count("hits" if value is not None else "misses")
+        return value
+
+    def put(self, key: str, value: str):
+        # Empty completions are usually failures worth retrying, not answers
+        if self._backend is None or not value:
+            return
+        try:
+            self._backend.put(key, value)
+            self._count("stores")
+        except Exception:
+            self._count("errors")
+
+    def clear(self) -> int:
+        if self._backend is None:
+            return 0
+        try:
+            return self._backend.clear()
+        except Exception:
+            self._count("errors")
+            return 0
+
+    def stats(self) -> Dict:
+        size = None
+        if self._backend is not None:
+            try:
+                size = self._backend.size()
+            except Exception:
+                size = None
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "backend": self.backend_name if self._backend is not None else "off",
+                "size": size,
+                "max_items": self.max_items,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / total, 4) if total else 0.0,
+                "stores": self.stores,
+                "errors": self.errors,
+            }
+
+
+llm_cache = LLMResponseCache(
+    settings.llm_cache_backend,
+    settings.llm_cache_size,
+    settings.llm_cache_ttl_seconds,
+)
@@ -1,48 +1,285 @@
-from typing import Iterable, List, Dict
+import asyncio
+import hashlib
+import queue
+import random
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import FIRST_COMPLETED, Future, wait
+from typing import Callable, Iterable, List, Dict, Optional, Tuple
 from app.core.config import settings
+from app.services.llm_cache import llm_cache, make_key as make_cache_key
+from app.services.llm_admission import LLMOverloadedError, admission_stats, get_limiter
+from app.services.token_budget import count_message_tokens, count_tokens, estimate_tokens
 
 # OpenAI
-from openai import OpenAI
+from openai import AsyncOpenAI, OpenAI
 
 # Google Gemini
 import google.generativeai as genai
 
 RoleMsg = Dict[str, str]  # {"role": "system|user|assistant", "content": "..."}
+# (priority, prompt tokens, output tokens to reserve) for admission control
+Admission = Tuple[str, int, int]
+# Output reservation when a call sets no max_tokens
+_DEFAULT_OUTPUT_RESERVE = 1024
+
+
+# Process-wide pool: SDK clients (and their HTTP connection pools), the Gemini model id
+# known to work and GenerativeModel objects per (model id, system instruction). Every
+# LLMClient shares it, so a failed candidate probe or a TLS handshake is paid once per
+# process rather than once per request.
+_pool_lock = threading.RLock()
+_openai_client: Optional[OpenAI] = None
+_async_openai_client: Optional[AsyncOpenAI] = None
+_genai_configured = False
+_resolved_models: Dict[str, str] = {}  # provider -> working model id
+_gemini_models: "OrderedDict[Tuple[str, str], genai.GenerativeModel]" = OrderedDict()
+_GEMINI_MODEL_CACHE_SIZE = 32
+_pool_stats = {
+    "model_hits": 0, "model_misses": 0, "candidate_failures": 0, "hedges": 0, "hedge_wins": 0,
+    "prompt_tokens": 0, "completion_tokens": 0,
+}
+_shared_client: Optional["LLMClient"] = None
+
+
+def _in_thread(fn: Callable, *args) -> Future:
+    """Run fn(*args) on its own daemon thread.
+
+    Hedged and streamed provider calls block for seconds and may first wait in the
+    admission queue; a fixed-size pool would cap concurrent streams below the admission
+    limits and park the excess in a queue with no timeout.
+    """
+    fut: Future = Future()
+
+    def _run():
+        if not fut.set_running_or_notify_cancel():
+            return
+        try:
+            fut.set_result(fn(*args))
+        except BaseException as e:
+            fut.set_exception(e)
+
+    threading.Thread(target=_run, name="llm-call", daemon=True).start()
+    return fut
+
+
+class _Superseded(Exception):
+    """A hedged racer was admitted after the other provider had already answered."""
+
+
+def _openai_sdk() -> OpenAI:
+    global _openai_client
+    if _openai_client is None:
+        with _pool_lock:
+            if _openai_client is None:
+                _openai_client = OpenAI(api_key=settings.openai_api_key)
+    return _openai_client
+
+
+def _async_openai_sdk() -> AsyncOpenAI:
+    global _async_openai_client
+    if _async_openai_client is None:
+        with _pool_lock:
+            if _async_openai_client is None:
+                _async_openai_client = AsyncOpenAI(api_key=settings.openai_api_key)
+    return _async_openai_client
+
+
+def _configure_genai():
+    global _genai_configured
+    if not _genai_configured:
+        with _pool_lock:
+            if not _genai_configured:
+                genai.configure(api_key=settings.google_api_key)
+                _genai_configured = True
+
+
+def _remember_model(provider: str, model_id: str):
+    # First success wins; a transient error on the remembered model does not replace it
+    if provider not in _resolved_models:
+        with _pool_lock:
+            _resolved_models.setdefault(provider, model_id)
+
+
+class LLMUnavailableError(RuntimeError):
+    """Raised when every configured provider is failing or has an open circuit."""
+
+
+class CircuitBreaker:
+    """Per-provider circuit breaker.
+
+    Opens after `failure_threshold` consecutive failures, or when the p95 latency of
+    recent successful calls (time to first token for streams) exceeds `p95_ms`. After
+    `cooldown_seconds` a single trial call is let through (half-open); its outcome
+    closes the circuit again or re-opens it.
+    """
+
+    def __init__(self, name: str, failure_threshold: int, p95_ms: int, cooldown_seconds: float,
+                 window: int = 50, min_samples: int = 10):
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.p95_ms = max(0, int(p95_ms))
+        self.cooldown = max(0.0, float(cooldown_seconds))
+        self.min_samples = min_samples
+        self._latencies: deque = deque(maxlen=window)
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self._opened_at = 0.0
+        self._trial_in_flight = False
+        self._failures = 0
+        self.trips = 0
+        self.last_trip_reason: Optional[str] = None
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.cooldown:
+                    return False
+                self.state = "half_open"
+                self._trial_in_flight = False
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    return False
+                self._trial_in_flight = True
+            return True
+
+    def _p95_ms(self) -> float:
+        lat = sorted(self._latencies)
+        return lat[min(len(lat) - 1, int(0.95 * len(lat)))] * 1000.0 if lat else 0.0
+
+    def _trip(self, reason: str):
+        self.state = "open"
+        self._opened_at = time.monotonic()
+        self._trial_in_flight = False
+        self._latencies.clear()
+        self.trips += 1
+        self.last_trip_reason = reason
+
+    def success(self, latency_s: float):
+        with self._lock:
+            self._failures = 0
+            if self.state == "half_open":
+                self.state = "closed"
+                self._trial_in_flight = False
+            self._latencies.append(latency_s)
+            if self.p95_ms and len(self._latencies) >= self.min_samples and self._p95_ms() > self.p95_ms:
+                self._trip(f"p95 {self._p95_ms():.0f}ms > {self.p95_ms}ms")
+
+    def release_trial(self):
+        """End a half-open trial that never reached the provider (rejected by admission,
+        superseded or cancelled by a hedge) without counting it either way."""
+        with self._lock:
+            if self.state == "half_open":
+                self._trial_in_flight = False
+
+    def failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == "half_open" or self._failures >= self.failure_threshold:
+                self._trip(f"{self._failures} consecutive failures")
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self._failures,
+                "p95_ms": round(self._p95_ms(), 1),
+                "samples": len(self._latencies),
+                "trips": self.trips,
+                "last_trip_reason": self.last_trip_reason,
+            }
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+
+
+def _breaker(provider: str) -> CircuitBreaker:
+    br = _breakers.get(provider)
+    if br is None:
+        with _pool_lock:
+            br = _breakers.setdefault(provider, CircuitBreaker(
+                provider,
+                settings.llm_breaker_failures,
+                settings.llm_breaker_p95_ms,
+                settings.llm_breaker_cooldown_seconds,
+            ))
+    return br
+
+
+def _provider_configured(name: str) -> bool:
+    if name == "openai":
+        return bool(settings.openai_api_key)
+    if name == "google":
+        return bool(settings.google_api_key)
+    return name == "mock"
+
+
+def _provider_order() -> List[str]:
+    """Failover order: settings.llm_providers, else llm_provider followed by the other configured one."""
+    if settings.llm_providers:
+        order = [p.lower().strip() for p in settings.llm_providers]
+    else:
+        desired = (settings.llm_provider or "").lower().strip()
+        # Unknown desired value: try google then openai
+        order = ["openai", "google"] if desired == "openai" else ["google", "openai"]
+    out: List[str] = []
+    for p in order:
+        if p in ("openai", "google", "mock") and p not in out and _provider_configured(p):
+            out.append(p)
+    return out
+
+
+def get_llm_client() -> "LLMClient":
+    """Shared, thread-safe LLMClient for the process."""
+    global _shared_client
+    if _shared_client is None:
+        with _pool_lock:
+            if _shared_client is None:
+                _shared_client = LLMClient()
+    return _shared_client
+
+
+def llm_saturated(priority: str = "interactive") -> bool:
+    """True when every provider would reject a new call of this priority (callers answer 503)."""
+    return all(get_limiter(p).saturated(priority) for p in get_llm_client().providers)
+
+
+def llm_pool_stats() -> Dict:
+    admission = admission_stats()
+    with _pool_lock:
+        return {
+            "provider": getattr(_shared_client, "provider", None),
+            "providers": {name: br.stats() for name, br in _breakers.items()},
+            "admission": admission,
+            "resolved_models": dict(_resolved_models),
+            "gemini_models_cached": len(_gemini_models),
+            **_pool_stats,
+        }
 
 
 class LLMClient:
+    """Provider router over OpenAI, Gemini and a local mock.
+
+    Calls go to the first provider (self.provider) whose circuit is closed and fail over
+    down self.providers on errors. With settings.llm_hedge_after_ms set, a call that has
+    not answered (or, when streaming, produced its first token) by the deadline is also
+    sent to the next healthy provider and the first to respond wins.
+    """
+
     def __init__(self):
-        desired = (settings.llm_provider or "").lower().strip()
         # Prefer Gemini 2.0 Flash by default if not explicitly set
         self.model = settings.llm_model or "models/gemini-2.0-flash"
+        self.providers = _provider_order()
 
-        # Attempt to satisfy desired provider; if key missing, fall back to the other if available
-        def _init_openai():
-            if not settings.openai_api_key:
-                return False
-            self.provider = "openai"
-            self._openai = OpenAI(api_key=settings.openai_api_key)
-            return True
-
-        def _init_google():
-            if not settings.google_api_key:
-                return False
-            self.provider = "google"
-            genai.configure(api_key=settings.google_api_key)
+        if "openai" in self.providers:
+            self._openai = _openai_sdk()
+        if "google" in self.providers:
+            _configure_genai()
             # Defer model creation to call-time so we can apply robust model fallbacks
             self._gemini = None
-            return True
-
-        ok = False
-        if desired == "openai":
-            ok = _init_openai() or _init_google()
-        elif desired == "google":
-            ok = _init_google() or _init_openai()
-        else:
-            # Unknown desired value: try google then openai
-            ok = _init_google() or _init_openai()
 
-        if not ok:
+        if not self.providers:
             # If no provider is configured, fall back to a lightweight local mock provider
             # This keeps the app usable for development without external API keys
             import warnings
@@ -50,9 +287,9 @@ class LLMClient:
             warnings.warn(
                 "No LLM API keys found — falling back to local mock LLM for development."
             )
-            self.provider = "mock"
-            self._mock = True
-            return
+            self.providers = ["mock"]
+        self.provider = self.providers[0]
+        self._mock = self.provider == "mock"
 
     def _norm_ids(self, model_id: str) -> List[str]:
         mid = (model_id or "").strip()
@@ -82,6 +319,11 @@ class LLMClient:
         ]:
             cands.extend(self._norm_ids(m))
 
+        # The model that last worked goes first so failed probes are not repeated
+        resolved = _resolved_models.get("google")
+        if resolved:
+            cands.insert(0, resolved)
+
         # Deduplicate preserving order
         seen = set()
         out: List[str] = []
@@ -91,16 +333,89 @@ class LLMClient:
                 seen.add(m)
         return out
 
-    def generate(
-        self,
+    def _openai_model(self) -> str:
+        # LLM_MODEL names a Gemini model by default; OpenAI (primary or failover) needs its own id
+        m = settings.llm_model or ""
+        return m if m and "gemini" not in m.lower() else settings.openai_model
+
+    @staticmethod
+    def _gemini_request(
         messages: List[RoleMsg],
-        temperature: float = 0.2,
-        top_p: float | None = None,
-        max_tokens: int | None = None,
-    ) -> str:
-        if self.provider == "openai":
+        temperature: float,
+        top_p: float | None,
+        max_tokens: int | None,
+    ) -> Tuple[str, List[Dict], Dict]:
+        """Gemini: move system prompts into system_instruction; map assistant->model."""
+        sys_text = "\n\n".join(
+            [m["content"] for m in messages if m.get("role") == "system"]
+        ).strip()
+        contents = [
+            {"role": "model" if m["role"] == "assistant" else "user", "parts": [m["content"]]}
+            for m in messages
+            if m.get("role") != "system"
+        ]
+        gen_cfg = {"temperature": temperature}
+        if top_p is not None:
+            gen_cfg["top_p"] = top_p
+        if max_tokens is not None:
+            gen_cfg["max_output_tokens"] = max_tokens
+        return sys_text, contents, gen_cfg
+
+    @staticmethod
+    def _gemini_model(candidate: str, sys_text: str):
+        """GenerativeModel for (candidate, system instruction), reused across requests."""
+        key = (candidate, hashlib.sha1(sys_text.encode("utf-8")).hexdigest() if sys_text else "")
+        with _pool_lock:
+            model = _gemini_models.get(key)
+            if model is not None:
+                _gemini_models.move_to_end(key)
+                _pool_stats["model_hits"] += 1
+                return model
+            _pool_stats["model_misses"] += 1
+        model = (
+            genai.GenerativeModel(candidate, system_instruction=sys_text)
+            if sys_text
+            else genai.GenerativeModel(candidate)
+        )
+        with _pool_lock:
+            _gemini_models[key] = model
+            while len(_gemini_models) > _GEMINI_MODEL_CACHE_SIZE:
+                _gemini_models.popitem(last=False)
+        return model
+
+    def _gemini_ok(self, candidate: str, model):
+        # Cache the working model for subsequent calls (and every other client)
+        self.model = candidate
+        self._gemini = model
+        _remember_model("google", candidate)
+
+    @staticmethod
+    def _gemini_failed(candidate: str, err: Exception):
+        with _pool_lock:
+            _pool_stats["candidate_failures"] += 1
+            # Forget the remembered model only when it is gone, not on rate limits/timeouts
+            msg = str(err).lower()
+            if _resolved_models.get("google") == candidate and ("404" in msg or "not found" in msg):
+                _resolved_models.pop("google", None)
+
+    # ---- mock provider (local stand-in; latency/failures configurable for brownout drills)
+
+    @staticmethod
+    def _mock_reply(messages: List[RoleMsg]) -> str:
+        if settings.llm_mock_failure_rate and random.random() < settings.llm_mock_failure_rate:
+            raise RuntimeError("mock provider failure")
+        # Simple deterministic mock: echo the last user message with a prefix.
+        user_msgs = [m["content"] for m in messages if m.get("role") == "user"]
+        last = user_msgs[-1] if user_msgs else "(no user message)"
+        return f"[mock reply] This is a placeholder response. You asked: {last}"
+
+    # ---- per-provider calls
+
+    def _generate_on(self, provider: str, messages: List[RoleMsg], temperature: float,
+                     top_p: float | None, max_tokens: int | None) -> str:
+        if provider == "openai":
             resp = self._openai.chat.completions.create(
-                model=self.model,
+                model=self._openai_model(),
                 messages=messages,
                 temperature=temperature,
                 top_p=top_p,
@@ -108,59 +423,62 @@ class LLMClient:
                 stream=False,
             )
             return resp.choices[0].message.content or ""
-        elif self.provider == "mock":
-            # Simple deterministic mock: echo the last user message with a prefix.
-            user_msgs = [m["content"] for m in messages if m.get("role") == "user"]
-            last = user_msgs[-1] if user_msgs else "(no user message)"
-            return f"[mock reply] This is a placeholder response. You asked: {last}"
+        elif provider == "mock":
+            if settings.llm_mock_latency_ms:
+                time.sleep(settings.llm_mock_latency_ms / 1000.0)
+            return self._mock_reply(messages)
         else:
-            # Gemini: move system prompts into system_instruction; map assistant->model
-            sys_text = "\n\n".join(
-                [m["content"] for m in messages if m.get("role") == "system"]
-            ).strip()
-            chat_msgs = [m for m in messages if m.get("role") != "system"]
-
-            def _map_role(r: str) -> str:
-                return "model" if r == "assistant" else "user"
-
-            contents = [
-                {"role": _map_role(m["role"]), "parts": [m["content"]]}
-                for m in chat_msgs
-            ]
-            gen_cfg = {"temperature": temperature}
-            if top_p is not None:
-                gen_cfg["top_p"] = top_p
-            if max_tokens is not None:
-                gen_cfg["max_output_tokens"] = max_tokens
+            sys_text, contents, gen_cfg = self._gemini_request(messages, temperature, top_p, max_tokens)
             last_err = None
             for candidate in self._google_candidates():
                 try:
-                    model = (
-                        genai.GenerativeModel(candidate, system_instruction=sys_text)
-                        if sys_text
-                        else genai.GenerativeModel(candidate)
-                    )
+                    model = self._gemini_model(candidate, sys_text)
                     resp = model.generate_content(contents, generation_config=gen_cfg)
-                    # Cache the working model for subsequent calls
-                    self.model = candidate
-                    self._gemini = model
+                    self._gemini_ok(candidate, model)
                     return resp.text or ""
                 except Exception as e:
                     last_err = e
+                    self._gemini_failed(candidate, e)
                     continue
             # If all candidates fail, raise the last error
             raise last_err
 
-    def stream_generate(
-        self,
-        messages: List[RoleMsg],
-        temperature: float = 0.2,
-        top_p: float | None = None,
-        max_tokens: int | None = None,
-    ) -> Iterable[str]:
-        if self.provider == "openai":
+    async def _agenerate_on(self, provider: str, messages: List[RoleMsg], temperature: float,
+                            top_p: float | None, max_tokens: int | None) -> str:
+        if provider == "openai":
+            resp = await _async_openai_sdk().chat.completions.create(
+                model=self._openai_model(),
+                messages=messages,
+                temperature=temperature,
+                top_p=top_p,
+                max_tokens=max_tokens,
+                stream=False,
+            )
+            return resp.choices[0].message.content or ""
+        elif provider == "mock":
+            if settings.llm_mock_latency_ms:
+                await asyncio.sleep(settings.llm_mock_latency_ms / 1000.0)
+            return self._mock_reply(messages)
+        else:
+            sys_text, contents, gen_cfg = self._gemini_request(messages, temperature, top_p, max_tokens)
+            last_err = None
+            for candidate in self._google_candidates():
+                try:
+                    model = self._gemini_model(candidate, sys_text)
+                    resp = await model.generate_content_async(contents, generation_config=gen_cfg)
+                    self._gemini_ok(candidate, model)
+                    return resp.text or ""
+                except Exception as e:
+                    last_err = e
+                    self._gemini_failed(candidate, e)
+                    continue
+            raise last_err
+
+    def _stream_on(self, provider: str, messages: List[RoleMsg], temperature: float,
+                   top_p: float | None, max_tokens: int | None) -> Iterable[str]:
+        if provider == "openai":
             stream = self._openai.chat.completions.create(
-                model=self.model,
+                model=self._openai_model(),
                 messages=messages,
                 temperature=temperature,
                 top_p=top_p,
@@ -171,52 +489,424 @@ class LLMClient:
                 delta = chunk.choices[0].delta
                 if delta and delta.content:
                     yield delta.content
-        elif self.provider == "mock":
+        elif provider == "mock":
             # Stream the mock reply in one chunk for compatibility with streaming clients
-            reply = self.generate(
-                messages, temperature=temperature, top_p=top_p, max_tokens=max_tokens
-            )
-            yield reply
-            return
+            yield self._generate_on(provider, messages, temperature, top_p, max_tokens)
         else:
-            # Gemini: move system into system_instruction; map assistant->model
-            sys_text = "\n\n".join(
-                [m["content"] for m in messages if m.get("role") == "system"]
-            ).strip()
-            chat_msgs = [m for m in messages if m.get("role") != "system"]
-
-            def _map_role(r: str) -> str:
-                return "model" if r == "assistant" else "user"
-
-            contents = [
-                {"role": _map_role(m["role"]), "parts": [m["content"]]}
-                for m in chat_msgs
-            ]
-            gen_cfg = {"temperature": temperature}
-            if top_p is not None:
-                gen_cfg["top_p"] = top_p
-            if max_tokens is not None:
-                gen_cfg["max_output_tokens"] = max_tokens
+            sys_text, contents, gen_cfg = self._gemini_request(messages, temperature, top_p, max_tokens)
             # Iterate candidate models until one streams successfully
             last_err = None
             for candidate in self._google_candidates():
                 try:
-                    model = (
-                        genai.GenerativeModel(candidate, system_instruction=sys_text)
-                        if sys_text
-                        else genai.GenerativeModel(candidate)
-                    )
+                    model = self._gemini_model(candidate, sys_text)
                     for ev in model.generate_content(
                         contents, generation_config=gen_cfg, stream=True
                     ):
                         if getattr(ev, "text", None):
                             yield ev.text
-                    # Cache working model
-                    self.model = candidate
-                    self._gemini = model
+                    self._gemini_ok(candidate, model)
                     return
                 except Exception as e:
                     last_err = e
+                    self._gemini_failed(candidate, e)
                     continue
             # If all failed, re-raise the last error
             raise last_err
+
+    # ---- routing
+
+    def _next_provider(self, pending: List[str]) -> Optional[str]:
+        while pending:
+            provider = pending.pop(0)
+            if _breaker(provider).allow():
+                return provider
+        return None
+
+    @staticmethod
+    def _hedge_after() -> float:
+        return max(0, settings.llm_hedge_after_ms) / 1000.0
+
+    @staticmethod
+    def _timed(provider: str, fn: Callable[[], Tuple[str, str]], admit: Admission,
+               stop: Optional[threading.Event] = None) -> Tuple[str, str]:
+        priority, prompt, reserve = admit
+        settled = False
+        try:
+            # Waiting for admission is not provider latency; the clock starts once admitted
+            with get_limiter(provider).slot(priority, prompt + reserve) as slot:
+                if stop is not None and stop.is_set():
+                    raise _Superseded(provider)
+                slot.charge(prompt)
+                t0 = time.perf_counter()
+                try:
+                    out = fn()
+                except Exception:
+                    settled = True
+                    _breaker(provider).failure()
+                    raise
+                settled = True
+                _breaker(provider).success(time.perf_counter() - t0)
+                slot.charge(prompt + estimate_tokens(out[1]))
+                return out
+        finally:
+            if not settled:
+                _breaker(provider).release_trial()
+
+    def _route(self, call: Callable[[str], Tuple[str, str]], admit: Admission) -> Tuple[str, str]:
+        """Run call(provider) with failover/hedging; call returns (provider, text).
+
+        A provider whose admission queue is full is skipped like a failing one, without
+        counting against its circuit breaker. A hedged loser that is still waiting for
+        admission gives up once the winner answers; one already talking to its provider
+        cannot be interrupted (the SDK calls block) and runs to completion in the
+        background, holding its slot until then.
+        """
+        hedge_s = self._hedge_after()
+        pending = list(self.providers)
+        last_err: Exception | None = None
+        while True:
+            provider = self._next_provider(pending)
+            if provider is None:
+                raise last_err or LLMUnavailableError("No LLM provider available (all circuits open)")
+            if not hedge_s or not pending:
+                try:
+                    return self._timed(provider, lambda: call(provider), admit)
+                except Exception as e:
+                    last_err = e
+                    continue
+            stop = threading.Event()
+            racers = {_in_thread(self._timed, provider, lambda p=provider: call(p), admit, stop): provider}
+            done, _ = wait(racers, timeout=hedge_s)
+            if not done:
+                # Primary is slow: race it against the next healthy provider
+                backup = self._next_provider(pending)
+                if backup is not None:
+                    with _pool_lock:
+                        _pool_stats["hedges"] += 1
+                    racers[_in_thread(self._timed, backup, lambda p=backup: call(p), admit, stop)] = backup
+            remaining = set(racers)
+            try:
+                while remaining:
+                    done, remaining = wait(remaining, return_when=FIRST_COMPLETED)
+                    for fut in done:
+                        try:
+                            out = fut.result()
+                        except Exception as e:
+                            last_err = e
+                            continue
+                        if racers[fut] != provider:
+                            with _pool_lock:
+                                _pool_stats["hedge_wins"] += 1
+                        return out
+            finally:
+                stop.set()
+
+    async def _aroute(self, call, admit: Admission) -> Tuple[str, str]:
+        hedge_s = self._hedge_after()
+        pending = list(self.providers)
+        last_err: Exception | None = None
+        priority, prompt, reserve = admit
+
+        async def _timed(provider: str) -> Tuple[str, str]:
+            settled = False
+            try:
+                async with get_limiter(provider).slot(priority, prompt + reserve) as slot:
+                    slot.charge(prompt)
+                    t0 = time.perf_counter()
+                    try:
+                        out = await call(provider)
+                    except Exception:
+                        settled = True
+                        _breaker(provider).failure()
+                        raise
+                    settled = True
+                    _breaker(provider).success(time.perf_counter() - t0)
+                    slot.charge(prompt + estimate_tokens(out[1]))
+                    return out
+            finally:
+                # Rejected by admission or cancelled as a hedge loser: not an outcome
+                if not settled:
+                    _breaker(provider).release_trial()
+
+        while True:
+            provider = self._next_provider(pending)
+            if provider is None:
+                raise last_err or LLMUnavailableError("No LLM provider available (all circuits open)")
+            if not hedge_s or not pending:
+                try:
+                    return await _timed(provider)
+                except Exception as e:
+                    last_err = e
+                    continue
+            racers = {asyncio.ensure_future(_timed(provider)): provider}
+            done, _ = await asyncio.wait(set(racers), timeout=hedge_s)
+            if not done:
+                backup = self._next_provider(pending)
+                if backup is not None:
+                    with _pool_lock:
+                        _pool_stats["hedges"] += 1
+                    racers[asyncio.ensure_future(_timed(backup))] = backup
+            remaining = set(racers)
+            try:
+                while remaining:
+                    done, remaining = await asyncio.wait(remaining, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        if task.exception() is not None:
+                            last_err = task.exception()
+                            continue
+                        if racers[task] != provider:
+                            with _pool_lock:
+                                _pool_stats["hedge_wins"] += 1
+                        return task.result()
+            finally:
+                # The loser's tokens are not needed
+                for task in remaining:
+                    task.cancel()
+
+    def _pump(self, provider: str, make_stream: Callable[[str], Iterable[str]], out: "queue.Queue",
+              stop: threading.Event, admit: Admission):
+        """Run one provider stream on a worker thread, forwarding (provider, kind, payload)."""
+        priority, prompt, reserve = admit
+        settled = False
+        try:
+            slot = get_limiter(provider).slot(priority, prompt + reserve)
+            with slot:
+                if stop.is_set():
+                    return  # another provider won while this one was queued
+                t0 = time.perf_counter()
+                first = True
+                streamed = 0
+                try:
+                    for tok in make_stream(provider):
+                        if first:
+                            settled = True
+                            _breaker(provider).success(time.perf_counter() - t0)
+                            first = False
+                        streamed += len(tok)
+                        if stop.is_set():
+                            return
+                        out.put((provider, "token", tok))
+                    if first:
+                        settled = True
+                        _breaker(provider).success(time.perf_counter() - t0)
+                    out.put((provider, "end", None))
+                except Exception as e:
+                    settled = True
+                    _breaker(provider).failure()
+                    out.put((provider, "error", e))
+                finally:
+                    slot.charge(prompt + int(streamed / 4) + 1)
+        except LLMOverloadedError as e:
+            out.put((provider, "error", e))
+        finally:
+            # Rejected by admission or stopped before starting: the trial had no outcome
+            if not settled:
+                _breaker(provider).release_trial()
+
+    def _route_stream(self, make_stream: Callable[[str], Iterable[str]], admit: Admission,
+                      record: Optional[Dict] = None) -> Iterable[str]:
+        """Stream from the first provider to produce a token.
+
+        Providers failing before their first token are failed over; with hedging, a second
+        provider is started when the first has produced nothing by the deadline. The
+        winning provider is stored in record["provider"].
+        """
+        hedge_s = self._hedge_after()
+        pending = list(self.providers)
+        events: "queue.Queue" = queue.Queue()
+        stops: Dict[str, threading.Event] = {}
+        last_err: Exception | None = None
+
+        def _start() -> bool:
+            provider = self._next_provider(pending)
+            if provider is None:
+                return False
+            stops[provider] = threading.Event()
+            threading.Thread(
+                target=self._pump,
+                args=(provider, make_stream, events, stops[provider], admit),
+                name=f"llm-stream-{provider}",
+                daemon=True,
+            ).start()
+            return True
+
+        if not _start():
+            raise LLMUnavailableError("No LLM provider available (all circuits open)")
+        primary = next(iter(stops))
+        running = 1
+        deadline = time.monotonic() + hedge_s if hedge_s and pending else None
+        winner: Optional[str] = None
+        try:
+            while winner is None:
+                timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+                try:
+                    provider, kind, payload = events.get(timeout=timeout)
+                except queue.Empty:
+                    deadline = None
+                    if _start():
+                        running += 1
+                        with _pool_lock:
+                            _pool_stats["hedges"] += 1
+                    continue
+                if kind == "error":
+                    last_err = payload
+                    running -= 1
+                    if running == 0:
+                        if not _start():
+                            raise last_err
+                        running = 1
+                    continue
+                winner = provider
+                if record is not None:
+                    record["provider"] = winner
+                if winner != primary:
+                    with _pool_lock:
+                        _pool_stats["hedge_wins"] += 1
+                for name, ev in stops.items():
+                    if name != winner:
+                        ev.set()
+                if kind == "end":
+                    return
+                yield payload
+            while True:
+                provider, kind, payload = events.get()
+                if provider != winner:
+                    continue
+                if kind == "error":
+                    raise payload
+                if kind == "end":
+                    return
+                yield payload
+        finally:
+            for ev in stops.values():
+                ev.set()
+
+    # ---- caching
+
+    def _cache_model(self, provider: str) -> str:
+        if provider == "openai":
+            return self._openai_model()
+        # Configured id, not the resolved candidate, so keys stay stable across fallbacks
+        return settings.llm_model or "models/gemini-2.0-flash"
+
+    def _cache_keys(self, messages, temperature, top_p, max_tokens) -> Dict[str, str]:
+        """provider -> cache key, in failover order. The mock provider is never cached."""
+        return {
+            p: make_cache_key(p, self._cache_model(p), messages, temperature, top_p, max_tokens)
+            for p in self.providers
+            if p != "mock"
+        }
+
+    @staticmethod
+    def _cache_store(keys: Dict[str, str], provider: Optional[str], text: str):
+        key = keys.get(provider or "")
+        if key:
+            llm_cache.put(key, text)
+
+    # ---- token accounting
+
+    def _admission(self, messages: List[RoleMsg], max_tokens: int | None, priority: str) -> Admission:
+        return priority, count_message_tokens(messages, self.provider), max_tokens or _DEFAULT_OUTPUT_RESERVE
+
+    @staticmethod
+    def _account(usage: Optional[Dict], provider: Optional[str], prompt: int, text: str, cached: bool = False):
+        """Add local token counts of one call to the per-request `usage` dict and the process totals."""
+        if cached:
+            if usage is not None:
+                usage["cached_calls"] = usage.get("cached_calls", 0) + 1
+            return
+        completion = count_tokens(text, provider)
+        with _pool_lock:
+            _pool_stats["prompt_tokens"] += prompt
+            _pool_stats["completion_tokens"] += completion
+        if usage is not None:
+            usage["calls"] = usage.get("calls", 0) + 1
+            usage["prompt_tokens"] = usage.get("prompt_tokens", 0) + prompt
+            usage["completion_tokens"] = usage.get("completion_tokens", 0) + completion
+
+    # ---- public API
+
+    def generate(
+        self,
+        messages: List[RoleMsg],
+        temperature: float = 0.2,
+        top_p: float | None = None,
+        max_tokens: int | None = None,
+        cache: bool = True,
+        usage: Optional[Dict] = None,
+        priority: str = "interactive",
+    ) -> str:
+        """Complete `messages`.
+
+        Pass cache=False for calls meant to vary between runs; token counts are added to
+        `usage` (see token_budget.new_usage) when given. priority is "interactive" or
+        "background" for admission control; LLMOverloadedError means no provider could
+        admit the call.
+        """
+        keys = self._cache_keys(messages, temperature, top_p, max_tokens) if cache and llm_cache.enabled else {}
+        if keys:
+            hit = llm_cache.get(*keys.values())
+            if hit is not None:
+                self._account(usage, None, 0, hit, cached=True)
+                return hit
+        admit = self._admission(messages, max_tokens, priority)
+        provider, text = self._route(lambda p: (p, self._generate_on(p, messages, temperature, top_p, max_tokens)), admit)
+        self._account(usage, provider, admit[1], text)
+        self._cache_store(keys, provider, text)
+        return text
+
+    async def agenerate(
+        self,
+        messages: List[RoleMsg],
+        temperature: float = 0.2,
+        top_p: float | None = None,
+        max_tokens: int | None = None,
+        cache: bool = True,
+        usage: Optional[Dict] = None,
+        priority: str = "interactive",
+    ) -> str:
+        """Non-blocking counterpart of generate() for the asyncio pipeline."""
+        keys = self._cache_keys(messages, temperature, top_p, max_tokens) if cache and llm_cache.enabled else {}
+        if keys:
+            hit = await asyncio.to_thread(llm_cache.get, *keys.values())
+            if hit is not None:
+                self._account(usage, None, 0, hit, cached=True)
+                return hit
+
+        async def _call(p: str):
+            return p, await self._agenerate_on(p, messages, temperature, top_p, max_tokens)
+
+        admit = self._admission(messages, max_tokens, priority)
+        provider, text = await self._aroute(_call, admit)
+        self._account(usage, provider, admit[1], text)
+        if keys:
+            await asyncio.to_thread(self._cache_store, keys, provider, text)
+        return text
+
+    def stream_generate(
+        self,
+        messages: List[RoleMsg],
+        temperature: float = 0.2,
+        top_p: float | None = None,
+        max_tokens: int | None = None,
+        cache: bool = True,
+        usage: Optional[Dict] = None,
+        priority: str = "interactive",
+    ) -> Iterable[str]:
+        keys = self._cache_keys(messages, temperature, top_p, max_tokens) if cache and llm_cache.enabled else {}
+        if keys:
+            hit = llm_cache.get(*keys.values())
+            if hit is not None:
+                self._account(usage, None, 0, hit, cached=True)
+                yield hit
+                return
+        admit = self._admission(messages, max_tokens, priority)
+        record: Dict = {}
+        parts: List[str] = []
+        for tok in self._route_stream(lambda p: self._stream_on(p, messages, temperature, top_p, max_tokens), admit, record):
+            parts.append(tok)
+            yield tok
+        # Only complete streams are accounted and cached (an abandoned generator never gets here)
+        text = "".join(parts)
+        self._account(usage, record.get("provider"), admit[1], text)
+        self._cache_store(keys, record.get("provider"), text)
@@ -1,13 +1,32 @@
 from __future__ import annotations
 import os
 import json
-from typing import Dict, List
+from typing import Callable, Dict, FrozenSet, List, Tuple
 
 META_DIR = os.path.join('.data', 'meta')
 META_PATH = os.path.join(META_DIR, 'docs.json')
 
 os.makedirs(META_DIR, exist_ok=True)
 
+# Callbacks notified as cb(event, doc_id) after a corpus change is persisted.
+# Events: "add", "delete", "approve", "unapprove".
+_listeners: List[Callable[[str, str], None]] = []
+
+
+def subscribe(callback: Callable[[str, str], None]):
+    """Register a callback for corpus changes (used by caches that depend on the corpus)."""
+    if callback not in _listeners:
+        _listeners.append(callback)
+
+
+def _notify(event: str, doc_id: str):
+    for cb in list(_listeners):
+        try:
+            cb(event, doc_id)
+        except Exception:
+            # A failing listener must never break metadata writes
+            pass
+
 
 def _load() -> Dict:
     if not os.path.exists(META_PATH):
@@ -29,6 +48,34 @@ def add_document(doc: Dict):
         doc['approved'] = False
     data['documents'].append(doc)
     _save(data)
+    _notify("add", doc.get('doc_id'))
+
+
+def corpus_version() -> int:
+    """Cheap change token for the document registry (mtime of the metadata file).
+
+    Every add/delete/approval change rewrites the file, so callers can key caches
+    on this value instead of re-reading and parsing the JSON.
+    """
+    try:
+        return os.stat(META_PATH).st_mtime_ns
+    except OSError:
+        return 0
+
+
+_approved_cache: Tuple[int, FrozenSet[str]] | None = None
+
+
+def approved_doc_ids() -> FrozenSet[str]:
+    """Approved doc_ids, re-parsed only when the metadata file changes."""
+    global _approved_cache
+    version = corpus_version()
+    cached = _approved_cache
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    ids = frozenset(d.get('doc_id') for d in _load().get('documents', []) if d.get('approved') is True)
+    _approved_cache = (version, ids)
+    return ids
 
 
 def list_documents() -> List[Dict]:
@@ -40,7 +87,10 @@ def delete_document(doc_id: str) -> bool:
     before = len(data.get('documents', []))
     data['documents'] = [d for d in data['documents'] if d.get('doc_id') != doc_id]
     _save(data)
-    return len(data['documents']) < before
+    removed = len(data['documents']) < before
+    if removed:
+        _notify("delete", doc_id)
+    return removed
 
 def set_document_approved(doc_id: str, approved: bool) -> bool:
     data = _load()
@@ -54,4 +104,5 @@ def set_document_approved(doc_id: str, approved: bool) -> bool:
             break
     if changed:
         _save(data)
+        _notify("approve" if approved else "unapprove", doc_id)
     return changed
@@ -6,7 +6,7 @@ from typing import List, Dict
 import random
 import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from app.services.llm_client import LLMClient
+from app.services.llm_client import LLMOverloadedError, get_llm_client
 from app.services.rag_engine import clean_legal_response
 
 NYAY_DIR = os.path.join(".data", "nyayshala")
@@ -106,20 +106,27 @@ def generate_for_day(d: date, persist: bool = True, randomize: bool = False) ->
                 + (" Focus on a different subtopic on each request; do not repeat previous examples if possible." if randomize else "")
             )},
         ]
-        # Create a client per task to avoid thread-safety issues
+        # Shared process-wide client (thread-safe; SDK clients and resolved model are pooled)
         attempts = 3 if randomize else 2
         last_err: Exception | None = None
         for i in range(attempts):
             try:
-                client = LLMClient()
+                client = get_llm_client()
                 raw = client.generate(
                     msgs,
                     temperature=(0.8 if randomize else 0.4),
                     top_p=0.9 if randomize else None,
                     max_tokens=240,
+                    # Randomized nuggets must differ between requests
+                    cache=not randomize,
+                    priority="background",
                 )
                 text = clean_legal_response(raw)
                 break
+            except LLMOverloadedError:
+                # Chat traffic has the provider busy; use the cached/placeholder fallbacks below
+                text = None
+                break
             except Exception as e:
                 last_err = e
                 # Backoff on transient errors (rate limits/network)
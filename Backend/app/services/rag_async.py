@@ -0,0 +1,206 @@
+"""Asyncio-native chat pipeline.
+
+Mirrors rag_engine.retrieve_context / answer(stream=False) but awaits every network
+hop (Qdrant, LLM) on the event loop instead of parking a worker thread per request.
+CPU-bound stages (embedding, cross-encoder, deterministic-intent probes) run in
+executors. Query planning, fusion and prompt building are shared with rag_engine so
+both pipelines return the same answers.
+"""
+from __future__ import annotations
+
+import asyncio
+import logging
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from app.core.config import settings
+from app.services.answer_cache import answer_cache
+from app.services.embedding import embed_queries_async, embed_query_async, embedding_dimension, run_in_embed_executor
+from app.services.llm_client import LLMOverloadedError, get_llm_client
+from app.services.single_flight import async_chat_flights, flight_key
+from app.services.token_budget import new_usage, output_token_cap
+from app.services.reranker import cross_encoder_rerank, heuristic_rerank
+from app.services.vector_store import AsyncQdrantStore
+from app.services.rag_engine import (
+    _FUNDAMENTAL_RIGHTS_COMBINED_QUERY,
+    _NO_INFO_MESSAGE,
+    _UNAVAILABLE_MESSAGE,
+    _answer_cache_probe,
+    _approval_filter,
+    _build_free_prompt,
+    _compression_messages,
+    _concat_contexts,
+    _dedupe_requests,
+    _extractive_context,
+    _finish_fundamental_rights,
+    _format_output,
+    _fuse,
+    _greeting_response,
+    _is_smalltalk,
+    _lexical_hits,
+    _log_sources,
+    _log_usage,
+    _max_context_chunks,
+    _merge_unique,
+    _output_intent,
+    _rerank_pool_size,
+    _resolve_deterministic,
+    _retrieval_plan,
+    _score_lexical_hits,
+    _sources,
+    _split_batches,
+    _strong_contexts,
+    _use_extractive_compressor,
+    build_budgeted_prompt,
+    clean_legal_response,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def _corpus_store() -> AsyncQdrantStore:
+    dim = await run_in_embed_executor(embedding_dimension)
+    store = AsyncQdrantStore()
+    await store.ensure_collection(dim)
+    return store
+
+
+async def _search_many(store: AsyncQdrantStore, requests: List[Tuple[str, int]], filter_=None) -> List[List[Dict]]:
+    texts, limits = _dedupe_requests(requests)
+    vecs = await embed_queries_async(texts, as_numpy=True)
+    batches = await store.search_batch(vecs, limits, filter_=filter_)
+    return _split_batches(requests, texts, batches)
+
+
+async def _lexical_search(store: AsyncQdrantStore, query: str, k: int, score_query: str | None = None) -> List[Dict]:
+    # BM25 lookups may reload the index from disk and read document metadata
+    hits = await asyncio.to_thread(_lexical_hits, store.collection, query, k)
+    if not hits:
+        return []
+    points, qvec = await asyncio.gather(
+        store.retrieve([pid for pid, _, _ in hits], with_vectors=True),
+        embed_query_async(score_query or query, as_numpy=True),
+    )
+    return await asyncio.to_thread(_score_lexical_hits, hits, points, qvec)
+
+
+def _rerank(query: str, results: List[Dict], top_k: int) -> List[Dict]:
+    results = heuristic_rerank(query, results, _rerank_pool_size(top_k))
+    if settings.rerank_cross_encoder_enabled:
+        results = cross_encoder_rerank(query, results)
+    return results[:top_k]
+
+
+async def retrieve_context_async(query: str, top_k: int = 10) -> List[Dict]:
+    """Async retrieve_context: same plan, fusion and reranking, non-blocking I/O.
+
+    CPU-bound or file-reading steps (planning, approval metadata, BM25, reranking) run
+    in worker threads so that, e.g., a BM25 index reload does not stall the loop.
+    """
+    store, plan, filter_ = await asyncio.gather(
+        _corpus_store(),
+        asyncio.to_thread(_retrieval_plan, query, top_k),
+        asyncio.to_thread(_approval_filter),
+    )
+    if plan["fundamental_rights"]:
+        gathered = _merge_unique(await _search_many(store, plan["dense"], filter_))
+        if len(gathered) < 12:
+            gathered = _merge_unique([gathered] + await _search_many(store, [(_FUNDAMENTAL_RIGHTS_COMBINED_QUERY, 12)], filter_))
+        return _finish_fundamental_rights(gathered, top_k)
+
+    # Dense and lexical legs are independent: overlap their round trips
+    dense, lex_res = await asyncio.gather(
+        _search_many(store, plan["dense"], filter_),
+        _lexical_search(store, *plan["lexical"], score_query=query),
+    )
+    results = _fuse(dense + [lex_res])
+    if not results:
+        results = (await _search_many(store, [(query, top_k)], filter_))[0]
+
+    results = await asyncio.to_thread(_rerank, query, results, top_k)
+    _log_sources(plan, results)
+    return results
+
+
+async def _generate_with_retries(msgs: List[Dict], max_tokens: int, label: str, usage: Dict | None = None) -> str | None:
+    """Two quick attempts with async backoff; None when both fail. LLMOverloadedError propagates."""
+    for i in range(2):
+        try:
+            llm = get_llm_client()
+            return await llm.agenerate(msgs, temperature=0.2, top_p=0.8, max_tokens=max_tokens, usage=usage)
+        except LLMOverloadedError:
+            raise  # shed load instead of retrying into a full queue
+        except Exception as e:
+            logger.exception("LLM %s failed: %s", label, e)
+            await asyncio.sleep(0.25 * (2 ** i))
+    return None
+
+
+async def _compress_contexts(user_query: str, contexts: List[Dict], max_chunks: int = 8, usage: Dict | None = None) -> str:
+    if _use_extractive_compressor():
+        return await run_in_embed_executor(_extractive_context, user_query, contexts, max_chunks)
+    msgs, snippets = _compression_messages(user_query, contexts, max_chunks)
+    if not msgs:
+        return ""
+    try:
+        llm = get_llm_client()
+        summary = await llm.agenerate(msgs, temperature=0.1, top_p=0.9, max_tokens=output_token_cap("compress"), usage=usage)
+        return summary or "\n\n".join(snippets[:3])
+    except Exception:
+        return "\n\n".join(snippets[:3])
+
+
+async def _answer_from_corpus(query: str, record: Dict) -> str:
+    usage = record.get("usage")
+    strong = _strong_contexts(await retrieve_context_async(query))
+
+    if not strong:
+        raw = await _generate_with_retries(_build_free_prompt(query), output_token_cap("free"), "free-mode", usage)
+        if raw is not None:
+            record.update(cacheable=True, sources=[])
+            return _format_output(clean_legal_response(raw))
+        return _format_output(clean_legal_response(_NO_INFO_MESSAGE))
+
+    max_chunks = _max_context_chunks(strong)
+    try:
+        contexts_for_prompt = [{"doc_id": "synth", "chunk_id": 0, "text": await _compress_contexts(query, strong, max_chunks=max_chunks, usage=usage)}]
+    except Exception:
+        contexts_for_prompt = _concat_contexts(strong, max_chunks)
+
+    msgs = build_budgeted_prompt(query, contexts_for_prompt)
+    raw = await _generate_with_retries(msgs, output_token_cap(_output_intent(query)), "generate", usage)
+    if raw is None:
+        return _format_output(clean_legal_response(_UNAVAILABLE_MESSAGE))
+    record.update(cacheable=True, sources=_sources(strong))
+    return _format_output(clean_legal_response(raw))
+
+
+async def answer_async(query: str) -> str:
+    """Async equivalent of rag_engine.answer(query, stream=False); identical concurrent queries are coalesced."""
+    if not settings.chat_single_flight:
+        return await _answer_async(query)
+    return await async_chat_flights.call(flight_key(query), lambda: _answer_async(query))
+
+
+async def _answer_async(query: str) -> str:
+    if _is_smalltalk(query):
+        return _format_output(clean_legal_response(_greeting_response()))
+
+    # Coverage probes may hit Qdrant on a cold cache; keep them off the loop
+    fixed = await asyncio.to_thread(_resolve_deterministic, query)
+    if fixed is not None:
+        return fixed
+
+    probe: Tuple[np.ndarray, str] | None = await run_in_embed_executor(_answer_cache_probe, query)
+    if probe is not None:
+        hit = await asyncio.to_thread(answer_cache.lookup, *probe)
+        if hit is not None:
+            return hit
+
+    record: Dict = {"usage": new_usage()}
+    result = await _answer_from_corpus(query, record)
+    _log_usage(record)
+    if probe is not None and record.get("cacheable"):
+        await asyncio.to_thread(answer_cache.store, *probe, result, record.get("sources"))
+    return result
@@ -1,16 +1,23 @@
-from typing import List, Dict, Iterable, Tuple
+from typing import List, Dict, Iterable, Tuple, Callable, NamedTuple
 import logging
 import re
-import os
-import json
-from functools import lru_cache
-from app.services.llm_client import LLMClient
+import numpy as np
+from app.services.llm_client import LLMOverloadedError, get_llm_client
 from app.core.config import settings
-from app.services.embedding import embed_query, get_embedder
+from app.services.embedding import embed_queries, embed_query, embedding_dimension
+from app.services.answer_cache import answer_cache
+from app.services.legal_links import load_legal_links
+from app.services.reranker import heuristic_rerank, cross_encoder_rerank
+from app.services.response_formatter import ResponseFormatter
+from app.services.context_compressor import extractive_compress
+from app.services.single_flight import chat_flights, flight_key
+from app.services.token_budget import count_message_tokens, new_usage, output_token_cap, pack_contexts
 from app.services.vector_store import QdrantStore
-from app.services.metadata_store import list_documents as meta_list
+from app.services.lexical_index import get_lexical_index
+from app.services.metadata_store import list_documents as meta_list, corpus_version, approved_doc_ids
 
 MIN_SCORE = 0.35  # minimum similarity score to consider a context relevant
+RRF_K = 60  # reciprocal rank fusion constant
 
 _SMALLTALK = {
     "hi", "hello", "hey", "yo", "sup", "hola", "namaste",
@@ -32,226 +39,272 @@ def _is_smalltalk(query: str) -> bool:
             return True
     return False
 
+# Fallback messages (formatted through clean_legal_response/_format_output when served)
+_NO_INFO_MESSAGE = (
+    "Sorry, I don't have the relevant information for your query right now. "
+    "Please refer to official Government of India legal resources: \n"
+    "- India Code: https://www.indiacode.nic.in/ (official repository of Central Acts)\n"
+    "- Legislative Department: https://legislative.gov.in (includes the Constitution of India)"
+)
+_UNAVAILABLE_MESSAGE = (
+    "Sorry, I can't complete this right now. Please refer to official Government of India legal resources: \n"
+    "- India Code: https://www.indiacode.nic.in/ (official repository of Central Acts)\n"
+    "- Legislative Department: https://legislative.gov.in (includes the Constitution of India)"
+)
+
+
 def _greeting_response() -> str:
     return (
         "Hello! I’m NyaySaathi. Ask me about Indian law – articles, sections, cases, or procedures. "
         "For example: ‘What is Article 21?’, ‘Remedy for wrongful detention?’, or ‘Bail process under CrPC’."
     )
 
-# Placeholder retrieval to be replaced by Qdrant
+_FUNDAMENTAL_RIGHTS_CATEGORIES: List[Tuple[str, List]] = [
+    ("Right to Equality", [14, 15, 16, 17, 18]),
+    ("Right to Freedom", [19, 20, 21, "21A", 22]),
+    ("Right against Exploitation", [23, 24]),
+    ("Right to Freedom of Religion", [25, 26, 27, 28]),
+    ("Cultural and Educational Rights", [29, 30]),
+    ("Right to Constitutional Remedies", [32]),
+]
+
+_FUNDAMENTAL_RIGHTS_COMBINED_QUERY = (
+    "Fundamental Rights Part III list all: Equality (14-18), Freedom (19-22 incl 21 & 21A), Exploitation (23-24), "
+    "Religion (25-28), Cultural/Educational (29-30), Remedies (32)."
+)
+
+
+def _fundamental_rights_queries() -> List[str]:
+    """Per-category and per-article queries used to cover Part III."""
+    out: List[str] = []
+    for cat, arts in _FUNDAMENTAL_RIGHTS_CATEGORIES:
+        out.append(f"{cat} Part III Constitution of India fundamental rights")
+        for a in arts:
+            out.append(f"Article {a} Constitution of India Part III fundamental rights")
+    return out
 
-def retrieve_context(query: str, top_k: int = 10) -> List[Dict]:
-    """Adaptive retrieval with query expansion and hybrid reranking."""
-    dim = get_embedder().get_sentence_embedding_dimension()
+
+def _approval_filter():
+    """Qdrant filter for admin approval gating.
+
+    Once any document is approved, only approved documents are searchable; before that
+    (fresh installs) the whole corpus is used, matching the original gating rule.
+    """
+    try:
+        if approved_doc_ids():
+            return QdrantStore.approved_filter()
+    except Exception:
+        # If metadata loading fails, search unfiltered
+        pass
+    return None
+
+
+def _dedupe_requests(requests: List[Tuple[str, int]]) -> Tuple[List[str], List[int]]:
+    """Unique query strings (first-seen order) with the largest k requested for each."""
+    limits: Dict[str, int] = {}
+    for q, k in requests:
+        limits[q] = max(k, limits.get(q, 0))
+    texts = list(limits)
+    return texts, [limits[t] for t in texts]
+
+
+def _split_batches(requests: List[Tuple[str, int]], texts: List[str], batches: List[List[Dict]]) -> List[List[Dict]]:
+    by_text = dict(zip(texts, batches))
+    return [by_text[q][:k] for q, k in requests]
+
+
+def _search_many(store: QdrantStore, requests: List[Tuple[str, int]]) -> List[List[Dict]]:
+    """Run several searches with one encode call and one Qdrant batch request.
+
+    Identical query strings are embedded and searched once (with the largest k
+    requested for them) and the result list is sliced per request. Approval gating
+    is applied inside Qdrant so unapproved chunks never take top-k slots.
+    """
+    texts, limits = _dedupe_requests(requests)
+    vecs = embed_queries(texts, as_numpy=True)
+    batches = store.search_batch(vecs, limits, filter_=_approval_filter())
+    return _split_batches(requests, texts, batches)
+
+
+def _lexical_hits(collection: str, query: str, k: int) -> List[Tuple[str, float, Dict]]:
+    try:
+        approved = approved_doc_ids()
+        return get_lexical_index(collection).search(query, top_k=k, allowed_doc_ids=set(approved) if approved else None)
+    except Exception as e:
+        logging.getLogger(__name__).warning("Lexical search failed: %s", e)
+        return []
+
+
+def _score_lexical_hits(hits: List[Tuple[str, float, Dict]], points: List[Dict], qvec: np.ndarray) -> List[Dict]:
+    """Shape BM25 hits like dense matches, scored by true cosine against the query vector."""
+    if not hits:
+        return []
+    top = hits[0][1] or 1.0
+    by_id = {m["id"]: m for m in points}
+    out: List[Dict] = []
+    for pid, score, _ in hits:
+        m = by_id.get(pid)
+        if m is None:
+            continue  # stale posting (point deleted/recreated)
+        vec = m.pop("vector", None)
+        if isinstance(vec, dict):  # named vectors
+            vec = next(iter(vec.values()), None)
+        m["score"] = float(np.dot(qvec, np.asarray(vec, dtype=np.float32))) if vec is not None else 0.0
+        m["lexical"] = score / top
+        out.append(m)
+    return out
+
+
+def _lexical_search(store: QdrantStore, query: str, k: int, score_query: str | None = None) -> List[Dict]:
+    """BM25 hits shaped like dense matches.
+
+    Hits are fetched from Qdrant (one retrieve call) and given their true cosine score
+    against score_query (already embedded by the dense legs, so this is a cache hit), so
+    MIN_SCORE gating and the dense base score of the reranker keep their meaning.
+    """
+    hits = _lexical_hits(store.collection, query, k)
+    if not hits:
+        return []
+    points = store.retrieve([pid for pid, _, _ in hits], with_vectors=True)
+    qvec = embed_query(score_query or query, as_numpy=True)
+    return _score_lexical_hits(hits, points, qvec)
+
+
+def rebuild_lexical_index(collection: str | None = None) -> int:
+    """Rebuild the BM25 index of a collection from Qdrant payloads; returns indexed points."""
+    store = QdrantStore(collection=collection)
+    index = get_lexical_index(store.collection)
+    index.clear()
+    ids: List[str] = []
+    payloads: List[Dict] = []
+    for pid, payload in store.scroll_payloads():
+        ids.append(pid)
+        payloads.append(payload)
+        if len(ids) >= 512:
+            index.add(ids, payloads)
+            ids, payloads = [], []
+    index.add(ids, payloads)
+    index.save()
+    return len(index)
+
+
+def ensure_lexical_index() -> None:
+    """Build the corpus BM25 index from Qdrant once if it does not exist yet (pre-index corpora)."""
+    if not len(get_lexical_index(settings.qdrant_corpus_collection)):
+        rebuild_lexical_index()
+
+
+def _corpus_store() -> QdrantStore:
+    dim = embedding_dimension()
     store = QdrantStore()
     store.ensure_collection(dim)
+    return store
 
-    def _search(q: str, k: int) -> List[Dict]:
-        qvec = embed_query(q)
-        return store.search(qvec, top_k=k)
 
+def _retrieval_plan(query: str, top_k: int) -> Dict:
+    """Decide which searches retrieve_context runs (shared by the sync and async pipelines)."""
     # Domain-aware query expansion for better recall on common intents
-    intent = _detect_intent(query)
-    q0 = query
-    if intent.get("fundamental_rights_all"):
-        # Targeted retrieval per category and article for full coverage
-        categories = [
-            ("Right to Equality", [14, 15, 16, 17, 18]),
-            ("Right to Freedom", [19, 20, 21, "21A", 22]),
-            ("Right against Exploitation", [23, 24]),
-            ("Right to Freedom of Religion", [25, 26, 27, 28]),
-            ("Cultural and Educational Rights", [29, 30]),
-            ("Right to Constitutional Remedies", [32]),
-        ]
-        gathered: List[Dict] = []
-        seen = set()
-        def _add_matches(q: str, k: int = 4):
-            for m in _search(q, k):
-                key = (m.get("doc_id"), m.get("chunk_id"))
-                if key in seen:
-                    continue
-                seen.add(key)
-                gathered.append(m)
-        for cat, arts in categories:
-            _add_matches(f"{cat} Part III Constitution of India fundamental rights", 3)
-            for a in arts:
-                _add_matches(f"Article {a} Constitution of India Part III fundamental rights", 3)
-        # If still thin, add a combined query
-        if len(gathered) < 12:
-            _add_matches("Fundamental Rights Part III list all: Equality (14-18), Freedom (19-22 incl 21 & 21A), Exploitation (23-24), Religion (25-28), Cultural/Educational (29-30), Remedies (32).", 12)
-        # Sort by score and return
-        gathered.sort(key=lambda x: x.get("score", 0.0), reverse=True)
-        return gathered[: max(top_k, 24)]
-
+    if _detect_intent(query).get("fundamental_rights_all"):
+        # Targeted retrieval per category and article for full coverage (one batched round trip)
+        return {
+            "fundamental_rights": True,
+            "dense": [(q, 3) for q in _fundamental_rights_queries()],
+            "rewritten": query,
+        }
     # Adaptive query expansion using legal links
-    links = _load_legal_links()
-    det_refs = _detect_legal_refs(q0)
-    expanded_q, kw_q = _expand_query(q0, det_refs, links)
-    adaptive_k = 5 if det_refs.get("has_ref") else 10
-
-    # Multi-query semantic search and merge
-    base_res = _search(expanded_q or q0, max(top_k, adaptive_k))
-    alt_res = _search(q0, adaptive_k)
-    kw_res = _search(kw_q or q0, adaptive_k)
+    links = load_legal_links()
+    det_refs = _detect_legal_refs(query)
+    expanded_q, kw_q = _expand_query(query, det_refs, links)
+    adaptive_k = max(5 if det_refs.get("has_ref") else 10, settings.rerank_pool_size)
+    return {
+        "fundamental_rights": False,
+        # Dense legs (expanded + original query)
+        "dense": [(expanded_q or query, max(top_k, adaptive_k)), (query, adaptive_k)],
+        # Lexical leg: BM25 over the keyword-expanded query (no model forward pass)
+        "lexical": (kw_q or query, max(top_k, adaptive_k)),
+        "rewritten": expanded_q or query,
+    }
+
+
+def _merge_unique(lists: List[List[Dict]]) -> List[Dict]:
+    gathered: List[Dict] = []
+    seen = set()
+    for matches in lists:
+        for m in matches or []:
+            key = (m.get("doc_id"), m.get("chunk_id"))
+            if key in seen:
+                continue
+            seen.add(key)
+            gathered.append(m)
+    return gathered
+
+
+def _finish_fundamental_rights(gathered: List[Dict], top_k: int) -> List[Dict]:
+    # Sort by score and return
+    gathered.sort(key=lambda x: x.get("score", 0.0), reverse=True)
+    return gathered[: max(top_k, 24)]
+
+
+def _fuse(legs: List[List[Dict]]) -> List[Dict]:
+    """Reciprocal rank fusion across legs; keep the best dense score per unique chunk."""
     merged: Dict[Tuple[str, int], Dict] = {}
-    for lst in (base_res, alt_res, kw_res):
-        for m in lst or []:
+    rrf: Dict[Tuple[str, int], float] = {}
+    lexical: Dict[Tuple[str, int], float] = {}
+    for lst in legs:
+        for rank, m in enumerate(lst or []):
             key = (m.get("doc_id"), m.get("chunk_id"))
-            # keep the best score per unique chunk
+            rrf[key] = rrf.get(key, 0.0) + 1.0 / (RRF_K + rank + 1)
+            lexical[key] = max(lexical.get(key, 0.0), m.get("lexical", 0.0))
             if key not in merged or m.get("score", 0.0) > merged[key].get("score", 0.0):
                 merged[key] = m
-    results = list(merged.values())
-    if not results:
-        results = _search(q0, top_k)
-
-    # Light hybrid reranking: prefer matches that align with explicit legal references and keyword overlap
-    def _extract_refs(q: str) -> Dict[str, List[str]]:
-        ql = q.lower()
-        arts = re.findall(r"article\s+(\d+[a-z]?)", ql)
-        secs = re.findall(r"section\s+(\d+[a-z]?)", ql)
-        parts = re.findall(r"part\s+([ivxlcdm]+|\d+)", ql)
-        chaps = re.findall(r"chapter\s+([ivxlcdm]+|\d+)", ql)
-        return {"article": arts, "section": secs, "part": parts, "chapter": chaps}
-
-    def _keyword_overlap(a: str, b: str) -> float:
-        ta = {w for w in re.findall(r"[a-zA-Z]{3,}", (a or "").lower())}
-        tb = {w for w in re.findall(r"[a-zA-Z]{3,}", (b or "").lower())}
-        if not ta or not tb:
-            return 0.0
-        inter = ta & tb
-        base = min(len(ta), len(tb)) or 1
-        return min(1.0, len(inter) / base)
-
-    refs = _extract_refs(q0)
-    # Right-aware proximity targets and restriction-sensitive reranking
-    def _invoked_articles(q: str, refs_map: Dict[str, List[str]]) -> List[int]:
-        ql = (q or "").lower()
-        nums: List[int] = []
-        for a in refs_map.get("article", []) or []:
-            try:
-                nums.append(int(re.sub(r"[^0-9]", "", a)))
-            except Exception:
-                pass
-        # Public order / speech / assembly / association cues => Article 19 proximity
-        if any(k in ql for k in ["public order", "decency", "morality", "sovereignty", "security of the state", "free speech", "freedom of speech", "article 19"]):
-            nums.append(19)
-        if "right to equality" in ql or "equality before law" in ql:
-            nums.extend([14, 15, 16, 17, 18])
-        if "right to freedom" in ql:
-            nums.extend([19, 20, 21, 22])
-        if "right against exploitation" in ql:
-            nums.extend([23, 24])
-        if "freedom of religion" in ql:
-            nums.extend([25, 26, 27, 28])
-        if "cultural" in ql and "educational" in ql:
-            nums.extend([29, 30])
-        if "constitutional remedies" in ql:
-            nums.extend([32])
-        return nums
-
-    target_articles = _invoked_articles(q0, refs)
-    restriction_terms = [
-        "reasonable restriction", "subject to", "notwithstanding", "restriction", "exception", "reservation",
-        "classification", "intelligible differentia", "rational nexus", "public order", "morality", "security of state",
-    ]
-    procedural_terms = [
-        "procedure", "safeguard", "reasons to be recorded in writing", "by order", "subject to the provisions of sub-section",
-        "rules may be prescribed", "block", "blocking", "intercept", "monitor", "decrypt",
-    ]
+    results = [{**m, "rrf": rrf[key], "lexical": lexical[key]} for key, m in merged.items()]
+    results.sort(key=lambda m: m["rrf"], reverse=True)
+    return results
 
-    # Statute → Constitution link mapper (lightweight)
-    def _statute_links(meta: Dict, text: str) -> List[int]:
-        title = (meta.get("title") or meta.get("source_path") or "").lower()
-        section = str(meta.get("section") or "").upper()
-        t = (text or "").lower()
-        links: List[int] = []
-        # JSON-driven mapping
-        try:
-            mapping = _load_legal_links()
-            for art_key, cfg in (mapping or {}).items():
-                try:
-                    art_num = int(re.sub(r"[^0-9]", "", art_key))
-                except Exception:
-                    art_num = None
-                sections = [str(s).upper() for s in (cfg.get("Linked_Sections") or [])]
-                kws = [k.lower() for k in (cfg.get("Keywords") or [])]
-                if any(sec in (section or "") or (section and sec.find(section) >= 0) or (sec and sec in t.upper()) for sec in sections):
-                    if art_num:
-                        links.append(art_num)
-                if kws and any(k in t for k in kws):
-                    if art_num:
-                        links.append(art_num)
-        except Exception:
-            pass
-        # Hand-tuned fallbacks
-        if ("information technology" in title or "it_act" in title or "it act" in title):
-            if section in ("69A", "69") or ("section 69a" in t or "section 69" in t):
-                links.append(19)
-        if ("code of criminal procedure" in title or "crpc" in title) and section == "144":
-            links.append(19)
-        return links
-
-    reranked: List[Tuple[float, Dict]] = []
-    for r in results or []:
-        base = float(r.get("score", 0.0))
-        bonus = 0.0
-        meta = r.get("meta", {}) or {}
-        # Exact legal number alignment boosts
-        art = (meta.get("article") or meta.get("Article") or meta.get("ARTICLE"))
-        sec = (meta.get("section") or meta.get("Section") or meta.get("SECTION"))
-        part = (meta.get("part") or meta.get("Part") or meta.get("PART"))
-        chap = (meta.get("chapter") or meta.get("Chapter") or meta.get("CHAPTER"))
-        if art and any(str(art).lower() == a for a in refs["article"]):
-            bonus += 0.22
-        if sec and any(str(sec).lower() == s for s in refs["section"]):
-            bonus += 0.18
-        if part and any(str(part).lower() == p for p in refs["part"]):
-            bonus += 0.06
-        if chap and any(str(chap).lower() == c for c in refs["chapter"]):
-            bonus += 0.05
-        # Article number proximity relative to invoked right/articles
-        try:
-            art_num = int(re.sub(r"[^0-9]", "", str(art))) if art else None
-        except Exception:
-            art_num = None
-        if art_num and target_articles:
-            dist = min(abs(art_num - t) for t in target_articles)
-            proximity = max(0.0, 1.0 - (dist / 10.0))
-            bonus += 0.15 * proximity
-        # Restriction/exception vocabulary presence
-        text_low = (r.get("text", "") or "").lower()
-        if any(term in text_low for term in restriction_terms):
-            bonus += 0.10
-        # Procedure/safeguard vocabulary presence
-        if any(term in text_low for term in procedural_terms):
-            bonus += 0.08
-        # Payload tags (from ingestion) can also signal procedure
-        tags = meta.get("tags") or []
-        if isinstance(tags, list) and any(t in tags for t in ["procedure", "safeguard", "blocking", "interception"]):
-            bonus += 0.10
-        # Keyword overlap (lightweight BM25-ish)
-        bonus += 0.12 * _keyword_overlap(q0, r.get("text", ""))
-        # Constitution–statute link bonus: if a statute section is linked to a constitutional article we target
-        links = _statute_links(meta, r.get("text") or "")
-        if links and target_articles:
-            if any(lnk in target_articles for lnk in links):
-                bonus += 0.12
-            # Also expand target_articles slightly to include links
-            for lnk in links:
-                if lnk not in target_articles:
-                    target_articles.append(lnk)
-        reranked.append((base + bonus, r))
-    reranked.sort(key=lambda x: x[0], reverse=True)
-    results = [r for _, r in reranked][:top_k]
+
+def _rerank_pool_size(top_k: int) -> int:
+    if settings.rerank_cross_encoder_enabled:
+        # Optional second stage looks at a wider heuristic head
+        return max(top_k, settings.rerank_cross_encoder_max_candidates)
+    return top_k
+
+
+def _log_sources(plan: Dict, results: List[Dict]):
     # Debug print: rewritten query and top sources
     try:
         logging.getLogger(__name__).info(
             "RAG debug: rewritten_query=%s | sources=%s",
-            expanded_q or q0,
+            plan.get("rewritten"),
             [(r.get("doc_id"), r.get("chunk_id"), round(r.get("score", 0.0), 3)) for r in results],
         )
     except Exception:
         pass
+
+
+def retrieve_context(query: str, top_k: int = 10) -> List[Dict]:
+    """Adaptive retrieval with query expansion and hybrid reranking."""
+    store = _corpus_store()
+    plan = _retrieval_plan(query, top_k)
+    dense = _search_many(store, plan["dense"])
+    if plan["fundamental_rights"]:
+        gathered = _merge_unique(dense)
+        # If still thin, add a combined query
+        if len(gathered) < 12:
+            gathered = _merge_unique([gathered] + _search_many(store, [(_FUNDAMENTAL_RIGHTS_COMBINED_QUERY, 12)]))
+        return _finish_fundamental_rights(gathered, top_k)
+
+    lex_res = _lexical_search(store, *plan["lexical"], score_query=query)
+    results = _fuse(dense + [lex_res])
+    if not results:
+        results = _search_many(store, [(query, top_k)])[0]
+
+    # Hybrid reranking: dense score plus legal-reference, vocabulary, lexical and link features
+    results = heuristic_rerank(query, results, _rerank_pool_size(top_k))
+    if settings.rerank_cross_encoder_enabled:
+        # Falls back to the heuristic order when over its latency budget
+        results = cross_encoder_rerank(query, results)
+    results = results[:top_k]
+    _log_sources(plan, results)
     return results
 
 
@@ -318,6 +371,39 @@ def _build_free_prompt(user_query: str) -> list[dict]:
     return [system, user]
 
 
+def build_budgeted_prompt(user_query: str, contexts: List[Dict]) -> list[dict]:
+    """build_prompt with contexts packed into settings.llm_input_token_budget (instructions included)."""
+    budget = settings.llm_input_token_budget - count_message_tokens(build_prompt(user_query, []))
+    return build_prompt(user_query, pack_contexts(contexts, budget, max_chunk_tokens=max(1, budget)))
+
+
+_DETAILED_RE = re.compile(
+    r"\b(in detail|detailed|elaborate|step[- ]by[- ]step|compare|comparison|difference between|distinguish)\b",
+    re.IGNORECASE,
+)
+
+
+def _output_intent(user_query: str) -> str:
+    """Key into settings.llm_output_token_caps for the answer call."""
+    if _detect_intent(user_query).get("fundamental_rights_all"):
+        return "fundamental_rights_all"
+    if _DETAILED_RE.search(user_query or ""):
+        return "detailed"
+    return "default"
+
+
+def _log_usage(record: Dict):
+    usage = record.get("usage") or {}
+    if usage.get("calls") or usage.get("cached_calls"):
+        logging.getLogger(__name__).info(
+            "LLM usage: calls=%d cached=%d prompt_tokens=%d completion_tokens=%d",
+            usage.get("calls", 0),
+            usage.get("cached_calls", 0),
+            usage.get("prompt_tokens", 0),
+            usage.get("completion_tokens", 0),
+        )
+
+
 def _is_free_mode(user_query: str) -> bool:
     q = (user_query or "").lower()
     markers = [
@@ -337,14 +423,27 @@ def _format_output(text: str) -> str:
         - When disabled, sanitize Markdown markers and keep a low-key plain text style.
         """
         if settings.enable_markdown_rendering:
-                t = (text or "")
                 # Collapse excessive blank lines and trim; keep markdown markers
-                t = re.sub(r"\n{3,}", "\n\n", t)
-                return t.strip()
+                return ResponseFormatter.format(text, clean=False)
         return _format_plain(text)
 
 
+def _answer_formatter() -> ResponseFormatter:
+    """Streaming equivalent of _format_output(clean_legal_response(text))."""
+    return ResponseFormatter(clean=True, plain=not settings.enable_markdown_rendering)
+
+
 def answer(query: str, stream: bool = True) -> Iterable[str] | str:
+    """Answer a chat query; identical concurrent queries share one computation (and stream)."""
+    if not settings.chat_single_flight:
+        return _answer(query, stream)
+    key = flight_key(query)
+    if stream:
+        return chat_flights.stream(key, lambda: _answer(query, True))
+    return chat_flights.call(key, lambda: _answer(query, False))
+
+
+def _answer(query: str, stream: bool) -> Iterable[str] | str:
     # Small-talk friendly response
     if _is_smalltalk(query):
         text = _greeting_response()
@@ -355,37 +454,94 @@ def answer(query: str, stream: bool = True) -> Iterable[str] | str:
             return _gen()
         return _format_output(formatted)
 
-    contexts = retrieve_context(query)
-    # Filter out weak matches so we don't show irrelevant citations
-    strong = [c for c in contexts or [] if c.get("score", 0.0) >= MIN_SCORE]
-    # Also enforce admin approval gating based on metadata store
-    try:
-        approved_ids = {d.get("doc_id") for d in (meta_list() or []) if d.get("approved") is True}
-        if approved_ids:
-            strong = [c for c in strong if c.get("doc_id") in approved_ids]
-    except Exception:
-        # If metadata loading fails, proceed with current list
-        pass
-
-    # Intent-specific deterministic answer for complete fundamental rights list
-    intent = _detect_intent(query)
-    if intent.get("fundamental_rights_all") and strong:
-        text = _compose_fundamental_rights_answer(query)
-        formatted = clean_legal_response(text)
+    # Deterministic answers are resolved before any retrieval
+    fixed = _resolve_deterministic(query)
+    if fixed is not None:
         if stream:
             def _gen():
-                yield _format_output(formatted)
+                yield fixed
             return _gen()
-        return _format_output(formatted)
+        return fixed
+
+    # Semantic answer cache: near-identical questions skip retrieval and the LLM
+    probe = _answer_cache_probe(query)
+    if probe is not None:
+        hit = answer_cache.lookup(*probe)
+        if hit is not None:
+            if stream:
+                def _gen():
+                    yield hit
+                return _gen()
+            return hit
+
+    record: Dict = {"usage": new_usage()}
+    result = _answer_from_corpus(query, stream, record)
+    if stream:
+        def _finishing_stream():
+            parts: List[str] = []
+            for piece in result:
+                parts.append(piece)
+                yield piece
+            _log_usage(record)
+            if probe is not None and record.get("cacheable"):
+                answer_cache.store(*probe, "".join(parts), record.get("sources"))
+        return _finishing_stream()
+    _log_usage(record)
+    if probe is not None and record.get("cacheable"):
+        answer_cache.store(*probe, result, record.get("sources"))
+    return result
+
+
+def _answer_cache_probe(query: str) -> Tuple[np.ndarray, str] | None:
+    """Return (query_vector, scope) for the answer cache, or None when caching is off/unavailable.
+
+    The scope pins explicit Article/Section numbers and the output mode so that only
+    genuinely equivalent questions share an answer.
+    """
+    if not settings.answer_cache_enabled:
+        return None
+    try:
+        vec = embed_query(query, as_numpy=True)
+    except Exception:
+        return None
+    refs = _detect_legal_refs(query)
+    scope = "|".join([
+        "md" if settings.enable_markdown_rendering else "plain",
+        "a:" + ",".join(sorted(set(refs.get("articles") or []))),
+        "s:" + ",".join(sorted(set(refs.get("sections") or []))),
+    ])
+    return vec, scope
+
+
+def _strong_contexts(contexts: List[Dict]) -> List[Dict]:
+    # Filter out weak matches so we don't show irrelevant citations
+    # (admin approval gating already happened inside the Qdrant query)
+    return [c for c in contexts or [] if c.get("score", 0.0) >= MIN_SCORE]
 
-    # Intent-specific deterministic answer for Right to Equality
-    if intent.get("right_to_equality"):
-        text = _compose_right_to_equality_answer(query)
-        if stream:
-            def _gen():
-                yield _format_plain(text)
-            return _gen()
-        return _format_plain(text)
+
+def _max_context_chunks(strong: List[Dict]) -> int:
+    # Cross-encoder scores are precise enough to pass fewer chunks downstream
+    return settings.rerank_context_chunks if strong and "ce_score" in strong[0] else 8
+
+
+def _concat_contexts(strong: List[Dict], max_chunks: int) -> List[Dict]:
+    # Fallback when compression fails: top chunks as they are, packed into the input token budget
+    return pack_contexts(strong[:max_chunks], settings.llm_input_token_budget)
+
+
+def _sources(strong: List[Dict]) -> List[Tuple[str, int]]:
+    return [(c.get("doc_id"), c.get("chunk_id")) for c in strong]
+
+
+def _answer_from_corpus(query: str, stream: bool, record: Dict) -> Iterable[str] | str:
+    """Retrieval + LLM path of answer().
+
+    Sets record["cacheable"] (and record["sources"], the contributing (doc_id, chunk_id)
+    pairs) only when a real LLM answer was produced, never for fallback messages. Token
+    counts of the LLM calls are added to record["usage"].
+    """
+    usage = record.get("usage")
+    strong = _strong_contexts(retrieve_context(query))
 
     # If retrieval came up empty or very weak
     if not strong:
@@ -395,21 +551,18 @@ def answer(query: str, stream: bool = True) -> Iterable[str] | str:
             last_err = None
             for i in range(2):
                 try:
-                    llm = LLMClient()
-                    raw = llm.generate(_build_free_prompt(query), temperature=0.2, top_p=0.8, max_tokens=min(768, settings.llm_max_output_tokens))
+                    llm = get_llm_client()
+                    raw = llm.generate(_build_free_prompt(query), temperature=0.2, top_p=0.8, max_tokens=output_token_cap("free"), usage=usage)
+                    record.update(cacheable=True, sources=[])
                     return _format_output(clean_legal_response(raw))
+                except LLMOverloadedError:
+                    raise  # shed load instead of retrying into a full queue
                 except Exception as e:
                     last_err = e
                     logging.getLogger(__name__).exception("LLM free-mode failed: %s", e)
                     _time.sleep(0.25 * (2 ** i))
             # fallthrough to official sources guidance
-        guidance = (
-            "Sorry, I don't have the relevant information for your query right now. "
-            "Please refer to official Government of India legal resources: \n"
-            "- India Code: https://www.indiacode.nic.in/ (official repository of Central Acts)\n"
-            "- Legislative Department: https://legislative.gov.in (includes the Constitution of India)"
-        )
-        formatted = clean_legal_response(guidance)
+        formatted = clean_legal_response(_NO_INFO_MESSAGE)
         if stream:
             def _gen():
                 yield _format_output(formatted)
@@ -417,53 +570,65 @@ def answer(query: str, stream: bool = True) -> Iterable[str] | str:
         return _format_output(formatted)
 
     # Context compression: synthesize retrieved excerpts into a single, concise context before answering
+    max_chunks = _max_context_chunks(strong)
     try:
-        compressed = _compress_contexts(query, strong, max_chunks=8)
-        contexts_for_prompt = [{"doc_id": "synth", "chunk_id": 0, "text": compressed}]
+        contexts_for_prompt = [{"doc_id": "synth", "chunk_id": 0, "text": _compress_contexts(query, strong, max_chunks=max_chunks, usage=usage)}]
     except Exception:
-        # Fallback: join top chunks
-        join_text = "\n\n".join((c.get("text") or "")[:1200] for c in strong[:8])
-        contexts_for_prompt = [{"doc_id": "concat", "chunk_id": 0, "text": join_text}]
+        contexts_for_prompt = _concat_contexts(strong, max_chunks)
 
     # Build prompt and generate
-    msgs = build_prompt(query, contexts_for_prompt)
+    msgs = build_budgeted_prompt(query, contexts_for_prompt)
+    max_tokens = output_token_cap(_output_intent(query))
+    sources = _sources(strong)
     if stream:
         def _stream():
-            buf: List[str] = []
+            # Format incrementally so each line reaches the client as soon as it is final
+            fmt = _answer_formatter()
+            emitted = False
             try:
-                llm = LLMClient()
-                for tok in llm.stream_generate(msgs, temperature=0.2, top_p=0.8, max_tokens=settings.llm_max_output_tokens):
-                    buf.append(tok)
+                llm = get_llm_client()
+                for tok in llm.stream_generate(msgs, temperature=0.2, top_p=0.8, max_tokens=max_tokens, usage=usage):
+                    out = fmt.feed(tok)
+                    if out:
+                        emitted = True
+                        yield out
             except Exception as e:
                 # Graceful degradation for streaming path
                 logging.getLogger(__name__).exception("LLM streaming failed: %s", e)
+                if emitted:
+                    # Part of the answer is already on the wire; finish it and flag the cut-off
+                    tail = fmt.close()
+                    yield tail + "\n\n" + _format_output(clean_legal_response(_UNAVAILABLE_MESSAGE))
+                    return
+                if isinstance(e, LLMOverloadedError):
+                    yield _format_output(clean_legal_response(_UNAVAILABLE_MESSAGE))
+                    return
                 # Try non-stream fallback with a couple of quick retries
                 try:
                     import time as _time
                     last_err = None
                     for i in range(2):
                         try:
-                            llm2 = LLMClient()
-                            raw2 = llm2.generate(msgs, temperature=0.2, top_p=0.8, max_tokens=settings.llm_max_output_tokens)
+                            llm2 = get_llm_client()
+                            raw2 = llm2.generate(msgs, temperature=0.2, top_p=0.8, max_tokens=max_tokens, usage=usage)
                             final2 = clean_legal_response(raw2)
+                            record.update(cacheable=True, sources=sources)
                             yield _format_output(final2)
                             return
+                        except LLMOverloadedError:
+                            raise
                         except Exception as ee:
                             last_err = ee
                             _time.sleep(0.25 * (2 ** i))
                     raise last_err or e
                 except Exception:
                     # Fall back to official sources message instead of transient error text
-                    guidance = (
-                        "Sorry, I can't complete this right now. Please refer to official Government of India legal resources: \n"
-                        "- India Code: https://www.indiacode.nic.in/ (official repository of Central Acts)\n"
-                        "- Legislative Department: https://legislative.gov.in (includes the Constitution of India)"
-                    )
-                    yield _format_output(clean_legal_response(guidance))
+                    yield _format_output(clean_legal_response(_UNAVAILABLE_MESSAGE))
                     return
-            final = clean_legal_response("".join(buf))
-            final = _format_output(final)
-            yield final
+            tail = fmt.close()
+            record.update(cacheable=True, sources=sources)
+            if tail:
+                yield tail
         return _stream()
     # Non-stream: quick retry before official fallback
     try:
@@ -471,22 +636,22 @@ def answer(query: str, stream: bool = True) -> Iterable[str] | str:
         last_err = None
         for i in range(2):
             try:
-                llm = LLMClient()
-                raw = llm.generate(msgs, temperature=0.2, top_p=0.8, max_tokens=settings.llm_max_output_tokens)
+                llm = get_llm_client()
+                raw = llm.generate(msgs, temperature=0.2, top_p=0.8, max_tokens=max_tokens, usage=usage)
                 formatted = clean_legal_response(raw)
+                record.update(cacheable=True, sources=sources)
                 return _format_output(formatted)
+            except LLMOverloadedError:
+                raise
             except Exception as ee:
                 last_err = ee
                 _time.sleep(0.25 * (2 ** i))
         raise last_err
+    except LLMOverloadedError:
+        raise
     except Exception as e:
         logging.getLogger(__name__).exception("LLM generate failed: %s", e)
-        guidance = (
-            "Sorry, I can't complete this right now. Please refer to official Government of India legal resources: \n"
-            "- India Code: https://www.indiacode.nic.in/ (official repository of Central Acts)\n"
-            "- Legislative Department: https://legislative.gov.in (includes the Constitution of India)"
-        )
-        formatted = clean_legal_response(guidance)
+        formatted = clean_legal_response(_UNAVAILABLE_MESSAGE)
         return _format_output(formatted)
 
 
@@ -527,55 +692,10 @@ def _format_plain(text: str) -> str:
     - Preserve minimal inline subheadings like 'Legal basis:' or 'Sources:' as-is
     - Keep bullet lists as '-' bullets (do not renumber)
     - Collapse excessive blank lines
+
+    Line-based; see ResponseFormatter for the incremental (streaming) form.
     """
-    t = (text or "")
-
-    # Inline emphasis/code cleanup first (but keep heading/list markers intact)
-    # Replace **bold** and *italic* with plain text
-    t = re.sub(r"\*\*(.*?)\*\*", r"\1", t)
-    t = re.sub(r"\*(.*?)\*", r"\1", t)
-    # Replace `code` with plain text
-    t = re.sub(r"`([^`]*)`", r"\1", t)
-
-    lines = t.splitlines()
-    out_lines: List[str] = []
-    i = 0
-    while i < len(lines):
-        line = lines[i].rstrip()
-        # Drop a bare 'Title' line if the model emitted it literally
-        if i == 0 and line.strip().lower() == "title":
-            i += 1
-            while i < len(lines) and not lines[i].strip():
-                i += 1
-            continue
-        # Keep '#' headings as plain lines (remove the '#' markers for low-key style)
-        m = re.match(r"^\s{0,3}(#{1,6})\s+(.*)$", line)
-        if m:
-            title = m.group(2).strip()
-            out_lines.append(title)
-            i += 1
-            continue
-        # Keep bullets as '-' (do not renumber)
-        if line.lstrip().startswith("* "):
-            # Convert '*' bullets to '-' to keep a consistent minimal style
-            out_lines.append("- " + line.lstrip()[2:].strip())
-            i += 1
-            # Copy through following bullet lines
-            while i < len(lines) and (lines[i].lstrip().startswith("* ")):
-                out_lines.append("- " + lines[i].lstrip()[2:].strip())
-                i += 1
-            continue
-
-        out_lines.append(line)
-        i += 1
-
-    # Collapse excessive blank lines
-    normalized = re.sub(r"\n{3,}", "\n\n", "\n".join(out_lines)).strip()
-    # Final cleanup: remove stray hashes/asterisks/underscores that may remain
-    normalized = normalized.replace("#", "")
-    normalized = normalized.replace("**", "").replace("*", "")
-    normalized = normalized.replace("_", " ")
-    return normalized
+    return ResponseFormatter.format(text, clean=False, plain=True)
 
 
 def clean_legal_response(text: str) -> str:
@@ -589,56 +709,12 @@ def clean_legal_response(text: str) -> str:
     - Remove duplicate consecutive titles/headings
     - Collapse excessive blank lines
     - Remove stray markdown markers (` ** * _ ) that remain
+
+    Line-based; see ResponseFormatter for the incremental (streaming) form.
     """
     if not text:
         return text
-    t = text
-
-    # 1) Convert markdown links to 'text (url)'
-    t = re.sub(r"\[(.*?)\]\((.*?)\)", r"\1 (\2)", t)
-
-    # 2) Normalize atx headings (# ...)
-    #    Any line starting with 1-6 hashes becomes a simple 'Heading:' line (no bold)
-    t = re.sub(r"(?m)^\s*#{1,6}\s*(.+?)\s*$", r"\n\1:\n", t)
-
-    # 3) Convert bold-only lines at start to 'Label:'
-    #    E.g., '**Legal Basis**' or '**Legal Basis:**' => 'Legal Basis:'
-    t = re.sub(r"(?m)^\s*\*\*\s*(.*?)\s*\*\*\s*:?[\s]*$", r"\1:", t)
-
-    # 3a) If a heading line starts with 'Title: ...', drop the 'Title: ' label
-    t = re.sub(r"(?m)^\s*Title:\s*(.+?):\s*$", r"\1:", t)
-
-    # 4) Standardize bullets: lines starting with '-' or '*' become '• '
-    t = re.sub(r"(?m)^\s*[\-\*]\s+", "• ", t)
-
-    # 5) Remove remaining bold/italic markers within text
-    t = re.sub(r"\*\*(.*?)\*\*", r"\1", t)
-    t = re.sub(r"\*(.*?)\*", r"\1", t)
-
-    # 6) Remove inline code/backticks; underscores to spaces
-    t = t.replace("`", "")
-    t = t.replace("_", " ")
-
-    # 7) Trim duplicate consecutive title lines (lines that end with ':')
-    lines = t.splitlines()
-    out_lines: List[str] = []
-    prev_title = None
-    for line in lines:
-        s = line.strip()
-        if s.endswith(":"):
-            if prev_title == s:
-                continue  # skip duplicate title
-            prev_title = s
-        else:
-            prev_title = None
-        out_lines.append(line)
-    t = "\n".join(out_lines)
-
-    # 8) Collapse 3+ blank lines into 2, strip ends
-    t = re.sub(r"\n{3,}", "\n\n", t)
-    # 9) De-duplicate link text when it's the same as URL: 'url (url)' -> 'url'
-    t = re.sub(r"(?im)(https?://[^\s)]+) \(\1\)", r"\1", t)
-    return t.strip()
+    return ResponseFormatter.format(text)
 
 
 def _detect_intent(query: str) -> Dict[str, bool]:
@@ -686,20 +762,94 @@ def _compose_right_to_equality_answer(user_query: str) -> str:
     return "\n".join(lines)
 
 
-def _compress_contexts(user_query: str, contexts: List[Dict], max_chunks: int = 8) -> str:
-    """Summarize retrieved contexts into a single concise, reasoning-oriented context.
+class _DeterministicIntent(NamedTuple):
+    """A fixed answer served without retrieval or LLM calls.
+
+    probes: queries whose corpus coverage gates the answer (empty = always served).
+    """
+    compose: Callable[[str], str]
+    render: Callable[[str], str]
+    probes: Tuple[str, ...] = ()
+
+
+# Checked in order; the first detected and covered intent wins
+_DETERMINISTIC_INTENTS: Dict[str, _DeterministicIntent] = {
+    "fundamental_rights_all": _DeterministicIntent(
+        compose=_compose_fundamental_rights_answer,
+        render=lambda text: _format_output(clean_legal_response(text)),
+        probes=tuple(_fundamental_rights_queries()),
+    ),
+    "right_to_equality": _DeterministicIntent(
+        compose=_compose_right_to_equality_answer,
+        render=_format_plain,
+    ),
+}
+
+# intent name -> (corpus_version, covered)
+_COVERAGE: Dict[str, Tuple[int, bool]] = {}
+
+
+def _probe_coverage(probes: Tuple[str, ...]) -> bool:
+    """True when any probe has a strong, approved match in the corpus."""
+    store = _corpus_store()
+    for matches in _search_many(store, [(q, 3) for q in probes]):
+        if any(m.get("score", 0.0) >= MIN_SCORE for m in matches):
+            return True
+    return False
+
 
-    Uses the configured LLM with a small token budget; falls back to concatenation if generation fails.
+def _intent_covered(name: str, spec: _DeterministicIntent) -> bool:
+    if not spec.probes:
+        return True
+    version = corpus_version()
+    cached = _COVERAGE.get(name)
+    if cached is not None and cached[0] == version:
+        return cached[1]
+    try:
+        covered = _probe_coverage(spec.probes)
+    except Exception as e:
+        # Do not cache failures (e.g. Qdrant unavailable); fall back to normal retrieval
+        logging.getLogger(__name__).warning("Intent coverage probe failed for %s: %s", name, e)
+        return False
+    _COVERAGE[name] = (version, covered)
+    return covered
+
+
+def sync_corpus_approval() -> None:
+    """Backfill the ``approved`` payload flag from the metadata store.
+
+    Points ingested before approval lived in the payload have no flag and would be
+    hidden by the approval filter; this brings them in line (one bulk update per doc).
     """
-    # Prepare compact snippets from top-N strong contexts
-    snippets = []
-    for c in (contexts or [])[:max_chunks]:
-        text = (c.get("text") or "").strip().replace("\n", " ")
-        if not text:
-            continue
-        snippets.append(text[:800])  # trim per snippet to control size
+    store = _corpus_store()
+    store.ensure_payload_indexes()
+    for d in meta_list() or []:
+        if d.get("doc_id"):
+            store.set_doc_approved(d["doc_id"], d.get("approved") is True)
+
+
+def refresh_intent_coverage() -> None:
+    """Precompute coverage for all gated intents (e.g. at startup or after corpus changes)."""
+    for name, spec in _DETERMINISTIC_INTENTS.items():
+        _intent_covered(name, spec)
+
+
+def _resolve_deterministic(query: str) -> str | None:
+    intent = _detect_intent(query)
+    for name, spec in _DETERMINISTIC_INTENTS.items():
+        if intent.get(name) and _intent_covered(name, spec):
+            return spec.render(spec.compose(query))
+    return None
+
+
+def _compression_messages(user_query: str, contexts: List[Dict], max_chunks: int = 8) -> Tuple[List[Dict], List[str]]:
+    """Return (messages, snippets) for the context compressor; messages is empty when there is nothing to compress."""
+    # Compact snippets from top-N strong contexts, sharing the compressor's input token budget
+    budget = settings.context_compress_input_tokens
+    packed = pack_contexts((contexts or [])[:max_chunks], budget, max_chunk_tokens=max(64, budget // max(1, max_chunks)))
+    snippets = [c["text"].replace("\n", " ") for c in packed]
     if not snippets:
-        return ""
+        return [], []
 
     system = {
         "role": "system",
@@ -719,53 +869,43 @@ def _compress_contexts(user_query: str, contexts: List[Dict], max_chunks: int =
             "Excerpts:\n- " + "\n- ".join(snippets)
         ),
     }
-    try:
-        llm = LLMClient()
-        summary = llm.generate([system, user], temperature=0.1, top_p=0.9, max_tokens=600)
-        return summary or "\n\n".join(snippets[:3])
-    except Exception:
-        return "\n\n".join(snippets[:3])
+    return [system, user], snippets
 
 
-@lru_cache(maxsize=1)
-def _load_legal_links() -> Dict[str, Dict]:
-    """Load cross-link mapping between constitutional articles and statutory sections/keywords.
+def _use_extractive_compressor() -> bool:
+    mode = (settings.context_compressor or "auto").lower().strip()
+    if mode == "auto":
+        # The LLM compressor costs a full extra round trip; skip it under a latency budget
+        return settings.answer_latency_budget_ms > 0
+    return mode == "extractive"
 
-    JSON format example:
-    {
-      "19(1)(a)": {"Linked_Sections": ["69A IT Act", "69 IT Act"], "Keywords": ["speech","ban","public order"]},
-      "19(2)": {"Linked_Sections": ["69A IT Act"], "Keywords": ["reasonable restriction","public order","decency","morality","security of state"]}
-    }
+
+def _extractive_context(user_query: str, contexts: List[Dict], max_chunks: int = 8) -> str:
+    """Local compressor: query-relevant sentences of the top chunks, no LLM call."""
+    text = extractive_compress(user_query, contexts, max_chunks=max_chunks)
+    if text:
+        return text
+    _, snippets = _compression_messages(user_query, contexts, max_chunks)
+    return "\n\n".join(snippets[:3])
+
+
+def _compress_contexts(user_query: str, contexts: List[Dict], max_chunks: int = 8, usage: Dict | None = None) -> str:
+    """Summarize retrieved contexts into a single concise, reasoning-oriented context.
+
+    Uses the configured LLM with a small token budget, or the local extractive compressor
+    (settings.context_compressor); falls back to concatenation if generation fails.
     """
+    if _use_extractive_compressor():
+        return _extractive_context(user_query, contexts, max_chunks)
+    msgs, snippets = _compression_messages(user_query, contexts, max_chunks)
+    if not msgs:
+        return ""
     try:
-        here = os.path.dirname(__file__)
-        path = os.path.join(here, "legal_links.json")
-        if os.path.exists(path):
-            with open(path, "r", encoding="utf-8") as f:
-                data = json.load(f)
-                if isinstance(data, dict):
-                    return data
+        llm = get_llm_client()
+        summary = llm.generate(msgs, temperature=0.1, top_p=0.9, max_tokens=output_token_cap("compress"), usage=usage)
+        return summary or "\n\n".join(snippets[:3])
     except Exception:
-        pass
-    # Default minimal mapping
-    return {
-        "19(1)(a)": {
-            "Linked_Sections": ["69A IT Act", "69 IT Act"],
-            "Keywords": ["speech", "publish", "ban", "expression", "censorship"],
-        },
-        "19(2)": {
-            "Linked_Sections": ["69A IT Act"],
-            "Keywords": ["reasonable restriction", "public order", "decency", "morality", "security of the state", "sovereignty"],
-        },
-        "32": {
-            "Linked_Sections": [],
-            "Keywords": ["writ", "remedy"],
-        },
-        "226": {
-            "Linked_Sections": [],
-            "Keywords": ["writ", "high court"],
-        },
-    }
+        return "\n\n".join(snippets[:3])
 
 
 def _detect_legal_refs(q: str) -> Dict[str, object]:
@@ -0,0 +1,171 @@
+"""Startup warmup and cached readiness.
+
+At startup a background thread loads the embedder (and runs one throwaway encode so
+kernels and tokenizer caches are warm), builds the shared LLM client and primes the
+Qdrant collection cache, so the first real request does not pay for any of it. The
+same thread then re-checks the dependencies every settings.readiness_probe_interval_seconds
+and publishes a snapshot; /health/ready only reads that snapshot and never does I/O
+itself. Warmup steps that failed are retried on every probe.
+"""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Dict, Optional
+
+from app.core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+_started = False
+_warm: Dict[str, bool] = {"embedder": False, "llm": False, "qdrant": False}
+_snapshot: Dict = {
+    "ready": False,
+    "embedder": False,
+    "llm": False,
+    "qdrant": False,
+    "errors": {},
+    "checked_at": None,
+}
+
+_WARMUP_TEXT = "Article 21: protection of life and personal liberty."
+
+
+def _warm_embedder():
+    from app.services.embedding import embed_texts, embedding_dimension
+
+    embedding_dimension()
+    # Not embed_query: the warmup text should not occupy the query cache
+    embed_texts([_WARMUP_TEXT], as_numpy=True)
+
+
+def _warm_llm():
+    from app.services.llm_client import get_llm_client
+
+    client = get_llm_client()
+    if settings.warmup_llm_call:
+        # Resolves the working model id (Gemini fallbacks) before the first user call
+        client.generate(
+            [{"role": "user", "content": "Reply with OK."}],
+            max_tokens=4,
+            cache=False,
+            priority="background",
+        )
+
+
+def _warm_qdrant():
+    from app.services.embedding import embedding_dimension
+    from app.services.vector_store import QdrantStore
+
+    # Caches the corpus collection's dimension, so request paths skip the round trip
+    QdrantStore().ensure_collection(embedding_dimension())
+
+
+_WARMUPS = {"embedder": _warm_embedder, "llm": _warm_llm, "qdrant": _warm_qdrant}
+
+
+def _check_embedder() -> bool:
+    from app.services.embedding import embed_server_client
+
+    # In process the model cannot go away once loaded; a shared server can
+    if embed_server_client.enabled:
+        embed_server_client.ping()
+    return True
+
+
+def _check_llm() -> bool:
+    from app.services.llm_client import llm_pool_stats
+
+    # Healthy unless every provider's circuit is open (providers never called are closed)
+    breakers = llm_pool_stats().get("providers") or {}
+    return not breakers or any(b.get("state") != "open" for b in breakers.values())
+
+
+def _check_qdrant() -> bool:
+    from app.services.vector_store import get_qdrant_client
+
+    get_qdrant_client().get_collection(settings.qdrant_corpus_collection)
+    return True
+
+
+def probe() -> Dict:
+    """Run pending warmups and dependency checks once; publishes and returns the snapshot."""
+    started = time.monotonic()
+    errors: Dict[str, str] = {}
+    for name, fn in _WARMUPS.items():
+        if _warm[name]:
+            continue
+        # The collection check needs the vector size
+        if name == "qdrant" and not _warm["embedder"]:
+            errors[name] = "waiting for the embedder"
+            continue
+        try:
+            fn()
+            _warm[name] = True
+        except Exception as e:
+            errors[name] = str(e)
+    checks = {"embedder": False, "llm": False, "qdrant": False}
+    if _warm["embedder"]:
+        try:
+            checks["embedder"] = _check_embedder()
+        except Exception as e:
+            errors["embedder"] = str(e)
+    if _warm["llm"]:
+        try:
+            checks["llm"] = _check_llm()
+            if not checks["llm"]:
+                errors["llm"] = "all provider circuits are open"
+        except Exception as e:
+            errors["llm"] = str(e)
+    if _warm["qdrant"]:
+        try:
+            checks["qdrant"] = _check_qdrant()
+        except Exception as e:
+            errors["qdrant"] = str(e)
+    snapshot = {
+        "ready": all(checks.values()),
+        **checks,
+        "errors": errors,
+        "checked_at": time.time(),
+        "probe_ms": round(1000.0 * (time.monotonic() - started), 1),
+    }
+    with _lock:
+        _snapshot.clear()
+        _snapshot.update(snapshot)
+    return snapshot
+
+
+def _run():
+    interval = max(0.5, float(settings.readiness_probe_interval_seconds))
+    while True:
+        try:
+            snap = probe()
+            if snap["errors"]:
+                logger.debug("Readiness: %s", snap["errors"])
+        except Exception as e:
+            logger.warning("Readiness probe failed: %s", e)
+        time.sleep(interval)
+
+
+def start_readiness_prober():
+    """Start the warmup + probe thread once per process."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_run, name="readiness-prober", daemon=True).start()
+
+
+def readiness_snapshot() -> Dict:
+    """Last published snapshot; a stale one (prober stuck or dead) reports not ready."""
+    with _lock:
+        snap = dict(_snapshot)
+    checked_at: Optional[float] = snap.get("checked_at")
+    age = time.time() - checked_at if checked_at else None
+    snap["age_seconds"] = round(age, 1) if age is not None else None
+    if age is None or age > 3 * max(0.5, float(settings.readiness_probe_interval_seconds)) + 30:
+        snap["ready"] = False
+    return snap
@@ -0,0 +1,308 @@
+from __future__ import annotations
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from functools import lru_cache
+from typing import Dict, List, Tuple
+import numpy as np
+from app.core.config import settings
+from app.services.legal_links import get_link_matcher
+
+# Feature columns of the candidate matrix and their default weights.
+# "dense" is the vector similarity itself; the rest are the hand-tuned bonuses.
+FEATURES: Tuple[str, ...] = (
+    "dense",
+    "article_match",
+    "section_match",
+    "part_match",
+    "chapter_match",
+    "article_proximity",
+    "restriction_terms",
+    "procedural_terms",
+    "procedure_tags",
+    "lexical",
+    "statute_link",
+)
+DEFAULT_WEIGHTS: Dict[str, float] = {
+    "dense": 1.0,
+    "article_match": 0.22,
+    "section_match": 0.18,
+    "part_match": 0.06,
+    "chapter_match": 0.05,
+    "article_proximity": 0.15,
+    "restriction_terms": 0.10,
+    "procedural_terms": 0.08,
+    "procedure_tags": 0.10,
+    "lexical": 0.12,
+    "statute_link": 0.12,
+}
+
+_RESTRICTION_TERMS = [
+    "reasonable restriction", "subject to", "notwithstanding", "restriction", "exception", "reservation",
+    "classification", "intelligible differentia", "rational nexus", "public order", "morality", "security of state",
+]
+_PROCEDURAL_TERMS = [
+    "procedure", "safeguard", "reasons to be recorded in writing", "by order", "subject to the provisions of sub-section",
+    "rules may be prescribed", "block", "blocking", "intercept", "monitor", "decrypt",
+]
+_PROCEDURE_TAGS = {"procedure", "safeguard", "blocking", "interception"}
+_RESTRICTION_RE = re.compile("|".join(re.escape(t) for t in _RESTRICTION_TERMS))
+_PROCEDURAL_RE = re.compile("|".join(re.escape(t) for t in _PROCEDURAL_TERMS))
+
+
+def weight_vector() -> np.ndarray:
+    """Weights in FEATURES order; settings.rerank_weights overrides individual entries."""
+    overrides = settings.rerank_weights or {}
+    return np.array([float(overrides.get(f, DEFAULT_WEIGHTS[f])) for f in FEATURES], dtype=np.float32)
+
+
+def extract_refs(q: str) -> Dict[str, List[str]]:
+    ql = (q or "").lower()
+    arts = re.findall(r"article\s+(\d+[a-z]?)", ql)
+    secs = re.findall(r"section\s+(\d+[a-z]?)", ql)
+    parts = re.findall(r"part\s+([ivxlcdm]+|\d+)", ql)
+    chaps = re.findall(r"chapter\s+([ivxlcdm]+|\d+)", ql)
+    return {"article": arts, "section": secs, "part": parts, "chapter": chaps}
+
+
+def invoked_articles(q: str, refs_map: Dict[str, List[str]]) -> List[int]:
+    """Articles the query invokes explicitly or through right/ground cues (proximity targets)."""
+    ql = (q or "").lower()
+    nums: List[int] = []
+    for a in refs_map.get("article", []) or []:
+        try:
+            nums.append(int(re.sub(r"[^0-9]", "", a)))
+        except Exception:
+            pass
+    # Public order / speech / assembly / association cues => Article 19 proximity
+    if any(k in ql for k in ["public order", "decency", "morality", "sovereignty", "security of the state", "free speech", "freedom of speech", "article 19"]):
+        nums.append(19)
+    if "right to equality" in ql or "equality before law" in ql:
+        nums.extend([14, 15, 16, 17, 18])
+    if "right to freedom" in ql:
+        nums.extend([19, 20, 21, 22])
+    if "right against exploitation" in ql:
+        nums.extend([23, 24])
+    if "freedom of religion" in ql:
+        nums.extend([25, 26, 27, 28])
+    if "cultural" in ql and "educational" in ql:
+        nums.extend([29, 30])
+    if "constitutional remedies" in ql:
+        nums.extend([32])
+    return nums
+
+
+def _meta_value(meta: Dict, key: str):
+    return meta.get(key) or meta.get(key.capitalize()) or meta.get(key.upper())
+
+
+def statute_links(meta: Dict, text: str) -> List[int]:
+    """Statute → Constitution link mapper: compiled JSON mapping plus hand-tuned fallbacks."""
+    title = (meta.get("title") or meta.get("source_path") or "").lower()
+    section = str(meta.get("section") or "").upper()
+    t = (text or "").lower()
+    links: List[int] = []
+    # JSON-driven mapping
+    try:
+        links.extend(get_link_matcher().articles_for(section, text or ""))
+    except Exception:
+        pass
+    # Hand-tuned fallbacks
+    if ("information technology" in title or "it_act" in title or "it act" in title):
+        if section in ("69A", "69") or ("section 69a" in t or "section 69" in t):
+            links.append(19)
+    if ("code of criminal procedure" in title or "crpc" in title) and section == "144":
+        links.append(19)
+    return links
+
+
+class _StaticFeatures:
+    """Query-independent features of a chunk, computed once per chunk and link-map version."""
+
+    __slots__ = ("article", "section", "part", "chapter", "art_num", "restriction", "procedural", "tagged", "links")
+
+    def __init__(self, r: Dict):
+        meta = r.get("meta", {}) or {}
+        art = _meta_value(meta, "article")
+        self.article = str(art).lower() if art else None
+        sec = _meta_value(meta, "section")
+        self.section = str(sec).lower() if sec else None
+        part = _meta_value(meta, "part")
+        self.part = str(part).lower() if part else None
+        chap = _meta_value(meta, "chapter")
+        self.chapter = str(chap).lower() if chap else None
+        try:
+            self.art_num = int(re.sub(r"[^0-9]", "", str(art))) if art else 0
+        except Exception:
+            self.art_num = 0
+        text_low = (r.get("text", "") or "").lower()
+        self.restriction = 1.0 if _RESTRICTION_RE.search(text_low) else 0.0
+        self.procedural = 1.0 if _PROCEDURAL_RE.search(text_low) else 0.0
+        tags = meta.get("tags") or []
+        self.tagged = 1.0 if isinstance(tags, list) and any(t in _PROCEDURE_TAGS for t in tags) else 0.0
+        self.links = frozenset(statute_links(meta, r.get("text") or ""))
+
+
+_static_cache: "OrderedDict[tuple, _StaticFeatures]" = OrderedDict()
+_static_lock = threading.Lock()
+_STATIC_CACHE_MAX = 8192
+
+
+def _static_features(r: Dict) -> _StaticFeatures:
+    key = (get_link_matcher().generation, r.get("id") or (r.get("doc_id"), r.get("chunk_id")))
+    with _static_lock:
+        feats = _static_cache.get(key)
+        if feats is not None:
+            _static_cache.move_to_end(key)
+            return feats
+    feats = _StaticFeatures(r)
+    with _static_lock:
+        _static_cache[key] = feats
+        while len(_static_cache) > _STATIC_CACHE_MAX:
+            _static_cache.popitem(last=False)
+    return feats
+
+
+def feature_matrix(query: str, candidates: List[Dict]) -> np.ndarray:
+    """Build the candidates × FEATURES matrix for a query."""
+    refs = extract_refs(query)
+    targets = invoked_articles(query, refs)
+    statics = [_static_features(r) for r in candidates]
+    n = len(candidates)
+    X = np.zeros((n, len(FEATURES)), dtype=np.float32)
+    if not n:
+        return X
+    col = {f: i for i, f in enumerate(FEATURES)}
+
+    X[:, col["dense"]] = [float(r.get("score") or 0.0) for r in candidates]
+    X[:, col["lexical"]] = [float(r.get("lexical") or 0.0) for r in candidates]
+    X[:, col["restriction_terms"]] = [s.restriction for s in statics]
+    X[:, col["procedural_terms"]] = [s.procedural for s in statics]
+    X[:, col["procedure_tags"]] = [s.tagged for s in statics]
+
+    # Exact legal number alignment
+    for name, attr, wanted in (
+        ("article_match", "article", set(refs["article"])),
+        ("section_match", "section", set(refs["section"])),
+        ("part_match", "part", set(refs["part"])),
+        ("chapter_match", "chapter", set(refs["chapter"])),
+    ):
+        if wanted:
+            X[:, col[name]] = [1.0 if getattr(s, attr) in wanted else 0.0 for s in statics]
+
+    if targets:
+        # Statute links of the pool widen the proximity targets (order-independent);
+        # the link bonus itself requires a link to an article the query invokes.
+        target_set = set(targets)
+        X[:, col["statute_link"]] = [1.0 if s.links & target_set else 0.0 for s in statics]
+        expanded = np.array(sorted(target_set.union(*[s.links for s in statics])), dtype=np.float32)
+        art_nums = np.array([s.art_num for s in statics], dtype=np.float32)
+        dist = np.abs(art_nums[:, None] - expanded[None, :]).min(axis=1)
+        proximity = np.clip(1.0 - dist / 10.0, 0.0, 1.0)
+        X[:, col["article_proximity"]] = np.where(art_nums > 0, proximity, 0.0)
+    return X
+
+
+def heuristic_rerank(query: str, candidates: List[Dict], top_k: int) -> List[Dict]:
+    """Score = feature matrix · weight vector; ties broken by fused rank (rrf)."""
+    if not candidates:
+        return []
+    scores = feature_matrix(query, candidates) @ weight_vector()
+    rrf = np.array([float(r.get("rrf") or 0.0) for r in candidates], dtype=np.float32)
+    order = np.lexsort((-rrf, -scores))
+    return [candidates[i] for i in order[:top_k]]
+
+
+# --- Optional cross-encoder stage ---
+
+# One worker: batched scoring already uses all torch threads; queuing beats oversubscription
+_ce_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="cross-encoder")
+_ce_scores: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+_ce_lock = threading.Lock()
+_CE_CACHE_MAX = 20000
+# Scoring jobs queued or running, by query hash; beyond _CE_MAX_PENDING requests skip the stage
+_ce_pending: Dict[str, Future] = {}
+_CE_MAX_PENDING = 4
+
+
+@lru_cache(maxsize=1)
+def get_cross_encoder():
+    from sentence_transformers import CrossEncoder
+
+    return CrossEncoder(settings.rerank_cross_encoder_model, device="cpu", max_length=512)
+
+
+def _query_hash(query: str) -> str:
+    return hashlib.sha1(re.sub(r"\s+", " ", (query or "").strip()).encode("utf-8")).hexdigest()
+
+
+def _point_key(r: Dict) -> str:
+    return str(r.get("id") or f"{r.get('doc_id')}:{r.get('chunk_id')}")
+
+
+def _score_pairs(query: str, qhash: str, candidates: List[Dict]):
+    """Score all pairs in one batched predict call and remember the results."""
+    model = get_cross_encoder()
+    pairs = [(query, r.get("text") or "") for r in candidates]
+    scores = model.predict(pairs, batch_size=len(pairs), show_progress_bar=False)
+    with _ce_lock:
+        for r, sc in zip(candidates, scores):
+            _ce_scores[(qhash, _point_key(r))] = float(sc)
+        while len(_ce_scores) > _CE_CACHE_MAX:
+            _ce_scores.popitem(last=False)
+
+
+def _forget_pending(qhash: str, fut: Future):
+    with _ce_lock:
+        if _ce_pending.get(qhash) is fut:
+            del _ce_pending[qhash]
+
+
+def cross_encoder_rerank(query: str, candidates: List[Dict]) -> List[Dict]:
+    """Reorder the head of a heuristically ranked list by cross-encoder score.
+
+    Scores are cached by (query hash, point id). If uncached pairs are not scored within
+    the latency budget the heuristic order is returned unchanged; a job that already
+    started keeps running and fills the cache for the next identical query, one still
+    queued is cancelled. Identical concurrent queries share one job, and while
+    _CE_MAX_PENDING jobs are outstanding new queries keep the heuristic order instead of
+    queueing more work. Reordered items carry 'ce_score'.
+    """
+    head = candidates[: max(0, settings.rerank_cross_encoder_max_candidates)]
+    if not head:
+        return candidates
+    qhash = _query_hash(query)
+    with _ce_lock:
+        missing = [r for r in head if (qhash, _point_key(r)) not in _ce_scores]
+    if missing:
+        submitted = False
+        with _ce_lock:
+            fut = _ce_pending.get(qhash)
+            if fut is None:
+                if len(_ce_pending) >= _CE_MAX_PENDING:
+                    logging.getLogger(__name__).info("Cross-encoder backlogged; keeping heuristic order")
+                    return candidates
+                fut = _ce_pending[qhash] = _ce_executor.submit(_score_pairs, query, qhash, missing)
+                submitted = True
+        if submitted:
+            # Outside _ce_lock: a job that already finished runs the callback right here
+            fut.add_done_callback(lambda f, k=qhash: _forget_pending(k, f))
+        try:
+            fut.result(timeout=settings.rerank_cross_encoder_budget_ms / 1000.0)
+        except FutureTimeout:
+            # Not started yet: nobody is waiting for it any more, so drop it from the queue
+            fut.cancel()
+            logging.getLogger(__name__).info("Cross-encoder over budget; keeping heuristic order")
+            return candidates
+        except CancelledError:
+            return candidates
+        except Exception as e:
+            logging.getLogger(__name__).warning("Cross-encoder failed: %s", e)
+            return candidates
+    with _ce_lock:
+        scored = [(_ce_scores.get((qhash, _point_key(r)), float("-inf")), r) for r in head]
+    scored.sort(key=lambda x: x[0], reverse=True)
+    return [{**r, "ce_score": sc} for sc, r in scored] + candidates[len(head):]
@@ -0,0 +1,216 @@
+"""Incremental, line-buffered formatter for LLM answers.
+
+Implements clean_legal_response / _format_plain as a state machine over lines so a
+streamed answer can be sanitized and emitted as soon as each line is final, instead
+of after the whole generation. The batch helpers in rag_engine feed the complete
+text through the same machine, so streamed and one-shot answers are identical.
+
+Lines are held back only while later input can still change them: the current
+partial line, blank lines (a following bullet or bold label may swallow them) and a
+bare 'Title:' line (merged with a following 'Heading:' line).
+"""
+from __future__ import annotations
+
+import re
+from typing import List, Optional, Tuple
+
+# clean_legal_response rules, applied per line
+_LINK_RE = re.compile(r"\[(.*?)\]\((.*?)\)")
+_ATX_HEADING_RE = re.compile(r"^\s*#{1,6}\s*(.+?)\s*$")
+_BOLD_LABEL_RE = re.compile(r"^\s*\*\*\s*(.*?)\s*\*\*\s*:?\s*$")
+_TITLE_LABEL_RE = re.compile(r"^\s*Title:\s*(.+?):\s*$")
+_BARE_TITLE_RE = re.compile(r"^\s*Title:\s*$")
+_LABEL_RE = re.compile(r"^\s*(.+?):\s*$")
+_BULLET_RE = re.compile(r"^\s*[\-\*]\s+")
+_BOLD_RE = re.compile(r"\*\*(.*?)\*\*")
+_ITALIC_RE = re.compile(r"\*(.*?)\*")
+_CODE_RE = re.compile(r"`([^`]*)`")
+_DUP_URL_RE = re.compile(r"(?i)(https?://[^\s)]+) \(\1\)")
+
+# _format_plain rules
+_PLAIN_HEADING_RE = re.compile(r"^\s{0,3}(#{1,6})\s+(.*)$")
+
+
+class _LineJoiner:
+    """Joins final lines: collapses blank-line runs to one and strips both ends."""
+
+    def __init__(self):
+        self._started = False
+        self._blank = False
+        self._trailing = ""  # held whitespace of the last emitted line
+
+    def push(self, line: str) -> str:
+        if not line.strip():
+            self._blank = self._started
+            return ""
+        if not self._started:
+            self._started = True
+            out = line.lstrip()
+        else:
+            out = self._trailing + ("\n\n" if self._blank else "\n") + line
+        self._blank = False
+        body = out.rstrip()
+        self._trailing = out[len(body):]
+        return body
+
+
+class _CleanStage:
+    """clean_legal_response as a line state machine.
+
+    Bold labels and 'Title:' merges swallow adjacent blank lines, bullets swallow the
+    blank lines above them, and headings are set off by one blank line on each side.
+    Consecutive duplicate labels are dropped.
+    """
+
+    def __init__(self):
+        self._blank = False       # a blank line is pending before the next content line
+        self._eat_blanks = False  # previous line swallows the blank lines that follow it
+        self._prev_label: Optional[str] = None
+        # Bare 'Title:' line waiting for the next content line: _emit() arguments
+        self._held: Optional[Tuple[str, bool, bool, bool]] = None
+
+    def _classify(self, line: str) -> Tuple[str, bool, bool]:
+        """Apply the structural rules; returns (text, is_heading, is_glue)."""
+        t = _LINK_RE.sub(r"\1 (\2)", line)
+        heading = False
+        m = _ATX_HEADING_RE.match(t)
+        if m:
+            t, heading = m.group(1) + ":", True
+        glue = False
+        m = _BOLD_LABEL_RE.match(t)
+        if m:
+            t, glue = m.group(1) + ":", True
+        m = _TITLE_LABEL_RE.match(t)
+        if m:
+            t, glue = m.group(1) + ":", True
+        return t, heading, glue
+
+    @staticmethod
+    def _inline(t: str) -> Tuple[str, bool]:
+        """Bullet and inline-marker rules; returns (text, is_bullet)."""
+        bullet = bool(_BULLET_RE.match(t))
+        if bullet:
+            t = _BULLET_RE.sub("• ", t, count=1)
+        t = _BOLD_RE.sub(r"\1", t)
+        t = _ITALIC_RE.sub(r"\1", t)
+        return t.replace("`", "").replace("_", " "), bullet
+
+    def _emit(self, t: str, blank_before: bool, glue: bool, heading: bool) -> List[str]:
+        t, bullet = self._inline(t)
+        self._eat_blanks = glue
+        self._blank = heading and not glue
+        out: List[str] = []
+        if blank_before and not glue and not bullet:
+            out.append("")
+            self._prev_label = None
+        s = t.strip()
+        if s.endswith(":"):
+            if self._prev_label == s:
+                return out  # duplicate consecutive label
+            self._prev_label = s
+        else:
+            self._prev_label = None
+        out.append(_DUP_URL_RE.sub(r"\1", t))
+        return out
+
+    def push(self, line: str) -> List[str]:
+        if not line.strip():
+            if not self._eat_blanks:
+                self._blank = True
+            return []
+        t, heading, glue = self._classify(line)
+        blank_before = self._blank or (heading and not self._eat_blanks)
+        out: List[str] = []
+        if self._held is not None:
+            held, self._held = self._held, None
+            m = _LABEL_RE.match(t)
+            if m:
+                # 'Title:' followed by a label line collapses into that label
+                return self._emit(m.group(1) + ":", False, True, False)
+            out.extend(self._emit(*held))
+        if _BARE_TITLE_RE.match(t):
+            self._held = (t, blank_before, glue, heading)
+            self._eat_blanks = glue
+            self._blank = heading and not glue
+            return out
+        out.extend(self._emit(t, blank_before, glue, heading))
+        return out
+
+    def close(self) -> List[str]:
+        if self._held is None:
+            return []
+        held, self._held = self._held, None
+        return self._emit(*held)
+
+
+class _PlainStage:
+    """_format_plain rules per line: strips remaining Markdown markers for plain-text output."""
+
+    def __init__(self):
+        self._first = True
+
+    def push(self, line: str) -> List[str]:
+        if not line.strip():
+            return [""]
+        first, self._first = self._first, False
+        t = _BOLD_RE.sub(r"\1", line)
+        t = _ITALIC_RE.sub(r"\1", t)
+        t = _CODE_RE.sub(r"\1", t).rstrip()
+        # Drop a bare 'Title' line if the model emitted it literally
+        if first and t.strip().lower() == "title":
+            return []
+        m = _PLAIN_HEADING_RE.match(t)
+        if m:
+            t = m.group(2).strip()
+        elif t.lstrip().startswith("* "):
+            t = "- " + t.lstrip()[2:].strip()
+        return [t.replace("#", "").replace("*", "").replace("_", " ")]
+
+    def close(self) -> List[str]:
+        return []
+
+
+class ResponseFormatter:
+    """Streaming answer formatter.
+
+    feed() accepts arbitrary text chunks (e.g. LLM tokens) and returns the formatted
+    text that has become final; close() flushes the rest. Concatenating all returned
+    pieces equals formatting the full text at once.
+
+    clean=True applies the clean_legal_response rules; plain=True additionally strips
+    Markdown for plain-text output (settings.enable_markdown_rendering off).
+    """
+
+    def __init__(self, clean: bool = True, plain: bool = False):
+        self._stages = ([_CleanStage()] if clean else []) + ([_PlainStage()] if plain else [])
+        self._joiner = _LineJoiner()
+        self._partial = ""
+
+    def _run(self, lines: List[str], closing: bool = False) -> str:
+        for stage in self._stages:
+            nxt: List[str] = []
+            for line in lines:
+                nxt.extend(stage.push(line))
+            if closing:
+                nxt.extend(stage.close())
+            lines = nxt
+        return "".join(self._joiner.push(line) for line in lines)
+
+    def feed(self, chunk: str) -> str:
+        if not chunk:
+            return ""
+        self._partial += chunk
+        if "\n" not in self._partial:
+            return ""
+        *lines, self._partial = self._partial.split("\n")
+        return self._run([line.rstrip("\r") for line in lines])
+
+    def close(self) -> str:
+        lines = [self._partial.rstrip("\r")] if self._partial else []
+        self._partial = ""
+        return self._run(lines, closing=True)
+
+    @classmethod
+    def format(cls, text: str, clean: bool = True, plain: bool = False) -> str:
+        fmt = cls(clean=clean, plain=plain)
+        return fmt.feed(text or "") + fmt.close()
@@ -0,0 +1,168 @@
+"""Coalescing of identical in-flight computations.
+
+Concurrent callers with the same key share one execution: the first caller starts
+it, later callers attach to it and receive the same result (or exception). Streams
+are broadcast: the producer runs on its own thread and every subscriber, including
+late joiners, gets the full sequence of pieces. A flight is forgotten as soon as it
+finishes, so this only flattens bursts; caching finished results is the answer
+cache's job.
+"""
+from __future__ import annotations
+
+import asyncio
+import re
+import threading
+import unicodedata
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+def flight_key(text: str) -> str:
+    """Normalized query used to match identical questions."""
+    t = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", t).strip().casefold()
+
+
+class _Broadcast:
+    """Append-only piece log that any number of subscribers can replay and follow."""
+
+    def __init__(self):
+        self._pieces: List[str] = []
+        self._done = False
+        self._error: Optional[BaseException] = None
+        self._cond = threading.Condition()
+
+    def publish(self, piece: str):
+        with self._cond:
+            self._pieces.append(piece)
+            self._cond.notify_all()
+
+    def finish(self, error: Optional[BaseException] = None):
+        with self._cond:
+            self._done = True
+            self._error = error
+            self._cond.notify_all()
+
+    def subscribe(self) -> Iterator[str]:
+        i = 0
+        while True:
+            with self._cond:
+                while i >= len(self._pieces) and not self._done:
+                    self._cond.wait()
+                chunk = self._pieces[i:]
+                i = len(self._pieces)
+                done, error = self._done, self._error
+            for piece in chunk:
+                yield piece
+            if done and not chunk:
+                if error is not None:
+                    raise error
+                return
+
+
+class SingleFlight:
+    """Thread-based single-flight for blocking calls and streams."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+        self._streams: Dict[str, _Broadcast] = {}
+        self.leaders = 0
+        self.joined = 0
+
+    def call(self, key: str, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            fut = self._calls.get(key)
+            leader = fut is None
+            if leader:
+                fut = self._calls[key] = Future()
+                self.leaders += 1
+            else:
+                self.joined += 1
+        if not leader:
+            return fut.result()
+        try:
+            fut.set_result(fn())
+        except BaseException as e:
+            fut.set_exception(e)
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+        return fut.result()
+
+    def stream(self, key: str, fn: Callable[[], Iterable[str]]) -> Iterator[str]:
+        """Subscribe to the stream for key, starting fn() on a producer thread if none is running.
+
+        The producer runs to completion even if every subscriber disconnects, so the
+        work (and its answer-cache entry) is not wasted.
+        """
+        with self._lock:
+            bc = self._streams.get(key)
+            if bc is None:
+                bc = self._streams[key] = _Broadcast()
+                self.leaders += 1
+                threading.Thread(target=self._produce, args=(key, bc, fn), name="single-flight", daemon=True).start()
+            else:
+                self.joined += 1
+        return bc.subscribe()
+
+    def _produce(self, key: str, bc: _Broadcast, fn: Callable[[], Iterable[str]]):
+        error: Optional[BaseException] = None
+        try:
+            for piece in fn():
+                bc.publish(piece)
+        except BaseException as e:
+            error = e
+        finally:
+            with self._lock:
+                if self._streams.get(key) is bc:
+                    del self._streams[key]
+            bc.finish(error)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                "in_flight_calls": len(self._calls),
+                "in_flight_streams": len(self._streams),
+                "leaders": self.leaders,
+                "joined": self.joined,
+            }
+
+
+class AsyncSingleFlight:
+    """asyncio single-flight: one shared task per key and event loop."""
+
+    def __init__(self):
+        self._tasks: Dict[Tuple[int, str], asyncio.Task] = {}
+        self.leaders = 0
+        self.joined = 0
+
+    async def call(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        k = (id(asyncio.get_running_loop()), key)
+        task = self._tasks.get(k)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._tasks[k] = task
+            self.leaders += 1
+            task.add_done_callback(lambda t, k=k: self._forget(k, t))
+        else:
+            self.joined += 1
+        # A caller that goes away must not cancel the computation the others wait for
+        return await asyncio.shield(task)
+
+    def _forget(self, k: Tuple[int, str], task: asyncio.Task):
+        if self._tasks.get(k) is task:
+            del self._tasks[k]
+        if not task.cancelled():
+            task.exception()  # retrieved even if every waiter went away
+
+    def stats(self) -> Dict:
+        return {"in_flight": len(self._tasks), "leaders": self.leaders, "joined": self.joined}
+
+
+chat_flights = SingleFlight()
+async_chat_flights = AsyncSingleFlight()
+
+
+def single_flight_stats() -> Dict:
+    return {"sync": chat_flights.stats(), "async": async_chat_flights.stats()}
@@ -0,0 +1,131 @@
+"""Token counting and budgeted context packing for LLM prompts.
+
+Counts use a local tokenizer for the provider (tiktoken: the model's own encoding
+for OpenAI, o200k_base as the closest local proxy for Gemini) and fall back to a
+characters-per-token estimate when tiktoken or its encoding files are unavailable.
+"""
+from __future__ import annotations
+
+import re
+from functools import lru_cache
+from typing import Dict, List, Optional
+
+from app.core.config import settings
+
+_CHARS_PER_TOKEN = 4.0
+# Chat formatting overhead per message and per reply (OpenAI's published accounting)
+_MESSAGE_OVERHEAD = 4
+_REPLY_OVERHEAD = 3
+# Tokens of the "[doc_id:chunk_id] " prefix and separators each packed chunk adds
+_CHUNK_OVERHEAD = 12
+# Do not bother adding a truncated chunk shorter than this
+_MIN_CHUNK_TOKENS = 48
+
+_SENTENCE_END_RE = re.compile(r"[.;:?!](?=\s)")
+
+
+@lru_cache(maxsize=8)
+def _encoding(provider: str, model: str):
+    try:
+        import tiktoken  # optional; estimates are used without it
+    except ImportError:
+        return None
+    try:
+        if provider == "openai":
+            try:
+                return tiktoken.encoding_for_model(model)
+            except KeyError:
+                pass
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        # Encoding files are fetched on first use; offline hosts estimate instead
+        return None
+
+
+def _tokenizer(provider: Optional[str]):
+    provider = (provider or settings.llm_provider or "").lower().strip()
+    model = settings.openai_model if provider == "openai" and "gemini" in (settings.llm_model or "").lower() else settings.llm_model
+    return _encoding(provider, model or "")
+
+
+def estimate_tokens(text: str) -> int:
+    return int(len(text or "") / _CHARS_PER_TOKEN) + 1 if text else 0
+
+
+def count_tokens(text: str, provider: Optional[str] = None) -> int:
+    if not text:
+        return 0
+    enc = _tokenizer(provider)
+    if enc is None:
+        return estimate_tokens(text)
+    return len(enc.encode(text, disallowed_special=()))
+
+
+def count_message_tokens(messages: List[Dict[str, str]], provider: Optional[str] = None) -> int:
+    return sum(count_tokens(m.get("content") or "", provider) + _MESSAGE_OVERHEAD for m in messages or []) + _REPLY_OVERHEAD
+
+
+def truncate_to_tokens(text: str, max_tokens: int, provider: Optional[str] = None) -> str:
+    """Cut text to at most max_tokens, backing off to a sentence end when one is close."""
+    if max_tokens <= 0 or not text:
+        return ""
+    enc = _tokenizer(provider)
+    if enc is None:
+        if estimate_tokens(text) <= max_tokens:
+            return text
+        cut = text[: int((max_tokens - 1) * _CHARS_PER_TOKEN)]
+    else:
+        ids = enc.encode(text, disallowed_special=())
+        if len(ids) <= max_tokens:
+            return text
+        cut = enc.decode(ids[:max_tokens])
+    ends = [m.end() for m in _SENTENCE_END_RE.finditer(cut)]
+    if ends and ends[-1] >= 0.7 * len(cut):
+        return cut[: ends[-1]]
+    return cut.rsplit(" ", 1)[0] if " " in cut else cut
+
+
+def pack_contexts(
+    contexts: List[Dict],
+    budget_tokens: int,
+    max_chunk_tokens: Optional[int] = None,
+    provider: Optional[str] = None,
+) -> List[Dict]:
+    """Leading contexts that fit budget_tokens, each capped at max_chunk_tokens.
+
+    Contexts are expected best-first (retrieve_context's reranked order). Returns
+    copies; the first chunk that does not fit whole is truncated when enough budget is
+    left for it to be useful, and packing stops there.
+    """
+    cap = max_chunk_tokens or settings.llm_context_chunk_max_tokens
+    left = budget_tokens
+    packed: List[Dict] = []
+    for c in contexts or []:
+        text = (c.get("text") or "").strip()
+        if not text:
+            continue
+        room = min(cap, left - _CHUNK_OVERHEAD)
+        if room < _MIN_CHUNK_TOKENS:
+            break
+        n = count_tokens(text, provider)
+        out_of_budget = n > room and room < cap
+        if n > room:
+            text = truncate_to_tokens(text, room, provider)
+            n = count_tokens(text, provider)
+        packed.append({**c, "text": text})
+        left -= n + _CHUNK_OVERHEAD
+        if out_of_budget:
+            break
+    return packed
+
+
+def output_token_cap(intent: str) -> int:
+    """Max output tokens for an intent (settings.llm_output_token_caps), bounded by llm_max_output_tokens."""
+    caps = settings.llm_output_token_caps or {}
+    cap = caps.get(intent, caps.get("default", settings.llm_max_output_tokens))
+    return max(1, min(int(cap), settings.llm_max_output_tokens))
+
+
+def new_usage() -> Dict[str, int]:
+    """Per-request accumulator filled by LLMClient calls made with usage=..."""
+    return {"calls": 0, "cached_calls": 0, "prompt_tokens": 0, "completion_tokens": 0}
@@ -1,30 +1,181 @@
 from __future__ import annotations
-from typing import List, Dict, Optional
-from qdrant_client import QdrantClient
+import asyncio
+import threading
+from typing import Iterable, List, Dict, Optional, Tuple, Union
+import numpy as np
+from qdrant_client import AsyncQdrantClient, QdrantClient
 from qdrant_client.http import models as qmodels
 from app.core.config import settings
 
 
+# Vectors may be NumPy arrays end to end; they are only turned into lists where a
+# client API requires it (batch search request models)
+Vector = Union[List[float], np.ndarray]
+Vectors = Union[List[List[float]], np.ndarray]
+
+# Payload fields that retrieval filters on; indexed so filtered search stays cheap
+_PAYLOAD_INDEXES = {
+    "doc_id": qmodels.PayloadSchemaType.KEYWORD,
+    "approved": qmodels.PayloadSchemaType.BOOL,
+}
+
+
+# Process-wide client registry: one client (and connection pool) per URL/transport
+_clients: Dict[Tuple[str, bool], QdrantClient] = {}
+_async_clients: Dict[Tuple[str, bool], AsyncQdrantClient] = {}
+# (url, collection) -> vector size of collections known to exist
+_collection_dims: Dict[Tuple[str, str], int] = {}
+_registry_lock = threading.Lock()
+
+
+def get_qdrant_client(url: Optional[str] = None, prefer_grpc: Optional[bool] = None) -> QdrantClient:
+    url = url or settings.qdrant_url
+    grpc = settings.qdrant_prefer_grpc if prefer_grpc is None else prefer_grpc
+    key = (url, grpc)
+    client = _clients.get(key)
+    if client is None:
+        with _registry_lock:
+            client = _clients.get(key)
+            if client is None:
+                if grpc:
+                    client = QdrantClient(url=url, prefer_grpc=True, grpc_port=settings.qdrant_grpc_port)
+                else:
+                    client = QdrantClient(url=url)
+                _clients[key] = client
+    return client
+
+
+def get_async_qdrant_client(url: Optional[str] = None, prefer_grpc: Optional[bool] = None) -> AsyncQdrantClient:
+    url = url or settings.qdrant_url
+    grpc = settings.qdrant_prefer_grpc if prefer_grpc is None else prefer_grpc
+    key = (url, grpc)
+    client = _async_clients.get(key)
+    if client is None:
+        with _registry_lock:
+            client = _async_clients.get(key)
+            if client is None:
+                if grpc:
+                    client = AsyncQdrantClient(url=url, prefer_grpc=True, grpc_port=settings.qdrant_grpc_port)
+                else:
+                    client = AsyncQdrantClient(url=url)
+                _async_clients[key] = client
+    return client
+
+
+def forget_collection(collection: str, url: Optional[str] = None):
+    """Drop cached collection metadata (after external recreate/delete)."""
+    with _registry_lock:
+        _collection_dims.pop((url or settings.qdrant_url, collection), None)
+
+
+def _vector_size(info) -> Optional[int]:
+    vectors = info.config.params.vectors
+    if isinstance(vectors, dict):  # named vectors
+        vectors = next(iter(vectors.values()), None)
+    return getattr(vectors, "size", None)
+
+
+def _is_status(exc: Exception, http_status: int, grpc_code: str, local_text: str) -> bool:
+    """Whether a client error is this specific server answer (REST, gRPC or local mode)."""
+    if getattr(exc, "status_code", None) == http_status:  # UnexpectedResponse
+        return True
+    code = getattr(exc, "code", None)
+    if callable(code):  # grpc.RpcError
+        try:
+            return getattr(code(), "name", None) == grpc_code
+        except Exception:
+            return False
+    return isinstance(exc, ValueError) and local_text in str(exc).lower()
+
+
 class QdrantStore:
     def __init__(self, collection: Optional[str] = None):
-        self.client = QdrantClient(url=settings.qdrant_url)
+        self.url = settings.qdrant_url
+        self.client = get_qdrant_client(self.url)
         self.collection = collection or settings.qdrant_corpus_collection
 
+    @staticmethod
+    def approved_filter() -> qmodels.Filter:
+        """Filter restricting search to points of admin-approved documents."""
+        return qmodels.Filter(must=[qmodels.FieldCondition(key="approved", match=qmodels.MatchValue(value=True))])
+
+    def ensure_payload_indexes(self):
+        for field_name, schema in _PAYLOAD_INDEXES.items():
+            try:
+                self.client.create_payload_index(
+                    collection_name=self.collection,
+                    field_name=field_name,
+                    field_schema=schema,
+                )
+            except Exception:
+                # Already exists (or server refused); filtering still works without an index
+                pass
+
     def ensure_collection(self, vector_size: int, distance: qmodels.Distance = qmodels.Distance.COSINE):
-        exists = False
+        """Create the collection if missing; cached per process so hot paths skip the round trip.
+
+        Only a definite "not found" answer creates it; any other error is raised, so an
+        unreachable or failing server never looks like an empty corpus. Raises ValueError
+        when an existing collection has a different vector size.
+        """
+        key = (self.url, self.collection)
+        dim = _collection_dims.get(key)
+        if dim is None:
+            try:
+                dim = _vector_size(self.client.get_collection(self.collection))
+            except Exception as e:
+                if not _is_status(e, 404, "NOT_FOUND", "not found"):
+                    raise
+                dim = self._create_collection(vector_size, distance)
+            if dim is None:
+                # Worded so admin's dimension-mismatch recovery (which recreates the collection) ignores it
+                raise RuntimeError(f"Cannot read the size of collection '{self.collection}'; leaving it untouched")
+            with _registry_lock:
+                _collection_dims[key] = dim
+        if dim != vector_size:
+            raise ValueError(
+                f"Vector dimension mismatch for collection '{self.collection}': expected {dim}, got {vector_size}"
+            )
+
+    def _create_collection(self, vector_size: int, distance: qmodels.Distance) -> Optional[int]:
+        """Create a missing collection; returns its vector size (another worker's if it won the race)."""
         try:
-            info = self.client.get_collection(self.collection)
-            exists = True
-            # If exists but vector size differs, we should recreate (skip here for simplicity)
-        except Exception:
-            exists = False
-        if not exists:
-            self.client.recreate_collection(
+            self.client.create_collection(
                 collection_name=self.collection,
                 vectors_config=qmodels.VectorParams(size=vector_size, distance=distance),
             )
+        except Exception as e:
+            if not _is_status(e, 409, "ALREADY_EXISTS", "already exists"):
+                raise
+            return _vector_size(self.client.get_collection(self.collection))
+        self.ensure_payload_indexes()
+        return vector_size
 
-    def upsert_points(self, ids: List[str], vectors: List[List[float]], payloads: List[Dict]):
+    def recreate_collection(self, vector_size: int, distance: qmodels.Distance = qmodels.Distance.COSINE):
+        self.client.recreate_collection(
+            collection_name=self.collection,
+            vectors_config=qmodels.VectorParams(size=vector_size, distance=distance),
+        )
+        self.ensure_payload_indexes()
+        with _registry_lock:
+            _collection_dims[(self.url, self.collection)] = vector_size
+
+    def delete_collection(self):
+        forget_collection(self.collection, self.url)
+        self.client.delete_collection(collection_name=self.collection)
+
+    def upsert_points(self, ids: List[str], vectors: Vectors, payloads: List[Dict]):
+        if isinstance(vectors, np.ndarray):
+            # upload_collection serializes NumPy rows directly (no Python float lists)
+            self.client.upload_collection(
+                collection_name=self.collection,
+                vectors=vectors,
+                payload=payloads,
+                ids=ids,
+                batch_size=max(1, len(ids)),
+                wait=True,
+            )
+            return
         self.client.upsert(
             collection_name=self.collection,
             points=qmodels.Batch(
@@ -34,7 +185,19 @@ class QdrantStore:
             ),
         )
 
-    def search(self, vector: List[float], top_k: int = 6, filter_: Optional[qmodels.Filter] = None) -> List[Dict]:
+    @staticmethod
+    def _to_match(p) -> Dict:
+        payload = p.payload or {}
+        return {
+            "id": str(p.id),
+            "doc_id": payload.get("doc_id"),
+            "chunk_id": payload.get("chunk_id"),
+            "text": payload.get("text"),
+            "score": getattr(p, "score", None),
+            "meta": payload,
+        }
+
+    def search(self, vector: Vector, top_k: int = 6, filter_: Optional[qmodels.Filter] = None) -> List[Dict]:
         res = self.client.search(
             collection_name=self.collection,
             query_vector=vector,
@@ -42,20 +205,69 @@ class QdrantStore:
             query_filter=filter_,
             with_payload=True,
         )
+        return [self._to_match(p) for p in res]
+
+    def search_batch(
+        self,
+        vectors: Vectors,
+        top_ks: List[int],
+        filter_: Optional[qmodels.Filter] = None,
+    ) -> List[List[Dict]]:
+        """Run several searches in a single round trip; results are returned in request order."""
+        if len(vectors) == 0:
+            return []
+        requests = [
+            # Request models validate plain lists; convert NumPy rows only here
+            qmodels.SearchRequest(vector=vec.tolist() if isinstance(vec, np.ndarray) else vec, limit=k, filter=filter_, with_payload=True)
+            for vec, k in zip(vectors, top_ks)
+        ]
+        res = self.client.search_batch(collection_name=self.collection, requests=requests)
+        return [[self._to_match(p) for p in batch] for batch in res]
+
+    def retrieve(self, ids: List[str], with_vectors: bool = False) -> List[Dict]:
+        """Fetch points by id; matches carry a 'vector' key when with_vectors is set."""
+        if not ids:
+            return []
+        res = self.client.retrieve(
+            collection_name=self.collection,
+            ids=ids,
+            with_payload=True,
+            with_vectors=with_vectors,
+        )
         out: List[Dict] = []
         for p in res:
-            payload = p.payload or {}
-            out.append(
-                {
-                    "doc_id": payload.get("doc_id"),
-                    "chunk_id": payload.get("chunk_id"),
-                    "text": payload.get("text"),
-                    "score": p.score,
-                    "meta": payload,
-                }
-            )
+            m = self._to_match(p)
+            if with_vectors:
+                m["vector"] = p.vector
+            out.append(m)
         return out
 
+    def scroll_payloads(self, batch_size: int = 256) -> Iterable[Tuple[str, Dict]]:
+        """Yield (point_id, payload) for every point in the collection."""
+        offset = None
+        while True:
+            points, offset = self.client.scroll(
+                collection_name=self.collection,
+                limit=batch_size,
+                offset=offset,
+                with_payload=True,
+                with_vectors=False,
+            )
+            for p in points:
+                yield str(p.id), (p.payload or {})
+            if offset is None:
+                break
+
+    def set_doc_approved(self, doc_id: str, approved: bool):
+        """Bulk-update the approval flag on every point of a document."""
+        cond = qmodels.Filter(must=[qmodels.FieldCondition(key="doc_id", match=qmodels.MatchValue(value=doc_id))])
+        self.client.set_payload(
+            collection_name=self.collection,
+            payload={"approved": approved},
+            points=qmodels.FilterSelector(filter=cond),
+            wait=True,
+        )
+
     def delete_by_doc_id(self, doc_id: str) -> int:
         """Delete all points in this collection that match the given doc_id. Returns number of points scheduled for deletion (best-effort)."""
         cond = qmodels.Filter(must=[qmodels.FieldCondition(key="doc_id", match=qmodels.MatchValue(value=doc_id))])
@@ -66,3 +278,55 @@ class QdrantStore:
         )
         # Qdrant returns operation result; count may not be provided, so return 0/1 semantics
         return getattr(res, "status", None) is not None and 1 or 0
+
+
+class AsyncQdrantStore:
+    """Async counterpart of QdrantStore for the asyncio chat pipeline (read paths only).
+
+    Shares the collection-metadata cache with QdrantStore.
+    """
+
+    def __init__(self, collection: Optional[str] = None):
+        self.url = settings.qdrant_url
+        self.client = get_async_qdrant_client(self.url)
+        self.collection = collection or settings.qdrant_corpus_collection
+
+    async def ensure_collection(self, vector_size: int, distance: qmodels.Distance = qmodels.Distance.COSINE):
+        """QdrantStore.ensure_collection; run in a thread unless the dimension is already cached."""
+        store = QdrantStore(self.collection)
+        if (self.url, self.collection) in _collection_dims:
+            store.ensure_collection(vector_size, distance)
+        else:
+            await asyncio.to_thread(store.ensure_collection, vector_size, distance)
+
+    async def search_batch(
+        self,
+        vectors: Vectors,
+        top_ks: List[int],
+        filter_: Optional[qmodels.Filter] = None,
+    ) -> List[List[Dict]]:
+        if len(vectors) == 0:
+            return []
+        requests = [
+            qmodels.SearchRequest(vector=vec.tolist() if isinstance(vec, np.ndarray) else vec, limit=k, filter=filter_, with_payload=True)
+            for vec, k in zip(vectors, top_ks)
+        ]
+        res = await self.client.search_batch(collection_name=self.collection, requests=requests)
+        return [[QdrantStore._to_match(p) for p in batch] for batch in res]
+
+    async def retrieve(self, ids: List[str], with_vectors: bool = False) -> List[Dict]:
+        if not ids:
+            return []
+        res = await self.client.retrieve(
+            collection_name=self.collection,
+            ids=ids,
+            with_payload=True,
+            with_vectors=with_vectors,
+        )
+        out: List[Dict] = []
+        for p in res:
+            m = QdrantStore._to_match(p)
+            if with_vectors:
+                m["vector"] = p.vector
+            out.append(m)
+        return out